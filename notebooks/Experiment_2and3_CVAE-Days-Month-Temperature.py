@@ -106,13 +106,13 @@ dict_xconso = {'train': x_conso}
 
 # Normalize input variables
 type_scaler = 's'
-dict_xconso, _ = normalize_xconso(dict_xconso, type_scaler = 'standard')
+dict_xconso, scaler = normalize_xconso(dict_xconso, type_scaler = 'standard')
 
 # Give the features on which to condition
 
 type_x = ['conso']
 type_cond = ['day','month','temperature']
-dataset = get_dataset_autoencoder(dict_xconso=dict_xconso, type_x=type_x, type_cond=type_cond)
+dataset = get_dataset_autoencoder(dict_xconso=dict_xconso, type_x=type_x, type_cond=type_cond, scaler=scaler)
 
 # +
 
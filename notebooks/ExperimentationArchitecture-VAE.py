@@ -106,9 +106,9 @@ dict_xconso = {'train': x_conso}
 
 # Normalize input variables
 type_scaler = 's'
-dict_xconso, _ = normalize_xconso(dict_xconso, type_scaler = 'standard')
+dict_xconso, scaler = normalize_xconso(dict_xconso, type_scaler = 'standard')
 
-dataset = get_dataset_autoencoder(dict_xconso=dict_xconso)
+dataset = get_dataset_autoencoder(dict_xconso=dict_xconso, scaler=scaler)
 
 # +
 #A VAE is a CVAE with a null feature as a condition  
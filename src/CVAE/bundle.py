@@ -0,0 +1,232 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from CVAE.export import describe_keras_model, describe_graph, graph_from_description, DenseGraph, InferenceModel
+
+#version du format du bundle, a incrementer a chaque changement incompatible
+BUNDLE_VERSION = 1
+
+MANIFEST_NAME = 'manifest.json'
+WEIGHTS_NAME = 'weights.bin'
+
+#alignement des tableaux dans le fichier de poids pour pouvoir les lire en memory-map
+ALIGNMENT = 64
+
+#attributs des scalers sklearn sauvegardes dans le bundle
+SCALER_ATTRIBUTES = ['mean_', 'var_', 'scale_', 'min_', 'data_min_', 'data_max_', 'data_range_', 'n_samples_seen_']
+
+#sous-modeles du bundle, dans l'ordre de construction
+SUBMODELS = ['encoder', 'decoder', 'embedding_enc', 'embedding_dec']
+
+
+def is_bundle(folder):
+    return os.path.isfile(os.path.join(folder, MANIFEST_NAME))
+
+
+def _scaler_to_dict(scaler):
+    if scaler is None:
+        return None
+    params = {}
+    for attribute in SCALER_ATTRIBUTES:
+        if hasattr(scaler, attribute):
+            params[attribute] = np.asarray(getattr(scaler, attribute)).tolist()
+    columns = None
+    if hasattr(scaler, 'feature_names_in_'):
+        columns = [str(c) for c in scaler.feature_names_in_]
+    return {'type': type(scaler).__name__, 'params': params, 'columns': columns,
+            'init': {k: v for k, v in scaler.get_params().items() if isinstance(v, (bool, int, float, str, tuple, list))}}
+
+
+def _submodels(model):
+    if isinstance(model, InferenceModel):
+        return model.graphs()
+    submodels = {'encoder': model.encoder, 'decoder': model.decoder}
+    if getattr(model, 'embedding_enc', None) is not None:
+        submodels['embedding_enc'] = model.embedding_enc
+        if model.embedding_dec is not model.embedding_enc:
+            submodels['embedding_dec'] = model.embedding_dec
+    return submodels
+
+
+def save_bundle(model, folder, scaler=None, condition_encoders=None, metadata=None):
+    """
+    Save a CAE, CVAE or CVAE_emb model as a single bundle: the architecture config, one table of
+    deduplicated weights, the scaler statistics and the condition encoders.
+    The cvae model is not stored on its own as its weights are the ones of its sub-models.
+
+    :param model: trained model, or InferenceModel (then the bundle can not be loaded back in keras)
+    :param folder: output folder
+    :param scaler: fitted StandardScaler or MinMaxScaler from normalize_xconso
+    :param condition_encoders: dict describing how the conditions are encoded, see get_condition_encoders
+    :param metadata: additional json serializable information
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    weights_table = {}
+    graphs = {}
+    offset = 0
+    with open(os.path.join(folder, WEIGHTS_NAME), 'wb') as weights_file:
+        for name, submodel in _submodels(model).items():
+            description = describe_graph(submodel) if isinstance(submodel, DenseGraph) else describe_keras_model(submodel)
+            for layer in description['layers']:
+                keys = []
+                for w in layer['weights']:
+                    w = np.ascontiguousarray(w, dtype=np.float32)
+                    key = hashlib.sha1(w.tobytes() + str(w.shape).encode()).hexdigest()
+                    #les poids partages entre sous-modeles ne sont ecrits qu'une fois
+                    if key not in weights_table:
+                        padding = (-offset) % ALIGNMENT
+                        weights_file.write(b'\0' * padding)
+                        offset += padding
+                        weights_table[key] = {'offset': offset, 'shape': list(w.shape), 'dtype': 'float32'}
+                        weights_file.write(w.tobytes())
+                        offset += w.nbytes
+                    keys.append(key)
+                layer['weights'] = keys
+            graphs[name] = description
+
+    manifest = {'format_version': BUNDLE_VERSION,
+                'class_name': type(model).__name__,
+                'config': model.get_config(),
+                'graphs': graphs,
+                'weights': weights_table,
+                'scaler': _scaler_to_dict(scaler),
+                'condition_encoders': condition_encoders,
+                'metadata': metadata}
+    with open(os.path.join(folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+
+
+class ModelBundle():
+    """
+    Model saved with save_bundle. The weights are memory-mapped and each sub-model is only built
+    when it is requested, so that many models can be opened cheaply to be compared.
+    """
+    def __init__(self, folder, mmap=True):
+        self.folder = folder
+        with open(os.path.join(folder, MANIFEST_NAME), 'r') as f:
+            self.manifest = json.load(f)
+
+        if self.manifest['format_version'] > BUNDLE_VERSION:
+            raise ValueError('Bundle format {} is more recent than the supported format {}'.format(
+                self.manifest['format_version'], BUNDLE_VERSION))
+
+        weights_path = os.path.join(folder, WEIGHTS_NAME)
+        if mmap:
+            self._buffer = np.memmap(weights_path, dtype=np.uint8, mode='r') if os.path.getsize(weights_path) else np.zeros(0, np.uint8)
+        else:
+            self._buffer = np.fromfile(weights_path, dtype=np.uint8)
+        self._graphs = {}
+
+    @property
+    def class_name(self):
+        return self.manifest['class_name']
+
+    @property
+    def config(self):
+        return self.manifest['config']
+
+    @property
+    def condition_encoders(self):
+        return self.manifest['condition_encoders']
+
+    def submodel_names(self):
+        return [name for name in SUBMODELS if name in self.manifest['graphs']]
+
+    def weight(self, key):
+        entry = self.manifest['weights'][key]
+        dtype = np.dtype(entry['dtype'])
+        size = int(np.prod(entry['shape'])) * dtype.itemsize
+        return self._buffer[entry['offset']:entry['offset'] + size].view(dtype).reshape(entry['shape'])
+
+    def description(self, name):
+        """
+        :return: description of the sub-model with its raw weights, see describe_keras_model
+        """
+        description = self.manifest['graphs'][name]
+        layers = [dict(layer, weights=[self.weight(key) for key in layer['weights']]) for layer in description['layers']]
+        return dict(description, layers=layers)
+
+    def graph(self, name):
+        """
+        :param name: 'encoder', 'decoder', 'embedding_enc' or 'embedding_dec'
+        :return: DenseGraph of the sub-model, built at the first request
+        """
+        if name not in self._graphs:
+            self._graphs[name] = graph_from_description(self.description(name))
+        return self._graphs[name]
+
+    def inference_model(self, decoder=True, **kwargs):
+        """
+        :param decoder: if False only the encoder and the condition embedding are built, e.g. for scoring
+        :return: InferenceModel
+        """
+        names = self.submodel_names()
+        embedding_enc = self.graph('embedding_enc') if 'embedding_enc' in names else None
+        embedding_dec = None
+        if decoder and 'embedding_dec' in names:
+            embedding_dec = self.graph('embedding_dec')
+        return InferenceModel(self.graph('encoder'), self.graph('decoder') if decoder else None,
+                              embedding_enc=embedding_enc, embedding_dec=embedding_dec,
+                              cond_pre_dim=self.config.get('cond_pre_dim', 0), **kwargs)
+
+    def scaler(self):
+        """
+        :return: sklearn scaler rebuilt from the saved statistics, or None
+        """
+        description = self.manifest['scaler']
+        if description is None:
+            return None
+        from sklearn import preprocessing
+
+        scaler = getattr(preprocessing, description['type'])(**description['init'])
+        for attribute, value in description['params'].items():
+            setattr(scaler, attribute, np.asarray(value))
+        if description['columns'] is not None:
+            scaler.feature_names_in_ = np.asarray(description['columns'], dtype=object)
+        return scaler
+
+    def set_keras_weights(self, model):
+        """
+        Load the weights of the bundle in an existing keras model with the same architecture.
+        """
+        submodels = _submodels(model)
+        for name in self.submodel_names():
+            description = self.description(name)
+            layers = [l for l in submodels[name].layers if l.weights]
+            weights = [layer['weights'] for layer in description['layers'] if layer['weights']]
+            if len(layers) != len(weights):
+                raise ValueError('Architecture of {} does not match the bundle'.format(name))
+            for layer, w in zip(layers, weights):
+                layer.set_weights([np.array(x) for x in w])
+
+    def keras_model(self, **kwargs):
+        """
+        Rebuild the full keras model and load its weights.
+        """
+        if self.class_name == 'InferenceModel':
+            raise ValueError('The bundle was saved from an InferenceModel, use inference_model()')
+        from keras import backend as K
+        import CVAE.cvae_model
+
+        config = dict(self.config, verbose=False)
+        config.update(kwargs)
+        if 'beta' in config:
+            config['beta'] = K.variable(config['beta'], dtype='float32')
+        model = getattr(CVAE.cvae_model, self.class_name)(**config)
+        self.set_keras_weights(model)
+        model.scaler = self.scaler()
+        model.condition_encoders = self.condition_encoders
+        return model
+
+
+def load_bundle(folder, mmap=True):
+    """
+    :param folder: folder written by save_bundle
+    :param mmap: memory-map the weights instead of reading them
+    :return: ModelBundle
+    """
+    return ModelBundle(folder, mmap=mmap)
@@ -1,23 +1,23 @@
 
 #nbsample=20
-import tensorflow as tf
+#tensorflow et le module de scoring ne sont importes que dans les methodes qui en ont besoin
 from keras.callbacks import Callback
-from tensorflow.contrib.tensorboard.plugins import projector
 from keras import backend as K
 from keras.models import Model
 from keras.callbacks import TensorBoard
 import numpy as np
-from FeaturesScore.scoring import *
 
 
 class NEpochLogger(Callback):
-    def __init__(self,x_train_data, display,x_conso=None,calendar_info=None,is_VAE=True):
+    def __init__(self,x_train_data, display,x_conso=None,calendar_info=None,is_VAE=True,cv=10):
         self.seen = 0
         self.display = display
         self.x_train_data = x_train_data
         self.x_conso=x_conso
         self.calendar_info=calendar_info
         self.is_VAE=is_VAE
+        self.cv=cv
+        self.daily_aggregates=None
 
 
     def on_epoch_end(self, epoch, logs={}):
@@ -90,7 +90,12 @@ class NEpochLogger(Callback):
            
             #responses=self.model.encoder.predict(self.x_train_data)
             print(np.sum(np.abs(responses),axis=0))
-            predictFeaturesInLatentSPace(self.x_conso,self.calendar_info,responses,k=5)
+            from FeaturesScore.scoring import predictFeaturesInLatentSPace
+            from conso.load_shape_data import get_daily_aggregates
+            #les agregats journaliers ne dependent pas du modele, ils sont calcules une seule fois
+            if(self.daily_aggregates is None):
+                self.daily_aggregates=get_daily_aggregates(self.x_conso,columns=['temperature_France'])
+            predictFeaturesInLatentSPace(self.x_conso,self.calendar_info,responses,k=5,cv=self.cv,daily_aggregates=self.daily_aggregates)
             
             valLoss=logs.get('val_loss')
             
@@ -130,6 +135,9 @@ class TensorResponseBoard(TensorBoard):
         self.nPoints=nPoints
 
     def set_model(self, model):
+        import tensorflow as tf
+        from tensorflow.contrib.tensorboard.plugins import projector
+
         super().set_model(model)
         #super(TensorResponseBoard, self).set_model(model)
 
@@ -1,6 +1,5 @@
 import os
 import json
-from matplotlib import pyplot as plt
 import numpy as np
 
 from keras.models import Model
@@ -13,6 +12,9 @@ from functools import partial, update_wrapper
 
 
 class BaseModel():
+    #(argument du constructeur, attribut) sauvegardes dans la configuration du modele
+    config_attributes = []
+
     def __init__(self, **kwargs):
         """
 
@@ -31,19 +33,41 @@ class BaseModel():
         self.trainers = {}
         self.history = None
 
+        #statistiques de normalisation et encodage des conditions, sauvegardes avec le modele
+        self.scaler = None
+        self.condition_encoders = None
+
+    def get_config(self):
+        """
+        :return: dict of the constructor arguments needed to rebuild the model
+        """
+        config = {'name': self.name, 'output': self.output}
+        for key, attribute in self.config_attributes:
+            value = getattr(self, attribute)
+            if not isinstance(value, (int, float, bool, str, list, tuple, type(None))):
+                value = float(K.get_value(value))
+            config[key] = value
+        return config
+
     def save_model(self, out_dir):
-        folder = os.path.join(out_dir)
-        if not os.path.isdir(folder):
-            os.mkdir(folder)
+        """
+        Save the model as a single bundle: configuration, deduplicated weights, scaler and condition encoders.
+        """
+        from CVAE.bundle import save_bundle
 
-        for k, v in self.trainers.items():
-            filename = os.path.join(folder, '%s.hdf5' % (k))
-            v.save_weights(filename)
+        save_bundle(self, out_dir, scaler=self.scaler, condition_encoders=self.condition_encoders)
 
     def store_to_save(self, name):
         self.trainers[name] = getattr(self, name)
 
     def load_model(self, folder):
+        from CVAE.bundle import is_bundle, load_bundle
+
+        if is_bundle(folder):
+            load_bundle(folder).set_keras_weights(self)
+            return
+
+        #ancien format: un fichier hdf5 par trainer
         for k, v in self.trainers.items():
             filename = os.path.join(folder, '%s.hdf5' % (k))
             getattr(self, k).load_weights(filename)
@@ -67,6 +91,10 @@ class BaseModel():
         #else:
         #    validation_data = None
 
+        #normalisation et encodage des conditions du jeu d'entrainement, sauvegardes avec le modele
+        self.scaler = dataset['train'].get('scaler', self.scaler)
+        self.condition_encoders = dataset['train'].get('condition_encoders', self.condition_encoders)
+
         print('\n\n--- START TRAINING ---\n')
         history = self.train(dataset['train'],training_epochs, batch_size, callbacks, validation_data=validation_data, verbose=verbose,validation_split=validation_split)
 
@@ -78,6 +106,7 @@ class BaseModel():
             json.dump(self.history, f)
 
     def plot_loss(self, path_save = None):
+        from matplotlib import pyplot as plt
 
         nb_epoch = len(self.history['loss'])
 
@@ -107,6 +136,10 @@ class BaseModel():
 
     
 class CAE(BaseModel):
+    config_attributes = [('input_dim', 'input_dim'), ('cond_dim', 'cond_dim'), ('z_dim', 'z_dim'),
+                         ('e_dims', 'e_dims'), ('d_dims', 'd_dims'), ('embeddingBeforeLatent', 'embeddingBeforeLatent'),
+                         ('pDropout', 'dropout'), ('is_L2_Loss', 'is_L2_Loss')]
+
     def __init__(self, input_dim=96, cond_dim=12, z_dim=2, e_dims=[24], d_dims=[24],embeddingBeforeLatent=False,pDropout=0.0, verbose=True,is_L2_Loss=True,**kwargs):
         super().__init__(**kwargs)
         self.input_dim = input_dim
@@ -306,6 +339,10 @@ class CAE_emb(CAE):
     """
     Improvement of CVAE that encode the temperature as a condition
     """
+    config_attributes = [c for c in CAE.config_attributes if c[0] != 'cond_dim'] + [
+        ('to_emb_dim', 'to_emb_dim'), ('cond_pre_dim', 'cond_pre_dim'), ('emb_dims', 'emb_dims'),
+        ('emb_to_z_dim', 'emb_to_z_dim'), ('is_emb_Enc_equal_emb_Dec', 'is_emb_Enc_equal_emb_Dec')]
+
     def __init__(self, to_emb_dim=96, cond_pre_dim=12, emb_dims=[2], emb_to_z_dim=[3],is_emb_Enc_equal_emb_Dec=True, **kwargs):
 
         self.to_emb_dim = to_emb_dim
@@ -553,6 +590,8 @@ class CAE_emb(CAE):
 
 #un modèle CVAE ou l'on passe les conditions mais sans embedding
 class CVAE(BaseModel):
+    config_attributes = CAE.config_attributes + [('beta', 'beta'), ('has_skip', 'has_skip'), ('has_BN', 'has_BN')]
+
     def __init__(self, input_dim=96, cond_dim=12, z_dim=2, e_dims=[24], d_dims=[24], beta=1,embeddingBeforeLatent=False,pDropout=0.0, verbose=True,is_L2_Loss=True,has_skip=True,has_BN=1,**kwargs):
         super().__init__(**kwargs)
         self.input_dim = input_dim
@@ -788,6 +827,10 @@ class CVAE_emb(CVAE):
     """
     Improvement of CVAE that encode the temperature as a condition
     """
+    config_attributes = [c for c in CVAE.config_attributes if c[0] != 'cond_dim'] + [
+        ('to_emb_dim', 'to_emb_dim'), ('cond_pre_dim', 'cond_pre_dim'), ('emb_dims', 'emb_dims'),
+        ('emb_to_z_dim', 'emb_to_z_dim'), ('is_emb_Enc_equal_emb_Dec', 'is_emb_Enc_equal_emb_Dec')]
+
     def __init__(self, to_emb_dim=96, cond_pre_dim=12, emb_dims=[2], emb_to_z_dim=[3],is_emb_Enc_equal_emb_Dec=True, **kwargs):
 
         self.to_emb_dim = to_emb_dim
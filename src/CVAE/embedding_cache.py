@@ -0,0 +1,201 @@
+from collections import OrderedDict
+import numpy as np
+
+from CVAE.export import ACTIVATIONS
+
+#nombre maximal de combinaisons de conditions discretes precalculees
+MAX_COMBINATIONS = 1000000
+
+
+def detect_discrete_inputs(inputs):
+    """
+    :param inputs: list of condition arrays given to an embedding network
+    :return: indices of the one-hot inputs (values in {0, 1} and exactly one 1 per row)
+    """
+    discrete = []
+    for j, x in enumerate(inputs):
+        x = np.asarray(x)
+        if x.ndim == 2 and x.shape[1] >= 1 and np.all((x == 0) | (x == 1)) and np.all(x.sum(axis=1) == 1):
+            discrete.append(j)
+    return discrete
+
+
+class ConditionEmbeddingCache():
+    """
+    Inference cache of an embedding network (DenseGraph) for discrete conditions.
+
+    The layers that only depend on one-hot inputs (day, month, ...) are precomputed once for every
+    combination of categories. When continuous inputs such as the temperature profile are present,
+    the network is split: a Dense layer applied on a concatenation of discrete and continuous branches
+    is decomposed into a precomputed table for the discrete part plus a product for the continuous part.
+    Optionally the continuous inputs can be quantized and the outputs kept in a bounded LRU cache.
+    """
+    def __init__(self, graph, discrete_inputs, quantization_step=None, maxsize=100000):
+        """
+
+        :param graph: DenseGraph of the embedding network
+        :param discrete_inputs: indices of the one-hot inputs of the graph
+        :param quantization_step: if given, continuous inputs are rounded to this step and the outputs are cached
+        :param maxsize: maximal number of entries of the LRU cache
+        """
+        if getattr(graph, 'dtype', None) is not None:
+            raise ValueError('The embedding cache is built from the float32 graph, not from a quantized one')
+        self.graph = graph
+        self.discrete_inputs = sorted(discrete_inputs)
+        self.discrete_names = [graph.input_names[j] for j in self.discrete_inputs]
+        self.continuous_inputs = [j for j in range(len(graph.input_names)) if j not in self.discrete_inputs]
+        self.quantization_step = quantization_step
+        self.maxsize = maxsize
+        self.lru = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self._build_dependencies()
+        self._build_tables()
+
+    def _build_dependencies(self):
+        deps = {name: {name} for name in self.graph.input_names}
+        consumers = {}
+        for layer in self.graph.layers:
+            if layer['class_name'] == 'InputLayer':
+                continue
+            deps[layer['name']] = set().union(*[deps[name] for name in layer['inbound']])
+            for name in layer['inbound']:
+                consumers.setdefault(name, []).append(layer['name'])
+        self.is_discrete = {name: d.issubset(self.discrete_names) for name, d in deps.items()}
+        self.consumers = consumers
+
+    def _build_tables(self):
+        layers = {layer['name']: layer for layer in self.graph.layers}
+        self.n_categories = []
+
+        #toutes les combinaisons de categories des entrees discretes
+        self.tables = {}
+        self.split_dense = {}
+        self.skipped = set()
+        if not self.discrete_names:
+            return
+
+        widths = [self._input_width(name) for name in self.discrete_names]
+        self.n_categories = widths
+        n_combinations = int(np.prod(widths))
+        if n_combinations > MAX_COMBINATIONS:
+            raise ValueError('{} combinations of discrete conditions, more than {}'.format(n_combinations, MAX_COMBINATIONS))
+        codes = np.unravel_index(np.arange(n_combinations), widths)
+        for name, width, code in zip(self.discrete_names, widths, codes):
+            self.tables[name] = np.eye(width, dtype=np.float32)[code]
+
+        for layer in self.graph.layers:
+            if layer['class_name'] == 'InputLayer' or not self.is_discrete[layer['name']]:
+                continue
+            self.tables[layer['name']] = self.graph._call(layer, [self.tables[name] for name in layer['inbound']])
+
+        #decoupage des couches Dense appliquees sur une concatenation de branches discretes et continues
+        for layer in self.graph.layers:
+            if layer['class_name'] != 'Dense' or self.is_discrete[layer['name']]:
+                continue
+            concat = layers.get(layer['inbound'][0])
+            if concat is None or concat['class_name'] != 'Concatenate' or concat['config'].get('axis', -1) not in [-1, 1]:
+                continue
+            if not any(self.is_discrete[name] for name in concat['inbound']):
+                continue
+            kernel = layer['weights'][0]
+            partial = np.zeros((n_combinations, kernel.shape[1]), dtype=np.float32)
+            continuous_parts = []
+            start = 0
+            for name in concat['inbound']:
+                width = self._width(name)
+                if self.is_discrete[name]:
+                    partial += np.dot(self.tables[name], kernel[start:start + width])
+                else:
+                    continuous_parts.append((name, kernel[start:start + width]))
+                start += width
+            if len(layer['weights']) == 2:
+                partial += layer['weights'][1]
+            self.split_dense[layer['name']] = (partial, continuous_parts)
+            if self.consumers.get(concat['name']) == [layer['name']] and concat['name'] not in self.graph.output_names:
+                self.skipped.add(concat['name'])
+
+    def _input_width(self, name):
+        for layer in self.graph.layers:
+            if name in layer['inbound'] and layer['class_name'] == 'Dense':
+                return layer['weights'][0].shape[0]
+        raise ValueError('Can not find the width of input {}'.format(name))
+
+    def _width(self, name):
+        return self.tables[name].shape[1] if name in self.tables else self._layer_width(name)
+
+    def _layer_width(self, name):
+        if name in self.graph.input_names:
+            return self._input_width(name)
+        layer = self.graph.get_layer(name)
+        if layer['class_name'] == 'Dense':
+            return layer['weights'][0].shape[1]
+        if layer['class_name'] == 'Concatenate':
+            return sum(self._width(n) for n in layer['inbound'])
+        return self._width(layer['inbound'][0])
+
+    def combination_codes(self, inputs):
+        """
+        :return: index of the combination of categories of each row
+        """
+        if not self.discrete_names:
+            return np.zeros(inputs[0].shape[0], dtype=np.int64)
+        codes = [np.argmax(inputs[j], axis=1) for j in self.discrete_inputs]
+        return np.ravel_multi_index(codes, self.n_categories)
+
+    def _predict_split(self, combos, inputs):
+        values = {self.graph.input_names[j]: inputs[j] for j in self.continuous_inputs}
+        for layer in self.graph.layers:
+            name = layer['name']
+            if layer['class_name'] == 'InputLayer' or self.is_discrete[name] or name in self.skipped:
+                continue
+            if name in self.split_dense:
+                partial, continuous_parts = self.split_dense[name]
+                y = partial[combos]
+                for part, kernel in continuous_parts:
+                    y = y + np.dot(values[part], kernel)
+                values[name] = ACTIVATIONS[layer['config'].get('activation')](y)
+                continue
+            layer_inputs = [self.tables[n][combos] if self.is_discrete[n] else values[n] for n in layer['inbound']]
+            values[name] = self.graph._call(layer, layer_inputs)
+
+        return [self.tables[n][combos] if self.is_discrete[n] else values[n] for n in self.graph.output_names]
+
+    def predict(self, inputs, batch_size=None):
+        """
+        Same as DenseGraph.predict for the embedding network.
+        """
+        if not isinstance(inputs, (list, tuple)):
+            inputs = [inputs]
+        combos = self.combination_codes(inputs)
+        if self.quantization_step is None or not self.continuous_inputs:
+            return self._predict_split(combos, inputs)
+        return self._predict_lru(combos, inputs)
+
+    def _predict_lru(self, combos, inputs):
+        step = self.quantization_step
+        quantized = [np.rint(np.asarray(inputs[j]) / step).astype(np.int32) for j in self.continuous_inputs]
+        keys = np.concatenate([combos[:, None].astype(np.int32)] + quantized, axis=1)
+        keys = np.ascontiguousarray(keys).view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+        unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+        rows = [self.lru.get(k.tobytes()) for k in unique_keys]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        self.hits += len(rows) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            idx = first[missing]
+            sub_inputs = [None] * len(inputs)
+            for j, q in zip(self.continuous_inputs, quantized):
+                sub_inputs[j] = q[idx].astype(np.float32) * step
+            outputs = self._predict_split(combos[idx], sub_inputs)
+            for i, row in zip(missing, zip(*outputs)):
+                rows[i] = row
+        for i, k in enumerate(unique_keys):
+            self.lru[k.tobytes()] = rows[i]
+            self.lru.move_to_end(k.tobytes())
+        while len(self.lru) > self.maxsize:
+            self.lru.popitem(last=False)
+
+        return [np.stack([row[o] for row in rows])[inverse.ravel()] for o in range(len(self.graph.output_names))]
@@ -0,0 +1,334 @@
+import numpy as np
+
+
+#activations supportees lors de l'export des couches Dense/Activation
+ACTIVATIONS = {
+    None: lambda x: x,
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': lambda x: 1. / (1. + np.exp(-x)),
+    'tanh': np.tanh,
+    'softplus': lambda x: np.logaddexp(0, x),
+}
+
+#couches sans effet a l'inference
+IDENTITY_LAYERS = ['Dropout']
+
+
+class DenseGraph():
+    """
+    Plain numpy copy of a functional keras sub-model (encoder, decoder or embedding).
+    Only the layers used by the CVAE architectures are supported: Dense, Concatenate,
+    Activation, BatchNormalization (folded into a scale and a shift) and Dropout.
+    """
+    def __init__(self, name, input_names, output_names, layers):
+        """
+
+        :param name: name of the exported sub-model
+        :param input_names: names of the input layers, in the order of the keras model inputs
+        :param output_names: names of the output layers, in the order of the keras model outputs
+        :param layers: list of dict {'name', 'class_name', 'inbound', 'config', 'weights'} in topological order
+        """
+        self.name = name
+        self.input_names = list(input_names)
+        self.output_names = list(output_names)
+        self.layers = layers
+
+    def get_layer(self, name):
+        for layer in self.layers:
+            if layer['name'] == name:
+                return layer
+        raise ValueError('No layer named {} in {}'.format(name, self.name))
+
+    def weights_size(self):
+        """
+        :return: number of bytes used by the weights of the graph
+        """
+        return int(sum(w.nbytes for layer in self.layers for w in layer['weights']))
+
+    def predict(self, inputs, batch_size=None):
+        """
+        Run the graph over the inputs.
+
+        :param inputs: array or list of arrays, one per graph input
+        :param batch_size: if given, the rows are processed by chunks of batch_size to bound memory
+        :return: list of output arrays
+        """
+        if not isinstance(inputs, (list, tuple)):
+            inputs = [inputs]
+        if len(inputs) != len(self.input_names):
+            raise ValueError('{} expects {} inputs, got {}'.format(self.name, len(self.input_names), len(inputs)))
+
+        nRows = inputs[0].shape[0]
+        if batch_size is None or nRows <= batch_size:
+            return self._predict_batch(inputs)
+
+        outputs = None
+        for start in range(0, nRows, batch_size):
+            res = self._predict_batch([x[start:start + batch_size] for x in inputs])
+            if outputs is None:
+                outputs = [np.empty((nRows,) + r.shape[1:], dtype=r.dtype) for r in res]
+            for out, r in zip(outputs, res):
+                out[start:start + batch_size] = r
+        return outputs
+
+    def _predict_batch(self, inputs):
+        values = dict(zip(self.input_names, inputs))
+        for layer in self.layers:
+            if layer['class_name'] == 'InputLayer':
+                continue
+            values[layer['name']] = self._call(layer, [values[name] for name in layer['inbound']])
+        return [values[name] for name in self.output_names]
+
+    def _call(self, layer, inputs):
+        class_name = layer['class_name']
+        if class_name == 'Dense':
+            return self._dense(layer, inputs[0])
+        if class_name == 'Concatenate':
+            return np.concatenate(inputs, axis=layer['config'].get('axis', -1))
+        if class_name == 'Activation':
+            return ACTIVATIONS[layer['config']['activation']](inputs[0])
+        if class_name == 'BatchNormalization':
+            scale, shift = layer['weights']
+            return inputs[0] * scale + shift
+        if class_name in IDENTITY_LAYERS:
+            return inputs[0]
+        raise ValueError('Layer type {} is not supported'.format(class_name))
+
+    def _dense(self, layer, x):
+        y = np.dot(x, layer['weights'][0])
+        if len(layer['weights']) == 2:
+            y += layer['weights'][1]
+        return ACTIVATIONS[layer['config'].get('activation')](y)
+
+
+def _inbound_names(layer_config):
+    if not layer_config['inbound_nodes']:
+        return []
+    if len(layer_config['inbound_nodes']) > 1:
+        raise ValueError('Shared layer {} can not be exported'.format(layer_config['name']))
+    return [node[0] for node in layer_config['inbound_nodes'][0]]
+
+
+def _fold_weights(class_name, config, weights):
+    weights = [np.asarray(w, dtype=np.float32) for w in weights]
+    if class_name != 'BatchNormalization' or config.get('folded', False):
+        return weights
+
+    #on replie la normalisation en un produit et un decalage: y = x*scale + shift
+    n_features = weights[-1].shape[0]
+    gamma = weights.pop(0) if config.get('scale', True) else np.ones(n_features, dtype=np.float32)
+    beta = weights.pop(0) if config.get('center', True) else np.zeros(n_features, dtype=np.float32)
+    moving_mean, moving_variance = weights
+    scale = gamma / np.sqrt(moving_variance + config.get('epsilon', 1e-3))
+    return [scale.astype(np.float32), (beta - moving_mean * scale).astype(np.float32)]
+
+
+def describe_keras_model(model):
+    """
+    Describe a functional keras sub-model with its raw keras weights, so that it can be stored
+    and later converted to a DenseGraph or loaded back in keras.
+
+    :param model: keras Model, e.g. model.encoder, model.decoder or model.embedding_enc
+    :return: dict {'name', 'input_names', 'output_names', 'layers'}
+    """
+    model_config = model.get_config()
+
+    layers = []
+    for layer_config in model_config['layers']:
+        class_name = layer_config['class_name']
+        config = layer_config['config']
+        if class_name not in ['InputLayer', 'Dense', 'Concatenate', 'Activation', 'BatchNormalization'] + IDENTITY_LAYERS:
+            raise ValueError('Layer {} of type {} can not be exported'.format(layer_config['name'], class_name))
+        if config.get('activation', None) not in ACTIVATIONS:
+            raise ValueError('Activation {} of layer {} is not supported'.format(config['activation'], layer_config['name']))
+
+        keras_layer = model.get_layer(layer_config['name'])
+        layers.append({'name': layer_config['name'],
+                       'class_name': class_name,
+                       'inbound': _inbound_names(layer_config),
+                       'config': {key: config[key] for key in ['activation', 'axis', 'units', 'epsilon', 'center', 'scale']
+                                  if key in config},
+                       'weights': [np.asarray(w) for w in keras_layer.get_weights()]})
+
+    return {'name': model_config['name'],
+            'input_names': [name for name, _, _ in model_config['input_layers']],
+            'output_names': [name for name, _, _ in model_config['output_layers']],
+            'layers': layers}
+
+
+def describe_graph(graph):
+    """
+    Describe a DenseGraph as describe_keras_model does, e.g. to save a hand-built model in a bundle.
+    Its batch normalizations are already folded and flagged as such for graph_from_description.
+
+    :return: dict {'name', 'input_names', 'output_names', 'layers'}
+    """
+    layers = []
+    for layer in graph.layers:
+        config = dict(layer['config'])
+        if layer['class_name'] == 'BatchNormalization':
+            config['folded'] = True
+        layers.append(dict(layer, config=config, weights=list(layer['weights'])))
+    return {'name': graph.name, 'input_names': list(graph.input_names), 'output_names': list(graph.output_names),
+            'layers': layers}
+
+
+def graph_from_description(description):
+    """
+    :param description: dict returned by describe_keras_model or describe_graph
+    :return: DenseGraph
+    """
+    layers = [dict(layer, weights=_fold_weights(layer['class_name'], layer['config'], layer['weights']))
+              for layer in description['layers']]
+    return DenseGraph(description['name'], description['input_names'], description['output_names'], layers)
+
+
+def export_keras_model(model):
+    """
+    Export a functional keras sub-model to a DenseGraph.
+
+    :param model: keras Model, e.g. model.encoder, model.decoder or model.embedding_enc
+    :return: DenseGraph
+    """
+    return graph_from_description(describe_keras_model(model))
+
+
+class InferenceModel():
+    """
+    Numpy inference for the CAE, CVAE and CVAE_emb models, built from their exported sub-models.
+    Inputs follow the layout of dataset['train']['x']: [x, cond] for CAE/CVAE and
+    [x, cond_pre (if cond_pre_dim>=1), emb_input_0, emb_input_1, ...] for CVAE_emb.
+    """
+    def __init__(self, encoder, decoder, embedding_enc=None, embedding_dec=None, cond_pre_dim=0, batch_size=10000):
+        self.encoder = encoder
+        self.decoder = decoder
+        self.embedding_enc = embedding_enc
+        self.embedding_dec = embedding_dec if embedding_dec is not None else embedding_enc
+        self.cond_pre_dim = cond_pre_dim
+        self.batch_size = batch_size
+        self.embedding_caches = {}
+
+    def get_config(self):
+        """
+        :return: dict of the arguments saved in a bundle, see save_bundle
+        """
+        return {'cond_pre_dim': self.cond_pre_dim}
+
+    @classmethod
+    def from_model(cls, model, **kwargs):
+        """
+        :param model: trained CAE, CVAE or CVAE_emb instance
+        :return: InferenceModel with numpy copies of the encoder, decoder and embeddings
+        """
+        embedding_enc = None
+        embedding_dec = None
+        cond_pre_dim = 0
+        if getattr(model, 'embedding_enc', None) is not None:
+            embedding_enc = export_keras_model(model.embedding_enc)
+            cond_pre_dim = model.cond_pre_dim
+            if model.embedding_dec is not model.embedding_enc:
+                embedding_dec = export_keras_model(model.embedding_dec)
+
+        return cls(export_keras_model(model.encoder), export_keras_model(model.decoder),
+                   embedding_enc=embedding_enc, embedding_dec=embedding_dec, cond_pre_dim=cond_pre_dim, **kwargs)
+
+    def graphs(self):
+        """
+        :return: dict of the distinct graphs used by the model
+        """
+        graphs = {'encoder': self.encoder}
+        if self.decoder is not None:
+            graphs['decoder'] = self.decoder
+        if self.embedding_enc is not None:
+            graphs['embedding_enc'] = self.embedding_enc
+        if self.embedding_dec is not None and self.embedding_dec is not self.embedding_enc:
+            graphs['embedding_dec'] = self.embedding_dec
+        return graphs
+
+    def conditions(self, cond_inputs, embedding='enc'):
+        """
+        Compute the condition vector given to the encoder or the decoder.
+
+        :param cond_inputs: list of condition arrays, i.e. x_inputs[1:]
+        :param embedding: 'enc' or 'dec', the embedding network to use
+        :return: array (n, cond_dim)
+        """
+        if self.embedding_enc is None:
+            return cond_inputs[0]
+
+        n_pre = 1 if self.cond_pre_dim >= 1 else 0
+        embModel = self.embedding_enc if embedding == 'enc' else self.embedding_dec
+        embModel = self.embedding_caches.get(embModel.name, embModel)
+        emb_outputs = embModel.predict(list(cond_inputs[n_pre:]), batch_size=self.batch_size)[0]
+        if n_pre == 0:
+            return emb_outputs
+        return np.concatenate((cond_inputs[0], emb_outputs), axis=1)
+
+    def enable_condition_cache(self, cond_inputs, discrete_inputs=None, quantization_step=None, maxsize=100000):
+        """
+        Precompute the condition embeddings for all the combinations of discrete conditions, see ConditionEmbeddingCache.
+
+        :param cond_inputs: list of condition arrays, i.e. x_inputs[1:], used to detect the one-hot conditions
+        :param discrete_inputs: indices of the one-hot inputs of the embedding, detected if None
+        :param quantization_step: step used to quantize the continuous conditions for the LRU cache, no LRU if None
+        :param maxsize: size of the LRU cache
+        """
+        from CVAE.embedding_cache import ConditionEmbeddingCache, detect_discrete_inputs
+
+        if self.embedding_enc is None:
+            return
+        n_pre = 1 if self.cond_pre_dim >= 1 else 0
+        if discrete_inputs is None:
+            discrete_inputs = detect_discrete_inputs(cond_inputs[n_pre:])
+        for graph in [self.embedding_enc, self.embedding_dec]:
+            if graph is not None and graph.name not in self.embedding_caches:
+                self.embedding_caches[graph.name] = ConditionEmbeddingCache(graph, discrete_inputs,
+                                                                            quantization_step=quantization_step,
+                                                                            maxsize=maxsize)
+
+    def disable_condition_cache(self):
+        self.embedding_caches = {}
+
+    def encode(self, x_inputs, cond=None):
+        """
+        :param x_inputs: list [x, conditions...]
+        :param cond: precomputed condition vector, computed from x_inputs[1:] if None
+        :return: z_mu, the mean of the latent code
+        """
+        if cond is None:
+            cond = self.conditions(x_inputs[1:], embedding='enc')
+        return self.encoder.predict([x_inputs[0], cond], batch_size=self.batch_size)[0]
+
+    def decode(self, z, cond_inputs=None, cond=None):
+        """
+        :param z: latent codes (n, z_dim)
+        :param cond_inputs: list of condition arrays, i.e. x_inputs[1:]
+        :param cond: precomputed decoder condition vector
+        :return: reconstructed curves (n, input_dim)
+        """
+        if self.decoder is None:
+            raise ValueError('The decoder was not loaded in this InferenceModel')
+        if cond is None:
+            cond = self.conditions(cond_inputs, embedding='dec')
+        return self.decoder.predict([z, cond], batch_size=self.batch_size)[0]
+
+    def reconstruct(self, x_inputs):
+        """
+        Deterministic reconstruction: the decoder is applied on z_mu and not on a sample of z.
+        """
+        cond_enc = self.conditions(x_inputs[1:], embedding='enc')
+        if self.embedding_dec is self.embedding_enc:
+            cond_dec = cond_enc
+        else:
+            cond_dec = self.conditions(x_inputs[1:], embedding='dec')
+        z = self.encode(x_inputs, cond=cond_enc)
+        return self.decode(z, cond=cond_dec)
+
+    def reconstruction_error(self, x_inputs, y=None):
+        """
+        :return: mean absolute reconstruction error of each day
+        """
+        if y is None:
+            y = x_inputs[0]
+        return np.mean(np.abs(y - self.reconstruct(x_inputs)), axis=1)
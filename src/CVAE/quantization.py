@@ -0,0 +1,196 @@
+import warnings
+import numpy as np
+import pandas as pd
+
+from CVAE.export import DenseGraph, InferenceModel, ACTIVATIONS
+
+QUANTIZED_DTYPES = ['int8', 'float16']
+
+#plus grande valeur representable en float16
+FLOAT16_MAX = 65504.
+
+#au dela, l'accumulation float32 de produits int8 n'est plus exacte (2**24 / 127**2)
+INT8_EXACT_FLOAT32_DEPTH = 1040
+
+
+def calibrate_graph(graph, inputs, percentile=99.99):
+    """
+    Record the range of the inputs of every Dense layer over calibration data.
+
+    :param graph: DenseGraph
+    :param inputs: calibration inputs of the graph, typically the training days
+    :param percentile: percentile of the absolute values used as range, to be robust to a few extreme days
+    :return: dict layer name -> activation range
+    """
+    ranges = {}
+    values = dict(zip(graph.input_names, inputs))
+    for layer in graph.layers:
+        if layer['class_name'] == 'InputLayer':
+            continue
+        layer_inputs = [values[name] for name in layer['inbound']]
+        if layer['class_name'] == 'Dense':
+            ranges[layer['name']] = float(np.percentile(np.abs(layer_inputs[0]), percentile))
+        values[layer['name']] = graph._call(layer, layer_inputs)
+    return ranges
+
+
+class QuantizedDenseGraph(DenseGraph):
+    """
+    DenseGraph whose Dense layers use int8 weights (one scale per output channel) with int8 activations
+    quantized with calibrated ranges, or float16 weights and activations.
+
+    This is a simulated quantization: the weights are stored in int8 or float16, which divides the size of the
+    model and of its bundle, and the activations are rounded as they would be on an int8 or float16 device, but
+    the products are computed by the float32 BLAS on a float32 copy of each kernel, cached at its first use.
+    It measures the effect of the quantization on the latent codes, not a memory bandwidth gain at inference.
+    """
+    def __init__(self, name, input_names, output_names, layers, dtype='int8'):
+        super().__init__(name, input_names, output_names, layers)
+        self.dtype = dtype
+        self._float32_kernels = {}
+
+    def _float32_kernel(self, layer):
+        kernel = self._float32_kernels.get(layer['name'])
+        if kernel is None:
+            kernel = self._float32_kernels[layer['name']] = layer['weights'][0].astype(np.float32)
+        return kernel
+
+    def _dense(self, layer, x):
+        if self.dtype == 'float16':
+            y = np.dot(x.astype(np.float32), self._float32_kernel(layer))
+            y += layer['weights'][1]
+            return ACTIVATIONS[layer['config'].get('activation')](y).astype(np.float16)
+
+        w_q, w_scale, bias = layer['weights']
+        x_scale = layer['config']['input_scale']
+        x_q = np.clip(np.rint(x / x_scale), -127, 127)
+        if w_q.shape[0] <= INT8_EXACT_FLOAT32_DEPTH:
+            #les produits d'entiers int8 sont accumules exactement en float32, ce qui permet d'utiliser le BLAS
+            acc = np.dot(x_q.astype(np.float32), self._float32_kernel(layer))
+        else:
+            acc = np.dot(x_q.astype(np.int64), w_q.astype(np.int64)).astype(np.float32)
+        y = acc * (x_scale * w_scale) + bias
+        return ACTIVATIONS[layer['config'].get('activation')](y)
+
+    def _call(self, layer, inputs):
+        if self.dtype == 'float16' and layer['class_name'] == 'BatchNormalization':
+            scale, shift = layer['weights']
+            return (inputs[0].astype(np.float32) * scale + shift).astype(np.float16)
+        return super()._call(layer, inputs)
+
+
+def _quantize_dense(layer, dtype, input_range):
+    kernel = layer['weights'][0]
+    if len(layer['weights']) == 2:
+        bias = layer['weights'][1]
+    else:
+        bias = np.zeros(kernel.shape[1], dtype=np.float32)
+    config = dict(layer['config'])
+
+    if dtype == 'float16':
+        return dict(layer, config=config, weights=[kernel.astype(np.float16), bias.astype(np.float32)])
+
+    #une echelle par canal de sortie
+    w_scale = np.max(np.abs(kernel), axis=0) / 127.
+    w_scale[w_scale == 0] = 1.
+    w_q = np.clip(np.rint(kernel / w_scale), -127, 127).astype(np.int8)
+    config['input_scale'] = max(input_range, 1e-8) / 127.
+    return dict(layer, config=config, weights=[w_q, w_scale.astype(np.float32), bias.astype(np.float32)])
+
+
+def quantize_graph(graph, calibration_inputs, dtype='int8', percentile=99.99):
+    """
+    :param graph: DenseGraph in float32
+    :param calibration_inputs: inputs of the graph used to calibrate the activation ranges
+    :param dtype: 'int8' or 'float16'
+    :param percentile: see calibrate_graph
+    :return: QuantizedDenseGraph
+    """
+    if dtype not in QUANTIZED_DTYPES:
+        raise ValueError('dtype must be in {}'.format(QUANTIZED_DTYPES))
+
+    ranges = calibrate_graph(graph, calibration_inputs, percentile=percentile)
+    if dtype == 'float16' and max(ranges.values()) > FLOAT16_MAX:
+        warnings.warn('Activations of {} overflow float16 on the calibration data'.format(graph.name))
+
+    layers = []
+    for layer in graph.layers:
+        if layer['class_name'] == 'Dense':
+            layer = _quantize_dense(layer, dtype, ranges[layer['name']])
+        layers.append(layer)
+
+    return QuantizedDenseGraph(graph.name, graph.input_names, graph.output_names, layers, dtype=dtype)
+
+
+def quantize_inference_model(model, calibration_inputs, dtype='int8', percentile=99.99):
+    """
+    Quantize every sub-model of an InferenceModel. The calibration inputs of the encoder and of the
+    decoder are obtained by running the float32 model on calibration_inputs.
+
+    :param model: InferenceModel in float32
+    :param calibration_inputs: list [x, conditions...], typically dataset['train']['x']
+    :param dtype: 'int8' or 'float16'
+    :return: InferenceModel with quantized sub-models
+    """
+    cond_inputs = calibration_inputs[1:]
+    n_pre = 1 if model.cond_pre_dim >= 1 else 0
+
+    embedding_enc = None
+    embedding_dec = None
+    if model.embedding_enc is not None:
+        embedding_enc = quantize_graph(model.embedding_enc, list(cond_inputs[n_pre:]), dtype, percentile)
+        if model.embedding_dec is not model.embedding_enc:
+            embedding_dec = quantize_graph(model.embedding_dec, list(cond_inputs[n_pre:]), dtype, percentile)
+
+    cond_enc = model.conditions(cond_inputs, embedding='enc')
+    cond_dec = model.conditions(cond_inputs, embedding='dec')
+    z = model.encode(calibration_inputs, cond=cond_enc)
+
+    encoder = quantize_graph(model.encoder, [calibration_inputs[0], cond_enc], dtype, percentile)
+    decoder = quantize_graph(model.decoder, [z, cond_dec], dtype, percentile)
+
+    return InferenceModel(encoder, decoder, embedding_enc=embedding_enc, embedding_dec=embedding_dec,
+                          cond_pre_dim=model.cond_pre_dim, batch_size=model.batch_size)
+
+
+def quantization_report(reference, quantized, x_inputs, y=None):
+    """
+    Compare the latent codes and the reconstruction error of a quantized model with the float32 model.
+
+    :param reference: InferenceModel in float32
+    :param quantized: dict name -> quantized InferenceModel, or a single quantized InferenceModel
+    :param x_inputs: list [x, conditions...], typically the training days
+    :param y: target curves of the reconstruction, x_inputs[0] by default
+    :return: DataFrame with one row per model
+    """
+    if isinstance(quantized, InferenceModel):
+        quantized = {quantized.encoder.dtype: quantized}
+    if y is None:
+        y = x_inputs[0]
+
+    z_ref = reference.encode(x_inputs)
+    x_hat_ref = reference.reconstruct(x_inputs)
+    z_std = np.std(z_ref, axis=0)
+    z_std[z_std == 0] = 1.
+
+    rows = []
+    names = ['float32']
+    rows.append([0., 0., 1., float(np.mean(np.abs(y - x_hat_ref))), 0., 0.,
+                 sum(g.weights_size() for g in reference.graphs().values())])
+    for name, model in quantized.items():
+        z = model.encode(x_inputs).astype(np.float32)
+        x_hat = model.reconstruct(x_inputs).astype(np.float32)
+        error_ref = np.mean(np.abs(y - x_hat_ref), axis=1)
+        error = np.mean(np.abs(y - x_hat), axis=1)
+        rows.append([float(np.mean(np.abs(z - z_ref) / z_std)),
+                     float(np.max(np.abs(z - z_ref))),
+                     float(np.mean([np.corrcoef(z[:, i], z_ref[:, i])[0, 1] for i in range(z.shape[1])])),
+                     float(np.mean(error)),
+                     float(np.mean(np.abs(x_hat - x_hat_ref))),
+                     float(np.max(np.abs(error - error_ref))),
+                     sum(g.weights_size() for g in model.graphs().values())])
+        names.append(name)
+
+    columns = ['latent_mae_std', 'latent_max_abs_error', 'latent_corr', 'reconstruction_error',
+               'reconstruction_mae_vs_float32', 'day_error_max_abs_diff', 'weights_bytes']
+    return pd.DataFrame(rows, index=names, columns=columns)
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+
+class ConditionGrid():
+    """
+    Cartesian product of candidate values for each condition input, generated lazily by batches.
+    Each axis is an array whose rows are the candidate values of one condition input, e.g. the 7
+    one-hot days, the 12 one-hot months and a set of temperature profiles.
+    """
+    def __init__(self, axes):
+        self.axes = [np.atleast_2d(np.asarray(axis)) for axis in axes]
+        self.shape = tuple(axis.shape[0] for axis in self.axes)
+
+    def __len__(self):
+        return int(np.prod(self.shape))
+
+    def indices(self, start, stop):
+        """
+        :return: index of the candidate of each axis for the tuples start to stop
+        """
+        return np.unravel_index(np.arange(start, stop), self.shape)
+
+    def batches(self, batch_size):
+        for start in range(0, len(self), batch_size):
+            stop = min(start + batch_size, len(self))
+            yield [axis[idx] for axis, idx in zip(self.axes, self.indices(start, stop))]
+
+
+class ConditionTable():
+    """
+    Table of condition tuples, in the layout of dataset['train']['x'][1:].
+    """
+    def __init__(self, cond_inputs):
+        self.cond_inputs = [np.asarray(c) for c in cond_inputs]
+
+    def __len__(self):
+        return self.cond_inputs[0].shape[0]
+
+    def batches(self, batch_size):
+        for start in range(0, len(self), batch_size):
+            yield [c[start:start + batch_size] for c in self.cond_inputs]
+
+
+class StreamingQuantiles():
+    """
+    Per-column quantiles of a stream of rows with bounded memory, from one histogram per column.
+    The range of the histograms is set from the first batch, widened by its span on each side. When later values
+    fall outside of it, the width of the bins of the column is doubled (pairs of bins are merged) and the range
+    extended on that side until they fit, so that the quantiles stay within one bin of the exact ones whatever
+    the order of the rows.
+    """
+    def __init__(self, n_bins=4096):
+        if n_bins % 2:
+            raise ValueError('n_bins must be even, got {}'.format(n_bins))
+        self.n_bins = n_bins
+        self.counts = None
+        self.n = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if self.counts is None:
+            vmin = values.min(axis=0)
+            vmax = values.max(axis=0)
+            span = np.maximum(vmax - vmin, 1e-6)
+            self.low = vmin - span
+            self.width = 3 * span / self.n_bins
+            self.counts = np.zeros((values.shape[1], self.n_bins), dtype=np.int64)
+        self._widen(values.min(axis=0), values.max(axis=0))
+
+        bins = np.floor((values - self.low) / self.width).astype(np.int64)
+        #erreurs d'arrondi sur les bords
+        np.clip(bins, 0, self.n_bins - 1, out=bins)
+        flat = bins + np.arange(values.shape[1]) * self.n_bins
+        self.counts += np.bincount(flat.ravel(), minlength=self.counts.size).reshape(self.counts.shape)
+        self.n += values.shape[0]
+
+    def _widen(self, vmin, vmax):
+        half = self.n_bins // 2
+        for col in range(self.counts.shape[0]):
+            while vmin[col] < self.low[col] or vmax[col] >= self.low[col] + self.n_bins * self.width[col]:
+                merged = self.counts[col, 0::2] + self.counts[col, 1::2]
+                self.counts[col] = 0
+                if vmin[col] < self.low[col]:
+                    #extension a gauche : les bins fusionnes occupent la seconde moitie, la borne haute est conservee
+                    self.counts[col, half:] = merged
+                    self.low[col] -= self.n_bins * self.width[col]
+                else:
+                    self.counts[col, :half] = merged
+                self.width[col] *= 2
+
+    def quantiles(self, q):
+        """
+        :param q: percentiles in [0, 100]
+        :return: array (len(q), n_columns)
+        """
+        cum = np.cumsum(self.counts, axis=1)
+        res = np.empty((len(q), self.counts.shape[0]))
+        for i, percentile in enumerate(q):
+            target = percentile / 100. * self.n
+            for col in range(self.counts.shape[0]):
+                b = min(int(np.searchsorted(cum[col], target)), self.n_bins - 1)
+                before = cum[col, b - 1] if b > 0 else 0
+                inside = (target - before) / self.counts[col, b] if self.counts[col, b] else 0.5
+                res[i, col] = self.low[col] + (b + min(max(inside, 0.), 1.)) * self.width[col]
+        return res
+
+
+def generate_scenarios(model, conditions, n_samples=10, out_path=None, batch_size=10000,
+                       quantiles=(5, 50, 95), condition_quantiles_path=None, seed=None, inverse_transform=None):
+    """
+    Generate load curves for hypothetical conditions with the decoder P(X|z,y): n_samples latent codes
+    are drawn from the prior N(0, I) for each condition tuple and decoded by streamed batches.
+
+    :param model: InferenceModel
+    :param conditions: ConditionGrid, ConditionTable or list of condition arrays (layout of dataset['train']['x'][1:])
+    :param n_samples: number of latent samples M per condition tuple
+    :param out_path: .npy file receiving the (n_tuples * M, input_dim) generated curves, opened as a memmap; nothing is stored if None
+    :param batch_size: number of condition tuples decoded at once
+    :param quantiles: percentiles computed online over all generated curves, per time step
+    :param condition_quantiles_path: .npy file receiving the (n_tuples, len(quantiles), input_dim) quantiles over the M samples of each tuple
+    :param seed: seed of the latent samples
+    :param inverse_transform: function applied on the generated curves, e.g. to undo the normalisation
+    :return: dict with the paths, the number of scenarios and the DataFrame of the global quantiles
+    """
+    if isinstance(conditions, (list, tuple)):
+        conditions = ConditionTable(conditions)
+
+    rng = np.random.RandomState(seed)
+    n_tuples = len(conditions)
+    z_dim = latent_dim(model)
+
+    out = None
+    condition_out = None
+    summary = StreamingQuantiles()
+    row = 0
+    for cond_inputs in conditions.batches(batch_size):
+        n = cond_inputs[0].shape[0]
+        cond = model.conditions(cond_inputs, embedding='dec')
+        #chaque tuple de conditions est repete M fois, dans l'ordre des tuples
+        cond = np.repeat(cond, n_samples, axis=0)
+        z = rng.standard_normal((n * n_samples, z_dim))
+        x_gen = model.decode(z, cond=cond).astype(np.float32)
+        if inverse_transform is not None:
+            x_gen = inverse_transform(x_gen).astype(np.float32)
+
+        if out is None and out_path is not None:
+            out = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32,
+                                            shape=(n_tuples * n_samples, x_gen.shape[1]))
+        if condition_out is None and condition_quantiles_path is not None:
+            condition_out = np.lib.format.open_memmap(condition_quantiles_path, mode='w+', dtype=np.float32,
+                                                      shape=(n_tuples, len(quantiles), x_gen.shape[1]))
+
+        if out is not None:
+            out[row:row + x_gen.shape[0]] = x_gen
+        if condition_out is not None:
+            per_tuple = np.percentile(x_gen.reshape(n, n_samples, -1), quantiles, axis=1)
+            condition_out[row // n_samples:row // n_samples + n] = np.transpose(per_tuple, (1, 0, 2))
+        summary.update(x_gen)
+        row += x_gen.shape[0]
+
+    for memmap in [out, condition_out]:
+        if memmap is not None:
+            memmap.flush()
+
+    df_quantiles = pd.DataFrame(summary.quantiles(quantiles), index=['P{}'.format(q) for q in quantiles])
+    return {'path': out_path,
+            'condition_quantiles_path': condition_quantiles_path,
+            'n_scenarios': row,
+            'quantiles': df_quantiles,
+            'quantile_bin_width': summary.width}
+
+
+def latent_dim(model):
+    """
+    :param model: InferenceModel
+    :return: dimension of the latent space, read from the z_mu layer of the encoder
+    """
+    layer = model.encoder.get_layer(model.encoder.output_names[0])
+    while layer['class_name'] != 'Dense':
+        layer = model.encoder.get_layer(layer['inbound'][0])
+    return layer['weights'][0].shape[1]
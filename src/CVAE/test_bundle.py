@@ -0,0 +1,93 @@
+import os
+import numpy as np
+import pytest
+
+from CVAE.bundle import save_bundle, load_bundle, WEIGHTS_NAME
+from CVAE.export import DenseGraph, InferenceModel
+
+
+def _model_and_inputs(n=32, input_dim=48, cond_dim=7):
+    pytest.importorskip('keras')
+    from CVAE.cvae_model import CVAE
+
+    rng = np.random.RandomState(0)
+    model = CVAE(input_dim=input_dim, cond_dim=cond_dim, z_dim=4, e_dims=[16], d_dims=[16], name='test', verbose=False)
+    x = rng.rand(n, input_dim).astype(np.float32)
+    cond = np.eye(cond_dim, dtype=np.float32)[rng.randint(cond_dim, size=n)]
+    return model, [x, cond]
+
+
+def test_bundle_round_trip(tmp_path):
+    from sklearn.preprocessing import StandardScaler
+
+    model, x_inputs = _model_and_inputs()
+    scaler = StandardScaler().fit(np.random.RandomState(1).rand(100, 48))
+    save_bundle(model, str(tmp_path), scaler=scaler, condition_encoders={'day': 'one_hot'})
+    bundle = load_bundle(str(tmp_path))
+
+    #inference numpy a partir des poids memory-mappes
+    z_keras = model.encoder.predict(x_inputs)[0]
+    np.testing.assert_allclose(bundle.inference_model().encode(x_inputs), z_keras, atol=1e-5)
+
+    #modele keras reconstruit avec les memes poids
+    rebuilt = bundle.keras_model()
+    for name in ['encoder', 'decoder']:
+        for w, w_rebuilt in zip(getattr(model, name).get_weights(), getattr(rebuilt, name).get_weights()):
+            np.testing.assert_array_equal(w, w_rebuilt)
+    np.testing.assert_array_equal(rebuilt.scaler.mean_, scaler.mean_)
+    assert rebuilt.condition_encoders == {'day': 'one_hot'}
+
+
+def test_bundle_weights_are_deduplicated(tmp_path):
+    model, _ = _model_and_inputs()
+    save_bundle(model, str(tmp_path))
+    unique = {w.tobytes(): w.nbytes for m in [model.encoder, model.decoder] for w in m.get_weights()}
+    #l'alignement ajoute au plus 63 octets par tableau
+    assert os.path.getsize(os.path.join(str(tmp_path), WEIGHTS_NAME)) <= sum(unique.values()) + 64 * len(unique)
+
+
+def _graph(name, input_names, widths, outputs, rng, batch_norm=False):
+    layers = [{'name': n, 'class_name': 'InputLayer', 'inbound': [], 'config': {}, 'weights': []} for n in input_names]
+    layers.append({'name': 'concat', 'class_name': 'Concatenate', 'inbound': list(input_names), 'config': {'axis': -1}, 'weights': []})
+    layers.append({'name': 'hidden', 'class_name': 'Dense', 'inbound': ['concat'], 'config': {'activation': 'relu'},
+                   'weights': [rng.randn(sum(widths), 6).astype(np.float32), rng.randn(6).astype(np.float32)]})
+    last = 'hidden'
+    if batch_norm:
+        #normalisation deja repliee en un produit et un decalage
+        layers.append({'name': 'bn', 'class_name': 'BatchNormalization', 'inbound': ['hidden'], 'config': {'epsilon': 1e-3},
+                       'weights': [rng.rand(6).astype(np.float32) + 0.5, rng.randn(6).astype(np.float32)]})
+        last = 'bn'
+    layers += [{'name': out, 'class_name': 'Dense', 'inbound': [last], 'config': {'activation': 'linear'},
+                'weights': [rng.randn(6, width).astype(np.float32), rng.randn(width).astype(np.float32)]}
+               for out, width in outputs]
+    return DenseGraph(name, input_names, [out for out, _ in outputs], layers)
+
+
+def test_inference_model_bundle_round_trip(tmp_path):
+    import pandas as pd
+    from sklearn.preprocessing import StandardScaler
+    from conso.load_shape_data import get_condition_encoders
+
+    rng = np.random.RandomState(0)
+    embedding = _graph('embedding', ['day', 'month'], [7, 12], [('emb_out', 3)], rng)
+    encoder = _graph('encoder', ['x', 'cond'], [24, 4], [('z_mu', 2), ('z_log_sigma', 2)], rng, batch_norm=True)
+    decoder = _graph('decoder', ['z', 'cond'], [2, 4], [('x_hat', 24)], rng)
+    model = InferenceModel(encoder, decoder, embedding_enc=embedding, cond_pre_dim=1)
+
+    ds = pd.date_range('2013-01-01', periods=60, freq='D')
+    x_conso = pd.DataFrame({'ds': pd.date_range('2013-01-01', periods=60 * 24, freq='h'),
+                            'temperature_France': rng.randn(60 * 24)})
+    encoders = get_condition_encoders(x_conso, ds, type_cond=['temp', 'day', 'month'])
+    scaler = StandardScaler().fit(pd.DataFrame({'consumption_France': rng.rand(100), 'temperature_France': rng.rand(100)}))
+    save_bundle(model, str(tmp_path), scaler=scaler, condition_encoders=encoders)
+
+    bundle = load_bundle(str(tmp_path))
+    x_inputs = [rng.rand(30, 24), rng.rand(30, 1), np.eye(7)[rng.randint(7, size=30)], np.eye(12)[rng.randint(12, size=30)]]
+    loaded = bundle.inference_model()
+    np.testing.assert_allclose(loaded.encode(x_inputs), model.encode(x_inputs), rtol=1e-6)
+    np.testing.assert_allclose(loaded.reconstruct(x_inputs), model.reconstruct(x_inputs), rtol=1e-6)
+    assert bundle.condition_encoders == encoders and bundle.condition_encoders['order'] == ['month', 'day', 'temp']
+    frame = pd.DataFrame({'consumption_France': rng.rand(5), 'temperature_France': rng.rand(5)})
+    np.testing.assert_allclose(bundle.scaler().transform(frame), scaler.transform(frame))
+    with pytest.raises(ValueError):
+        bundle.keras_model()
@@ -0,0 +1,72 @@
+import numpy as np
+
+from CVAE.export import DenseGraph, InferenceModel
+from CVAE.embedding_cache import ConditionEmbeddingCache, detect_discrete_inputs
+
+
+def _dense(name, inbound, n_in, n_out, rng, activation='relu'):
+    return {'name': name, 'class_name': 'Dense', 'inbound': inbound, 'config': {'activation': activation},
+            'weights': [rng.randn(n_in, n_out).astype(np.float32), rng.randn(n_out).astype(np.float32)]}
+
+
+def _embedding_graph(with_temperature=True, seed=0):
+    """
+    Embedding network of the CVAE_emb models: one branch per condition, concatenated and projected.
+    """
+    rng = np.random.RandomState(seed)
+    inputs = [('day', 7), ('month', 12)] + ([('temperature', 48)] if with_temperature else [])
+    layers = [{'name': name, 'class_name': 'InputLayer', 'inbound': [], 'config': {}, 'weights': []} for name, _ in inputs]
+    layers += [_dense(name + '_emb', [name], width, 3, rng) for name, width in inputs]
+    layers.append({'name': 'concat', 'class_name': 'Concatenate', 'inbound': [name + '_emb' for name, _ in inputs],
+                   'config': {'axis': -1}, 'weights': []})
+    layers.append(_dense('emb_out', ['concat'], 3 * len(inputs), 4, rng, activation='linear'))
+    return DenseGraph('embedding_enc', [name for name, _ in inputs], ['emb_out'], layers)
+
+
+def _conditions(n, with_temperature=True, seed=1):
+    rng = np.random.RandomState(seed)
+    conditions = [np.eye(7, dtype=np.float32)[rng.randint(7, size=n)], np.eye(12, dtype=np.float32)[rng.randint(12, size=n)]]
+    if with_temperature:
+        conditions.append(rng.randn(n, 48).astype(np.float32))
+    return conditions
+
+
+def test_cache_matches_graph_with_continuous_inputs():
+    graph = _embedding_graph()
+    conditions = _conditions(500)
+    assert detect_discrete_inputs(conditions) == [0, 1]
+    cache = ConditionEmbeddingCache(graph, [0, 1])
+    np.testing.assert_allclose(cache.predict(conditions)[0], graph.predict(conditions)[0], rtol=1e-5, atol=1e-5)
+
+
+def test_cache_matches_graph_with_discrete_inputs_only():
+    graph = _embedding_graph(with_temperature=False)
+    conditions = _conditions(500, with_temperature=False)
+    cache = ConditionEmbeddingCache(graph, [0, 1])
+    #7 jours x 12 mois
+    assert cache.tables['emb_out'].shape[0] == 84
+    np.testing.assert_allclose(cache.predict(conditions)[0], graph.predict(conditions)[0], rtol=1e-5, atol=1e-5)
+
+
+def test_lru_cache_matches_graph_on_quantized_inputs():
+    step = 0.5
+    graph = _embedding_graph()
+    conditions = _conditions(200)
+    #jours repetes pour que le cache serve des lignes deja calculees
+    conditions = [np.concatenate((c, c)) for c in conditions]
+    cache = ConditionEmbeddingCache(graph, [0, 1], quantization_step=step)
+    quantized = conditions[:2] + [np.rint(conditions[2] / step).astype(np.float32) * step]
+    np.testing.assert_allclose(cache.predict(conditions)[0], graph.predict(quantized)[0], rtol=1e-5, atol=1e-5)
+    assert cache.hits == 0 and cache.misses == 200
+    cache.predict(conditions)
+    assert cache.hits == 200
+
+
+def test_inference_model_conditions_use_the_cache():
+    graph = _embedding_graph()
+    conditions = _conditions(100)
+    model = InferenceModel(None, None, embedding_enc=graph, cond_pre_dim=0)
+    expected = model.conditions(conditions)
+    model.enable_condition_cache(conditions)
+    assert 'embedding_enc' in model.embedding_caches
+    np.testing.assert_allclose(model.conditions(conditions), expected, rtol=1e-5, atol=1e-5)
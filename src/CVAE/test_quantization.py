@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from CVAE.export import DenseGraph, InferenceModel
+from CVAE.quantization import quantize_graph, quantize_inference_model, quantization_report
+
+
+def _dense(name, inbound, n_in, n_out, rng, activation='linear'):
+    return {'name': name, 'class_name': 'Dense', 'inbound': inbound, 'config': {'activation': activation},
+            'weights': [(rng.randn(n_in, n_out) / np.sqrt(n_in)).astype(np.float32), (rng.randn(n_out) * 0.1).astype(np.float32)]}
+
+
+def _graph(name, input_names, n_in, hidden, outputs, rng):
+    layers = [{'name': n, 'class_name': 'InputLayer', 'inbound': [], 'config': {}, 'weights': []} for n in input_names]
+    layers.append({'name': 'concat', 'class_name': 'Concatenate', 'inbound': list(input_names), 'config': {'axis': -1}, 'weights': []})
+    layers.append(_dense('hidden', ['concat'], n_in, hidden, rng, 'relu'))
+    layers.append({'name': 'bn', 'class_name': 'BatchNormalization', 'inbound': ['hidden'], 'config': {},
+                   'weights': [(rng.rand(hidden) + 0.5).astype(np.float32), (rng.randn(hidden) * 0.1).astype(np.float32)]})
+    layers += [_dense(out, ['bn'], hidden, width, rng) for out, width in outputs]
+    return DenseGraph(name, input_names, [out for out, _ in outputs], layers)
+
+
+def _model_and_inputs(n=400, input_dim=48, cond_dim=7, z_dim=4):
+    rng = np.random.RandomState(0)
+    encoder = _graph('encoder', ['x', 'cond'], input_dim + cond_dim, 32, [('z_mu', z_dim), ('z_log_sigma', z_dim)], rng)
+    decoder = _graph('decoder', ['z', 'cond'], z_dim + cond_dim, 32, [('x_hat', input_dim)], rng)
+    hours = np.arange(input_dim) * 24. / input_dim
+    x = np.sin(2 * np.pi * (hours[None, :] - 6 * rng.rand(n, 1)) / 24) + 0.1 * rng.randn(n, input_dim)
+    cond = np.eye(cond_dim)[rng.randint(cond_dim, size=n)]
+    return InferenceModel(encoder, decoder), [x.astype(np.float32), cond.astype(np.float32)]
+
+
+@pytest.mark.parametrize('dtype,tolerance', [('int8', 0.05), ('float16', 0.005)])
+def test_quantized_model_stays_close_to_float32(dtype, tolerance):
+    model, x_inputs = _model_and_inputs()
+    quantized = quantize_inference_model(model, x_inputs, dtype=dtype)
+    z, z_ref = quantized.encode(x_inputs).astype(np.float32), model.encode(x_inputs)
+    assert np.mean(np.abs(z - z_ref)) / np.mean(np.std(z_ref, axis=0)) < tolerance
+    x_hat, x_hat_ref = quantized.reconstruct(x_inputs).astype(np.float32), model.reconstruct(x_inputs)
+    assert np.mean(np.abs(x_hat - x_hat_ref)) / np.std(x_hat_ref) < tolerance
+    #les noyaux float32 sont calcules une fois puis reutilises
+    assert set(quantized.encoder._float32_kernels) == {'hidden', 'z_mu', 'z_log_sigma'}
+    np.testing.assert_array_equal(quantized.encode(x_inputs), quantized.encode(x_inputs))
+
+
+def test_quantized_graph_keeps_int8_weights():
+    model, x_inputs = _model_and_inputs()
+    quantized = quantize_graph(model.encoder, x_inputs, dtype='int8')
+    assert quantized.get_layer('hidden')['weights'][0].dtype == np.int8
+    assert quantized.weights_size() < model.encoder.weights_size() / 2
+    with pytest.raises(ValueError):
+        quantize_graph(model.encoder, x_inputs, dtype='int4')
+
+
+def test_quantization_report():
+    model, x_inputs = _model_and_inputs()
+    quantized = {dtype: quantize_inference_model(model, x_inputs, dtype=dtype) for dtype in ['int8', 'float16']}
+    report = quantization_report(model, quantized, x_inputs)
+    assert list(report.index) == ['float32', 'int8', 'float16']
+    assert report.loc['float32', 'latent_max_abs_error'] == 0 and report.loc['float32', 'latent_corr'] == 1
+    assert np.all(report.loc[['int8', 'float16'], 'latent_corr'] > 0.99)
+    assert report.loc['int8', 'weights_bytes'] < report.loc['float16', 'weights_bytes'] < report.loc['float32', 'weights_bytes']
+    #un seul modele quantifie est nomme par son type
+    assert list(quantization_report(model, quantized['int8'], x_inputs).index) == ['float32', 'int8']
+
+
+def test_batched_predict_matches_one_batch():
+    model, x_inputs = _model_and_inputs(n=103)
+    cond = x_inputs[1]
+    expected = model.encoder.predict([x_inputs[0], cond])
+    for result, reference in zip(model.encoder.predict([x_inputs[0], cond], batch_size=10), expected):
+        np.testing.assert_allclose(result, reference, rtol=1e-6, atol=1e-7)
@@ -0,0 +1,84 @@
+import numpy as np
+
+from CVAE.export import DenseGraph, InferenceModel
+from CVAE.scenarios import ConditionGrid, StreamingQuantiles, generate_scenarios, latent_dim
+
+
+def _model(input_dim=24, cond_dim=7, z_dim=3):
+    rng = np.random.RandomState(0)
+
+    def graph(name, input_names, n_in, outputs):
+        layers = [{'name': n, 'class_name': 'InputLayer', 'inbound': [], 'config': {}, 'weights': []} for n in input_names]
+        layers.append({'name': 'concat', 'class_name': 'Concatenate', 'inbound': input_names, 'config': {'axis': -1}, 'weights': []})
+        layers += [{'name': out, 'class_name': 'Dense', 'inbound': ['concat'], 'config': {'activation': 'tanh'},
+                    'weights': [rng.randn(n_in, width).astype(np.float32), rng.randn(width).astype(np.float32)]}
+                   for out, width in outputs]
+        return DenseGraph(name, input_names, [out for out, _ in outputs], layers)
+
+    encoder = graph('encoder', ['x', 'cond'], input_dim + cond_dim, [('z_mu', z_dim), ('z_log_sigma', z_dim)])
+    decoder = graph('decoder', ['z', 'cond'], z_dim + cond_dim, [('x_hat', input_dim)])
+    return InferenceModel(encoder, decoder)
+
+
+def test_condition_grid_is_the_cartesian_product():
+    grid = ConditionGrid([np.eye(7), np.eye(12), np.arange(6).reshape(3, 2)])
+    assert len(grid) == 7 * 12 * 3
+    batches = list(grid.batches(50))
+    rows = np.concatenate([np.concatenate(batch, axis=1) for batch in batches])
+    expected = np.array([np.concatenate((np.eye(7)[d], np.eye(12)[m], np.arange(6).reshape(3, 2)[t]))
+                         for d in range(7) for m in range(12) for t in range(3)])
+    np.testing.assert_array_equal(rows, expected)
+
+
+def test_streaming_quantiles_match_numpy_within_one_bin():
+    rng = np.random.RandomState(0)
+    values = rng.randn(20000, 5) * np.arange(1, 6)
+    summary = StreamingQuantiles()
+    for start in range(0, len(values), 3000):
+        summary.update(values[start:start + 3000])
+    expected = np.percentile(values, [5, 50, 95], axis=0)
+    assert np.all(np.abs(summary.quantiles([5, 50, 95]) - expected) <= summary.width)
+
+
+def test_generated_scenarios_match_direct_decoding(tmp_path):
+    model = _model()
+    assert latent_dim(model) == 3
+    grid = ConditionGrid([np.eye(7)])
+    n_samples = 20
+    out_path = str(tmp_path / 'scenarios.npy')
+    quantiles_path = str(tmp_path / 'quantiles.npy')
+    result = generate_scenarios(model, grid, n_samples=n_samples, out_path=out_path, batch_size=3,
+                                condition_quantiles_path=quantiles_path, seed=0)
+    assert result['n_scenarios'] == 7 * n_samples
+
+    #memes tirages que les lots de generate_scenarios, dans l'ordre des tuples
+    rng = np.random.RandomState(0)
+    z = np.concatenate([rng.standard_normal((n * n_samples, 3)) for n in [3, 3, 1]])
+    expected = model.decode(z, cond=np.repeat(np.eye(7), n_samples, axis=0)).astype(np.float32)
+    curves = np.load(out_path)
+    np.testing.assert_allclose(curves, expected, rtol=1e-5, atol=1e-6)
+
+    #quantiles exacts par tuple, et quantiles globaux calcules en ligne sur les memes lots
+    per_tuple = np.percentile(curves.reshape(7, n_samples, -1), [5, 50, 95], axis=1).transpose(1, 0, 2)
+    np.testing.assert_allclose(np.load(quantiles_path), per_tuple, rtol=1e-5, atol=1e-6)
+    summary = StreamingQuantiles()
+    for start, stop in [(0, 60), (60, 120), (120, 140)]:
+        summary.update(curves[start:stop])
+    np.testing.assert_allclose(result['quantiles'].values, summary.quantiles([5, 50, 95]))
+
+
+def test_streaming_quantiles_widen_their_range_for_ordered_rows():
+    rng = np.random.RandomState(1)
+    #lignes triees par niveau, comme une grille dont la temperature est l'axe le plus lent
+    values = np.sort(rng.randn(30000, 3) * [1, 5, 20] + [0, 100, -50], axis=0)
+    summary = StreamingQuantiles(n_bins=512)
+    for start in range(0, len(values), 1000):
+        summary.update(values[start:start + 1000])
+    assert summary.n == len(values) and summary.counts.sum() == values.size
+    expected = np.percentile(values, [1, 5, 50, 95, 99], axis=0)
+    assert np.all(np.abs(summary.quantiles([1, 5, 50, 95, 99]) - expected) <= summary.width)
+    #les valeurs du premier lot decroissant etendent la plage vers la gauche
+    summary = StreamingQuantiles(n_bins=512)
+    for start in range(len(values) - 1000, -1, -1000):
+        summary.update(values[start:start + 1000])
+    assert np.all(np.abs(summary.quantiles([1, 5, 50, 95, 99]) - expected) <= summary.width)
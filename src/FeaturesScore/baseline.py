@@ -0,0 +1,151 @@
+import math
+import hashlib
+import itertools
+import numpy as np
+
+from FeaturesScore.neighbors import NeighborGraph, cv_folds
+
+#nombre maximal de tirages de k voisins enumeres pour le vote a la majorite
+MAX_ENUMERATION = 1000000
+
+#scores de reference deja calcules, par jeu de labels
+_baseline_cache = {}
+
+
+def _vote_outcomes(k, n_classes):
+    """
+    :return: counts (M, n_classes) of every possible vote of k neighbors, their multinomial coefficients
+             and the class predicted by each vote (smallest class in case of tie)
+    """
+    from scipy.special import gammaln
+
+    counts = np.array([np.bincount(c, minlength=n_classes)
+                       for c in itertools.combinations_with_replacement(range(n_classes), k)])
+    log_coef = gammaln(k + 1) - np.sum(gammaln(counts + 1), axis=1)
+    return counts, log_coef, np.argmax(counts, axis=1)
+
+
+def _prediction_probabilities(priors, k):
+    """
+    :param priors: array (m, n_classes) of class frequencies of the training sets
+    :return: array (m, n_classes), probability that k neighbors drawn at random vote for each class
+    """
+    counts, log_coef, pred = _vote_outcomes(k, priors.shape[1])
+    with np.errstate(divide='ignore'):
+        log_p = log_coef[None, :] + np.dot(np.log(priors), counts.T)
+    p_votes = np.exp(log_p)
+    return np.stack([p_votes[:, pred == c].sum(axis=1) for c in range(priors.shape[1])], axis=1)
+
+
+def _groups(y, cv, type):
+    if cv == 'loo':
+        return None
+    return cv_folds(np.zeros((len(y), 1)), y, cv=cv, type=type)
+
+
+def _analytic_accuracy(codes, n_classes, k, folds):
+    counts = np.bincount(codes, minlength=n_classes)
+    if folds is None:
+        #leave-one-out : le point retire ne change la distribution que de sa propre classe
+        priors = (counts[None, :] - np.eye(n_classes)) / (len(codes) - 1.)
+        p_pred = _prediction_probabilities(np.maximum(priors, 0), k)
+        return np.sum(counts * np.diag(p_pred)) / len(codes)
+    n_folds = folds.max() + 1
+    fold_counts = np.bincount(folds * n_classes + codes, minlength=n_folds * n_classes).reshape(n_folds, n_classes)
+    train_counts = counts[None, :] - fold_counts
+    p_pred = _prediction_probabilities(train_counts / train_counts.sum(axis=1, keepdims=True).astype(float), k)
+    return np.mean(np.sum(fold_counts * p_pred, axis=1) / fold_counts.sum(axis=1))
+
+
+def _analytic_true_class_probability(codes, n_classes, folds, indices):
+    counts = np.bincount(codes, minlength=n_classes)
+    if folds is None:
+        p_true = (counts[codes] - 1.) / (len(codes) - 1.)
+    else:
+        n_folds = folds.max() + 1
+        fold_counts = np.bincount(folds * n_classes + codes, minlength=n_folds * n_classes).reshape(n_folds, n_classes)
+        train_counts = counts[None, :] - fold_counts
+        p_true = train_counts[folds, codes] / train_counts.sum(axis=1)[folds].astype(float)
+    return np.mean(p_true if indices is None else p_true[indices])
+
+
+def _analytic_r2(y, k, folds):
+    """
+    Expected R2 when each prediction is the mean of k values drawn at random from the training set:
+    E[(y_i - pred_i)^2] = (y_i - mean_train)^2 + var_train / k
+    """
+    n = len(y)
+    if folds is None:
+        train_n = n - 1.
+        train_sum = y.sum() - y
+        train_sq = np.sum(y ** 2) - y ** 2
+        groups = np.zeros(n, dtype=np.int64)
+    else:
+        n_folds = folds.max() + 1
+        train_n = (n - np.bincount(folds, minlength=n_folds))[folds].astype(float)
+        train_sum = (y.sum() - np.bincount(folds, weights=y, minlength=n_folds))[folds]
+        train_sq = (np.sum(y ** 2) - np.bincount(folds, weights=y ** 2, minlength=n_folds))[folds]
+        groups = folds
+    train_mean = train_sum / train_n
+    train_var = train_sq / train_n - train_mean ** 2
+    expected_res = (y - train_mean) ** 2 + train_var / k
+
+    n_groups = groups.max() + 1
+    group_mean = np.bincount(groups, weights=y, minlength=n_groups) / np.bincount(groups, minlength=n_groups)
+    ss_res = np.bincount(groups, weights=expected_res, minlength=n_groups)
+    ss_tot = np.bincount(groups, weights=(y - group_mean[groups]) ** 2, minlength=n_groups)
+    return np.mean(1 - ss_res / ss_tot)
+
+
+def _permutation_score(y, score, k, cv, seed, n_permutations):
+    """
+    Mean score of a knn on a seeded random one-dimensional latent space, over permutations of the labels.
+    """
+    from FeaturesScore.scoring import scoreKnnGraph
+
+    rng = np.random.RandomState(seed)
+    graph = NeighborGraph(rng.rand(len(y), 1), k=k, n_candidates=k + 1 if cv == 'loo' else None, backend='kd_tree')
+    return np.mean([scoreKnnGraph(graph, rng.permutation(y), type='classifier', cv=cv)[score] for _ in range(n_permutations)])
+
+
+def randomKnnScore(y, score='accuracy', k=5, cv=10, indices=None, seed=0, n_permutations=10):
+    """
+    Score of a knn on a latent space that carries no information about y, i.e. whose neighbors are drawn
+    at random from the training folds. Accuracy, probability of the true class and R2 are computed in closed
+    form from the label distributions of the training folds; the macro F1 has no closed form and is estimated
+    from n_permutations seeded permutations of the labels.
+    The scores are cached per label set, so that the baseline is only computed once for all the models and epochs.
+
+    :param y: labels, or values for the 'r2' score
+    :param score: 'accuracy', 'F1', 'predP' (mean probability of the true class) or 'r2'
+    :param cv: number of folds, or 'loo'
+    :param indices: points on which predP is averaged, all the points if None
+    :return: expected score of the random model
+    """
+    y = np.asarray(y)
+    key = hashlib.sha1(y.tobytes() + str(y.dtype).encode()).hexdigest()
+    if indices is not None:
+        key += hashlib.sha1(np.asarray(indices).tobytes()).hexdigest()
+    key = (key, score, k, cv, seed, n_permutations)
+    if key in _baseline_cache:
+        return _baseline_cache[key]
+
+    if score == 'r2':
+        result = _analytic_r2(y.astype(float), k, _groups(y, cv, 'regressor'))
+    else:
+        classes, codes = np.unique(y, return_inverse=True)
+        folds = _groups(codes, cv, 'classifier')
+        n_outcomes = math.comb(k + len(classes) - 1, k)
+        if score == 'predP':
+            result = _analytic_true_class_probability(codes, len(classes), folds, indices)
+        elif score == 'accuracy' and n_outcomes <= MAX_ENUMERATION:
+            result = _analytic_accuracy(codes, len(classes), k, folds)
+        elif score == 'accuracy':
+            result = _permutation_score(y, 'predD', k, cv, seed, n_permutations)
+        elif score == 'F1':
+            result = _permutation_score(y, 'F1', k, cv, seed, n_permutations)
+        else:
+            raise ValueError('Unknown score {}'.format(score))
+
+    _baseline_cache[key] = result
+    return result
@@ -0,0 +1,172 @@
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import contextlib
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+#taille maximale des benchmarks des moteurs scikit-learn, trop lents au dela
+SKLEARN_MAX_SIZE = 20000
+
+
+def make_synthetic_latent(n_days, latent_dim=4, separation=2., noise=1., seed=0):
+    """
+    Synthetic latent space with a controlled cluster structure and the matching labels: the latent code of a day
+    is the sum of a center for its weekday, a center for its month and a direction proportional to its
+    temperature, plus gaussian noise. separation scales the centers relative to the noise.
+
+    :return: x_reduced, calendar_info, daily_aggregates
+    """
+    rng = np.random.RandomState(seed)
+    #les dates sont repetees tous les 100 ans pour rester dans les bornes des Timestamp pandas
+    ds = pd.Timestamp('2012-01-01') + pd.to_timedelta(np.arange(n_days) % 36500, unit='D')
+    ds = pd.Series(ds)
+    calendar_info = pd.DataFrame({'ds': ds,
+                                  'month': ds.dt.month,
+                                  'weekday': ds.dt.weekday,
+                                  'is_weekday': (ds.dt.weekday < 5).astype(int),
+                                  'is_holiday_day': (rng.rand(n_days) < 0.03).astype(int)})
+
+    season = np.cos(2 * np.pi * (ds.dt.dayofyear.values - 15) / 365.)
+    temperature_mean = 12 - 8 * season + 3 * rng.randn(n_days)
+    amplitude = 4 + rng.rand(n_days) * 4
+    daily_aggregates = pd.DataFrame({'ds': ds,
+                                     'temperature_France_min': temperature_mean - amplitude / 2,
+                                     'temperature_France_mean': temperature_mean,
+                                     'temperature_France_max': temperature_mean + amplitude / 2})
+
+    weekday_centers = rng.randn(7, latent_dim) * separation
+    month_centers = rng.randn(12, latent_dim) * separation / 2.
+    temperature_direction = rng.randn(latent_dim)
+    temperature_direction /= np.linalg.norm(temperature_direction)
+    x_reduced = (weekday_centers[calendar_info['weekday'].values]
+                 + month_centers[calendar_info['month'].values - 1]
+                 + np.outer((temperature_mean - 12) / 8., temperature_direction) * separation
+                 + rng.randn(n_days, latent_dim) * noise)
+    return x_reduced, calendar_info, daily_aggregates
+
+
+def _benchmarks():
+    """
+    :return: dict name -> (function(x_reduced, calendar_info, daily_aggregates), maximal size)
+    """
+    from FeaturesScore.scoring import scoreKnnResults, predictFeaturesInLatentSPace
+    from FeaturesScore.neighbors import NeighborGraph
+
+    def predict(engine, cv):
+        return lambda x, calendar_info, daily_aggregates: predictFeaturesInLatentSPace(
+            None, calendar_info, x, k=5, cv=cv, engine=engine, daily_aggregates=daily_aggregates)
+
+    return {'scoreKnnResults_weekday': (lambda x, c, a: scoreKnnResults(x, c['weekday'].values, k=5, cv=10), SKLEARN_MAX_SIZE),
+            'neighbor_graph': (lambda x, c, a: NeighborGraph(x, k=5), None),
+            'predict_sklearn_cv10': (predict('sklearn', 10), SKLEARN_MAX_SIZE),
+            'predict_graph_cv10': (predict('graph', 10), None),
+            'predict_graph_loo': (predict('graph', 'loo'), None)}
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run(function, x_reduced, calendar_info, daily_aggregates):
+    #les fonctions de scoring affichent leurs resultats
+    with contextlib.redirect_stdout(io.StringIO()):
+        function(x_reduced, calendar_info, daily_aggregates)
+
+
+def runBenchmarks(sizes=[1000, 10000, 100000, 1000000], names=None, latent_dim=4, repeat=1, output_path=None):
+    """
+    Time the scoring functions on synthetic latent spaces and measure their peak memory with tracemalloc, in an
+    extra run that is not timed.
+
+    :param sizes: numbers of days
+    :param names: benchmarks to run, all if None
+    :param repeat: number of timed runs of each benchmark, the best time is kept
+    :param output_path: json file receiving the results
+    :return: dict with the environment (commit, versions) and one result per benchmark and size
+    """
+    import sklearn
+
+    benchmarks = _benchmarks()
+    names = names or list(benchmarks)
+    results = []
+    for n_days in sizes:
+        x_reduced, calendar_info, daily_aggregates = make_synthetic_latent(n_days, latent_dim=latent_dim)
+        for name in names:
+            function, max_size = benchmarks[name]
+            if max_size is not None and n_days > max_size:
+                continue
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                _run(function, x_reduced, calendar_info, daily_aggregates)
+                times.append(time.perf_counter() - start)
+            #tracemalloc ralentit les allocations : la memoire est mesuree dans un run separe, non chronometre
+            tracemalloc.start()
+            _run(function, x_reduced, calendar_info, daily_aggregates)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            seconds = min(times)
+            results.append({'benchmark': name, 'n_days': n_days, 'latent_dim': latent_dim, 'seconds': seconds,
+                            'days_per_second': n_days / seconds, 'peak_memory_mb': peak / 2. ** 20})
+            print('{:<28} n={:<9} {:>9.3f}s {:>12.0f} days/s {:>9.1f} MB'.format(
+                name, n_days, seconds, n_days / seconds, peak / 2. ** 20))
+
+    report = {'commit': _git_commit(),
+              'date': datetime.datetime.now().isoformat(),
+              'python': sys.version.split()[0],
+              'numpy': np.__version__,
+              'pandas': pd.__version__,
+              'sklearn': sklearn.__version__,
+              'platform': platform.platform(),
+              'results': results}
+    if output_path is not None:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def compareBenchmarks(reference_path, new_path):
+    """
+    :return: dataframe of the time and memory ratios new / reference for the benchmarks present in both files
+    """
+    frames = []
+    for path in [reference_path, new_path]:
+        with open(path, 'r') as f:
+            frames.append(pd.DataFrame(json.load(f)['results']).set_index(['benchmark', 'n_days']))
+    reference, new = frames
+    common = reference.index.intersection(new.index)
+    return pd.DataFrame({'reference_s': reference.loc[common, 'seconds'],
+                         'new_s': new.loc[common, 'seconds'],
+                         'time_ratio': new.loc[common, 'seconds'] / reference.loc[common, 'seconds'],
+                         'memory_ratio': new.loc[common, 'peak_memory_mb'] / reference.loc[common, 'peak_memory_mb']})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the latent space scoring on synthetic data')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--benchmarks', nargs='+', default=None)
+    parser.add_argument('--latent-dim', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', default=None, help='reference results file to compare the new results with')
+    args = parser.parse_args()
+
+    runBenchmarks(args.sizes, args.benchmarks, latent_dim=args.latent_dim, repeat=args.repeat, output_path=args.output)
+    if args.compare is not None:
+        print(compareBenchmarks(args.compare, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import io
+import os
+import time
+import argparse
+import itertools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+FEATURES = ['is_weekday', 'weekday', 'month', 'is_holiday_day', 'temperature']
+ODD_DAYS = ['oddWeekdays', 'oddHolidays', 'oddTemp']
+
+
+def calendarFromMetaData(metadata):
+    """
+    Rebuild the calendar information and the daily temperature aggregates used by predictFeaturesInLatentSPace
+    from a projector metadata file. The files only give the daily min and max temperatures, the mean
+    temperature is approximated by their mid-range.
+
+    :param metadata: dataframe read with readMetaData
+    :return: calendar_info, daily_aggregates
+    """
+    calendar_info = pd.DataFrame({'ds': pd.to_datetime(metadata['Date']),
+                                  'month': metadata['Month'].astype(int),
+                                  'weekday': metadata['WeekDay'].astype(int),
+                                  'is_weekday': metadata['is_WeekDay'].astype(int),
+                                  'is_holiday_day': (metadata['Holiday'] == 'Holiday').astype(int)})
+    temperature_max = metadata['MaxTemperature'].astype(float)
+    temperature_min = metadata['MinTemperature'].astype(float)
+    daily_aggregates = pd.DataFrame({'ds': calendar_info['ds'],
+                                     'temperature_France_min': temperature_min,
+                                     'temperature_France_mean': (temperature_max + temperature_min) / 2.,
+                                     'temperature_France_max': temperature_max})
+    return calendar_info, daily_aggregates
+
+
+def scoreProjector(projector_dir, k=5, cv=10, engine='graph', verbose=False):
+    """
+    Load the latent codes of a projector folder and score them with predictFeaturesInLatentSPace.
+
+    :param verbose: let predictFeaturesInLatentSPace print its tables, which interleave when the models are scored in parallel
+
+    :return: dict with the model name, the scores of the model and of the random baseline, the odd days and the timings
+    """
+    from Visualisation.projector_reader import loadProjectorEmbeddings
+    from FeaturesScore.scoring import predictFeaturesInLatentSPace
+
+    start = time.perf_counter()
+    embedding = loadProjectorEmbeddings(projector_dir)[0]
+    calendar_info, daily_aggregates = calendarFromMetaData(embedding['metadata'])
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+        results = predictFeaturesInLatentSPace(None, calendar_info, np.asarray(embedding['tensor'], dtype=np.float64),
+                                               k=k, cv=cv, engine=engine, daily_aggregates=daily_aggregates)
+    score_time = time.perf_counter() - start
+
+    df = results['dataFrame']
+    return {'model': os.path.basename(os.path.normpath(projector_dir)),
+            'n_days': embedding['tensor'].shape[0],
+            'latent_dim': embedding['tensor'].shape[1],
+            'scores': df.loc['score model'].to_dict(),
+            'random': df.loc['random model'].to_dict(),
+            'odd_days': {name: [str(pd.Timestamp(d).date()) for d in results[name]] for name in ODD_DAYS},
+            'load_s': load_time,
+            'score_s': score_time}
+
+
+def _score_projector(args):
+    return scoreProjector(*args)
+
+
+def compareProjectors(projector_dirs, output_path=None, k=5, cv=10, engine='graph', max_workers=None):
+    """
+    Score many projector folders concurrently in a process pool and gather the results in one table.
+
+    :param projector_dirs: folders written by buildProjector
+    :param output_path: csv file of the comparison table, the overlap of the odd days is written next to it with an _overlap suffix
+    :param max_workers: number of processes, the models are scored sequentially if 1
+    :return: comparison dataframe (one row per model) and overlap dataframe (one row per pair of models and type of odd days)
+    """
+    start = time.perf_counter()
+    args = [(d, k, cv, engine) for d in projector_dirs]
+    if max_workers == 1:
+        results = [_score_projector(a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_score_projector, args))
+    total_time = time.perf_counter() - start
+
+    rows = []
+    for r in results:
+        row = {'model': r['model'], 'n_days': r['n_days'], 'latent_dim': r['latent_dim']}
+        for feature in FEATURES:
+            row[feature + '_score'] = r['scores'][feature]
+            row[feature + '_random'] = r['random'][feature]
+        for name in ODD_DAYS:
+            row['n_' + name] = len(r['odd_days'][name])
+            row[name] = ';'.join(r['odd_days'][name])
+        row['load_s'] = r['load_s']
+        row['score_s'] = r['score_s']
+        rows.append(row)
+    report = pd.DataFrame(rows)
+    report.attrs['total_s'] = total_time
+
+    overlap_rows = []
+    for a, b in itertools.combinations(results, 2):
+        for name in ODD_DAYS:
+            days_a, days_b = set(a['odd_days'][name]), set(b['odd_days'][name])
+            union = days_a | days_b
+            overlap_rows.append({'model_a': a['model'], 'model_b': b['model'], 'odd_days': name,
+                                 'n_common': len(days_a & days_b),
+                                 'jaccard': len(days_a & days_b) / float(len(union)) if union else np.nan})
+    overlap = pd.DataFrame(overlap_rows, columns=['model_a', 'model_b', 'odd_days', 'n_common', 'jaccard'])
+
+    if output_path is not None:
+        report.to_csv(output_path, index=False)
+        overlap.to_csv(os.path.splitext(output_path)[0] + '_overlap.csv', index=False)
+    print('{} models scored in {:.2f}s'.format(len(results), total_time))
+    return report, overlap
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score the latent spaces of many projector folders and compare them')
+    parser.add_argument('folders', nargs='+', help='projector folders, or parent folders of projector folders')
+    parser.add_argument('--output', default='models_comparison.csv')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--cv', default='10', help="number of folds or 'loo'")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    projector_dirs = []
+    for folder in args.folders:
+        if os.path.isfile(os.path.join(folder, 'projector_config.pbtxt')):
+            projector_dirs.append(folder)
+        else:
+            projector_dirs += sorted(os.path.join(folder, d) for d in os.listdir(folder)
+                                     if os.path.isfile(os.path.join(folder, d, 'projector_config.pbtxt')))
+    cv = args.cv if args.cv == 'loo' else int(args.cv)
+    compareProjectors(projector_dirs, args.output, k=args.k, cv=cv, max_workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
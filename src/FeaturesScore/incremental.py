@@ -0,0 +1,221 @@
+import numpy as np
+import pandas as pd
+
+from FeaturesScore.neighbors import NeighborGraph, vote_counts
+from FeaturesScore.baseline import randomKnnScore
+
+#seuil de probabilite de la vraie classe en dessous duquel un jour est atypique, comme dans predictFeaturesInLatentSPace
+ODD_PROBABILITY = 0.3
+
+#percentile de l'erreur de prediction de la temperature au dela duquel un jour est atypique
+ODD_TEMPERATURE_PERCENTILE = 95
+
+
+class _ClassifierTarget():
+    """
+    Leave-one-out knn predictions of one categorical target and the counts of its scores.
+    """
+    def __init__(self, labels, k):
+        self.k = k
+        self.classes = {}
+        self.codes = np.zeros(0, dtype=np.int64)
+        self.pred = np.zeros(0, dtype=np.int64)
+        self.true_prob = np.zeros(0)
+        self.tp = np.zeros(0, dtype=np.int64)
+        self.n_true = np.zeros(0, dtype=np.int64)
+        self.n_pred = np.zeros(0, dtype=np.int64)
+        self.append_labels(labels)
+
+    @property
+    def n_classes(self):
+        return len(self.classes)
+
+    def append_labels(self, labels):
+        codes = []
+        for label in labels:
+            codes.append(self.classes.setdefault(label, len(self.classes)))
+        codes = np.array(codes, dtype=np.int64)
+        grow = self.n_classes - len(self.tp)
+        if grow > 0:
+            self.tp, self.n_true, self.n_pred = [np.concatenate((a, np.zeros(grow, dtype=np.int64)))
+                                                 for a in (self.tp, self.n_true, self.n_pred)]
+        self.codes = np.concatenate((self.codes, codes))
+        self.pred = np.concatenate((self.pred, np.full(len(codes), -1, dtype=np.int64)))
+        self.true_prob = np.concatenate((self.true_prob, np.zeros(len(codes))))
+        np.add.at(self.n_true, codes, 1)
+
+    def update(self, rows, neighbors):
+        """
+        Replace the predictions of the given rows from their new neighbor lists.
+        """
+        old = self.pred[rows]
+        known = old >= 0
+        np.subtract.at(self.n_pred, old[known], 1)
+        np.subtract.at(self.tp, old[known & (old == self.codes[rows])], 1)
+
+        #la classe la plus petite gagne les egalites ; les codes suivent l'ordre d'apparition des labels
+        order = np.argsort(list(self.classes.keys()))
+        rank = np.empty(self.n_classes, dtype=np.int64)
+        rank[order] = np.arange(self.n_classes)
+        counts = vote_counts(rank[self.codes[neighbors]], self.n_classes)
+        pred = order[np.argmax(counts, axis=1)]
+        self.pred[rows] = pred
+        self.true_prob[rows] = counts[np.arange(len(rows)), rank[self.codes[rows]]] / float(self.k)
+        np.add.at(self.n_pred, pred, 1)
+        np.add.at(self.tp, pred[pred == self.codes[rows]], 1)
+
+    def accuracy(self):
+        return self.tp.sum() / float(len(self.codes))
+
+    def f1_macro(self):
+        present = (self.n_true + self.n_pred) > 0
+        f1 = 2 * self.tp / np.maximum(self.n_true + self.n_pred, 1).astype(float)
+        return f1[present].mean()
+
+
+class _RegressorTarget():
+    """
+    Leave-one-out knn predictions of one continuous target and the sums of its R2.
+    """
+    def __init__(self, values, k):
+        self.k = k
+        self.values = np.zeros(0)
+        self.pred = np.zeros(0)
+        self.sq_error = np.zeros(0)
+        self.ss_res = 0.
+        #sommes courantes des valeurs et de leurs carres pour la variance totale du R2
+        self.sum = 0.
+        self.sum_sq = 0.
+        self.append_labels(values)
+
+    def append_labels(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.values = np.concatenate((self.values, values))
+        self.sum += values.sum()
+        self.sum_sq += np.sum(values ** 2)
+        self.pred = np.concatenate((self.pred, np.zeros(len(values))))
+        self.sq_error = np.concatenate((self.sq_error, np.zeros(len(values))))
+
+    def update(self, rows, neighbors):
+        self.ss_res -= self.sq_error[rows].sum()
+        self.pred[rows] = self.values[neighbors].mean(axis=1)
+        self.sq_error[rows] = (self.values[rows] - self.pred[rows]) ** 2
+        self.ss_res += self.sq_error[rows].sum()
+
+    def r2(self):
+        ss_tot = self.sum_sq - self.sum ** 2 / len(self.values)
+        return 1 - self.ss_res / ss_tot
+
+
+class IncrementalLatentScorer():
+    """
+    Leave-one-out latent feature scores and odd days, maintained when new days are appended.
+
+    Each append computes the distances between the new days and all the stored days in one matrix product, so it
+    still grows with the history: O(new days * n * d) for the distances and O(n) to extend the arrays. Only the new
+    days and the existing days whose k nearest neighbors change (a new day closer than their current k-th neighbor)
+    get new neighbor lists and votes, and the score counts and R2 sums are updated from these rows only, instead of
+    refitting the knn of every day. odd_days takes a percentile over all the days, in O(n).
+    The scores are the ones of predictFeaturesInLatentSPace with cv='loo'.
+    """
+    def __init__(self, x_reduced, calendar_info, daily_aggregates, k=5):
+        """
+
+        :param x_reduced: latent codes of the days
+        :param calendar_info: calendar information of the days (ds, is_weekday, weekday, month, is_holiday_day)
+        :param daily_aggregates: daily temperature aggregates from get_daily_aggregates, aligned with calendar_info
+        """
+        self.k = k
+        self.x = np.asarray(x_reduced, dtype=np.float64)
+        self.ds = list(calendar_info['ds'])
+        labels = self._labels(calendar_info, daily_aggregates)
+        self.targets = {name: _ClassifierTarget(labels[name], k) for name in ['is_weekday', 'weekday', 'month', 'is_holiday_day']}
+        self.targets['temperature'] = _RegressorTarget(labels['temperature'], k)
+
+        graph = NeighborGraph(self.x, k=k, n_candidates=k + 1)
+        self.neighbors = graph.loo_neighbors()
+        self.sq_distances = np.sum((self.x[:, None, :] - self.x[self.neighbors]) ** 2, axis=2)
+        self._update_targets(np.arange(self.x.shape[0]))
+
+    def _labels(self, calendar_info, daily_aggregates):
+        n = calendar_info.shape[0]
+        return {'is_weekday': np.asarray(calendar_info['is_weekday']).astype(int),
+                'weekday': np.asarray(calendar_info['weekday']).astype(int),
+                'month': np.asarray(calendar_info['month']).astype(int),
+                'is_holiday_day': np.asarray(calendar_info['is_holiday_day']).astype(int),
+                'temperature': np.asarray(daily_aggregates['temperature_France_mean'])[:n]}
+
+    def _update_targets(self, rows):
+        for target in self.targets.values():
+            target.update(rows, self.neighbors[rows])
+
+    def append(self, x_new, calendar_new, aggregates_new):
+        """
+        :param x_new: latent codes of the new days
+        :param calendar_new: calendar information of the new days
+        :param aggregates_new: daily temperature aggregates of the new days
+        :return: indices of the existing days whose neighbor lists changed
+        """
+        x_new = np.asarray(x_new, dtype=np.float64)
+        n_old, m = self.x.shape[0], x_new.shape[0]
+        new_ids = np.arange(n_old, n_old + m)
+        k = self.k
+
+        sq_old = np.maximum(np.sum(x_new ** 2, axis=1)[:, None] + np.sum(self.x ** 2, axis=1)[None, :]
+                            - 2 * np.dot(x_new, self.x.T), 0)
+        sq_new = np.sum((x_new[:, None, :] - x_new[None, :, :]) ** 2, axis=2)
+        np.fill_diagonal(sq_new, np.inf)
+
+        #voisins des nouveaux jours parmi tous les jours
+        sq_all = np.concatenate((sq_old, sq_new), axis=1)
+        order = np.argsort(sq_all, axis=1, kind='stable')[:, :k]
+        new_neighbors = order
+        new_sq = np.take_along_axis(sq_all, order, axis=1)
+
+        #jours existants dont un nouveau jour devient l'un des k plus proches voisins
+        closer = sq_old < self.sq_distances[:, -1][None, :]
+        affected = np.where(closer.any(axis=0))[0]
+        if len(affected):
+            candidates_sq = np.concatenate((self.sq_distances[affected], sq_old[:, affected].T), axis=1)
+            candidates = np.concatenate((self.neighbors[affected], np.broadcast_to(new_ids, (len(affected), m))), axis=1)
+            order = np.argsort(candidates_sq, axis=1, kind='stable')[:, :k]
+            self.neighbors[affected] = np.take_along_axis(candidates, order, axis=1)
+            self.sq_distances[affected] = np.take_along_axis(candidates_sq, order, axis=1)
+
+        self.x = np.concatenate((self.x, x_new))
+        self.neighbors = np.concatenate((self.neighbors, new_neighbors))
+        self.sq_distances = np.concatenate((self.sq_distances, new_sq))
+        self.ds += list(calendar_new['ds'])
+        labels = self._labels(calendar_new, aggregates_new)
+        for name, target in self.targets.items():
+            target.append_labels(labels[name])
+        self._update_targets(np.concatenate((affected, new_ids)))
+        return affected
+
+    def scores(self):
+        """
+        :return: dataframe with the scores of the model and of the random baseline, as predictFeaturesInLatentSPace
+        """
+        t = self.targets
+        holidays = np.where(t['is_holiday_day'].codes == t['is_holiday_day'].classes.get(1, -1))[0]
+        model = [t['is_weekday'].f1_macro(), t['weekday'].accuracy(), t['month'].accuracy(),
+                 np.mean(t['is_holiday_day'].true_prob[holidays]), t['temperature'].r2()]
+        labels = {name: np.array(list(target.classes))[target.codes] for name, target in t.items() if name != 'temperature'}
+        random = [randomKnnScore(labels['is_weekday'], 'F1', k=self.k, cv='loo'),
+                  randomKnnScore(labels['weekday'], 'accuracy', k=self.k, cv='loo'),
+                  randomKnnScore(labels['month'], 'accuracy', k=self.k, cv='loo'),
+                  randomKnnScore(labels['is_holiday_day'], 'predP', k=self.k, cv='loo', indices=holidays),
+                  randomKnnScore(t['temperature'].values, 'r2', k=self.k, cv='loo')]
+        return pd.DataFrame([model, random], columns=['is_weekday', 'weekday', 'month', 'is_holiday_day', 'temperature'],
+                            index=['score model', 'random model'])
+
+    def odd_days(self):
+        """
+        :return: dict with the dates of the oddWeekdays, oddHolidays and oddTemp days
+        """
+        ds = pd.Series(self.ds)
+        temperature = self.targets['temperature']
+        error = np.sqrt(temperature.sq_error)
+        return {'oddWeekdays': ds[self.targets['is_weekday'].true_prob <= ODD_PROBABILITY],
+                'oddHolidays': ds[self.targets['is_holiday_day'].true_prob <= ODD_PROBABILITY],
+                'oddTemp': ds[error >= np.percentile(error, ODD_TEMPERATURE_PERCENTILE)]}
@@ -0,0 +1,350 @@
+import hashlib
+import numpy as np
+
+
+def cv_folds(x, y, cv=10, type='classifier'):
+    """
+    Fold of each point, with the same splits as cross_val_score for an integer cv:
+    StratifiedKFold for a classifier, KFold for a regressor.
+
+    :return: array (n,) of fold indices
+    """
+    from sklearn.model_selection import StratifiedKFold, KFold
+
+    splitter = StratifiedKFold(n_splits=cv) if type == 'classifier' else KFold(n_splits=cv)
+    folds = np.empty(len(y), dtype=np.int64)
+    for f, (_, test) in enumerate(splitter.split(x, y)):
+        folds[test] = f
+    return folds
+
+
+def _sq_distances(a, b, b_sq=None):
+    if b_sq is None:
+        b_sq = np.sum(b ** 2, axis=1)
+    sq = np.sum(a ** 2, axis=1)[:, None] + b_sq[None, :] - 2 * np.dot(a, b.T)
+    return np.maximum(sq, 0)
+
+
+#nombre maximal d'elements des matrices de distances calculees par bloc
+BLOCK_ELEMENTS = 2 ** 23
+
+#taille au-dela de laquelle le backend 'auto' n'utilise plus la recherche exacte par force brute
+BRUTE_MAX_POINTS = 50000
+
+#au dela de ce nombre de points, l'arbre KD est plus rapide que la force brute en dimension au plus TREE_MAX_DIM
+TREE_MIN_POINTS = 5000
+TREE_MAX_DIM = 10
+
+
+def _smallest(sq, idx, k):
+    """
+    :return: the k smallest squared distances of each row and their indices, not sorted
+    """
+    if sq.shape[1] > k:
+        part = np.argpartition(sq, k - 1, axis=1)[:, :k]
+        return np.take_along_axis(sq, part, axis=1), np.take_along_axis(idx, part, axis=1)
+    return sq, idx
+
+
+def _sorted(sq, idx):
+    order = np.argsort(sq, axis=1, kind='stable')
+    return np.sqrt(np.take_along_axis(sq, order, axis=1)), np.take_along_axis(idx, order, axis=1)
+
+
+class BruteForceIndex():
+    """
+    Exact search with distance matrices computed by blocks of queries and of points (matrix products),
+    keeping a running top-k so that the memory stays bounded whatever the number of points.
+    """
+    name = 'brute'
+
+    def __init__(self, x, block_elements=BLOCK_ELEMENTS):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.x_sq = np.sum(self.x ** 2, axis=1)
+        self.block_elements = block_elements
+
+    def query(self, queries, k):
+        """
+        :return: distances and indices (n_queries, k) of the k nearest points, by increasing distance, as NearestNeighbors.kneighbors
+        """
+        queries = np.asarray(queries, dtype=np.float64)
+        n = self.x.shape[0]
+        k = min(k, n)
+        query_block = max(1, min(queries.shape[0], 1024))
+        point_block = max(k, self.block_elements // query_block)
+        distances = np.empty((queries.shape[0], k))
+        indices = np.empty((queries.shape[0], k), dtype=np.int64)
+        for start in range(0, queries.shape[0], query_block):
+            q = queries[start:start + query_block]
+            best_sq = np.empty((q.shape[0], 0))
+            best_idx = np.empty((q.shape[0], 0), dtype=np.int64)
+            for p in range(0, n, point_block):
+                #la norme des requetes ne change pas le classement, elle n'est ajoutee qu'aux k plus proches
+                sq = np.dot(q, self.x[p:p + point_block].T)
+                sq *= -2
+                sq += self.x_sq[p:p + point_block]
+                idx = np.broadcast_to(np.arange(p, p + sq.shape[1]), sq.shape)
+                sq, idx = _smallest(sq, idx, k)
+                best_sq, best_idx = _smallest(np.concatenate((best_sq, sq), axis=1),
+                                              np.concatenate((best_idx, idx), axis=1), k)
+            best_sq = np.maximum(best_sq + np.sum(q ** 2, axis=1)[:, None], 0)
+            distances[start:start + q.shape[0]], indices[start:start + q.shape[0]] = _sorted(best_sq, best_idx)
+        return distances, indices
+
+
+class TreeIndex():
+    """
+    Exact search with the KD tree or ball tree of scikit-learn, efficient for low dimensional latent spaces.
+    """
+    def __init__(self, x, algorithm='kd_tree', leaf_size=40):
+        from sklearn.neighbors import NearestNeighbors
+
+        self.name = algorithm
+        self.nn = NearestNeighbors(algorithm=algorithm, leaf_size=leaf_size).fit(np.asarray(x, dtype=np.float64))
+
+    def query(self, queries, k):
+        return self.nn.kneighbors(np.asarray(queries, dtype=np.float64), n_neighbors=min(k, self.nn.n_samples_fit_))
+
+
+class IVFIndex():
+    """
+    Approximate search with an inverted file: the points are clustered by k-means into n_lists lists and
+    a query only scans the points of its nprobe closest lists. nprobe trades recall for latency,
+    nprobe = n_lists is an exact search.
+    """
+    name = 'ivf'
+
+    def __init__(self, x, n_lists=None, nprobe=8, n_iter=10, seed=0):
+        self.x = np.asarray(x, dtype=np.float64)
+        n = self.x.shape[0]
+        self.n_lists = max(1, min(n, n_lists or int(np.sqrt(n))))
+        self.nprobe = nprobe
+        rng = np.random.RandomState(seed)
+
+        #k-means sur un echantillon des points
+        sample = self.x[rng.choice(n, min(n, 64 * self.n_lists), replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], self.n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignment = BruteForceIndex(centroids).query(sample, 1)[1][:, 0]
+            counts = np.bincount(assignment, minlength=self.n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            #les listes vides gardent leur centroide
+            centroids = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centroids)
+        self.centroids = centroids
+
+        assignment = BruteForceIndex(centroids).query(self.x, 1)[1][:, 0]
+        order = np.argsort(assignment, kind='stable')
+        self.list_indices = order
+        self.list_bounds = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=self.n_lists))))
+        self.x_sq = np.sum(self.x ** 2, axis=1)
+
+    def query(self, queries, k, nprobe=None):
+        queries = np.asarray(queries, dtype=np.float64)
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        k = min(k, self.x.shape[0])
+        probes = BruteForceIndex(self.centroids).query(queries, nprobe)[1]
+
+        best_sq = np.full((queries.shape[0], k), np.inf)
+        best_idx = np.full((queries.shape[0], k), -1, dtype=np.int64)
+        #chaque liste est comparee en une fois a toutes les requetes qui la visitent
+        probing = np.argsort(probes.ravel(), kind='stable')
+        bounds = np.searchsorted(probes.ravel()[probing], np.arange(self.n_lists + 1))
+        for l in range(self.n_lists):
+            query_ids = probing[bounds[l]:bounds[l + 1]] // nprobe
+            points = self.list_indices[self.list_bounds[l]:self.list_bounds[l + 1]]
+            if len(query_ids) == 0 or len(points) == 0:
+                continue
+            sq = _sq_distances(queries[query_ids], self.x[points], self.x_sq[points])
+            sq, idx = _smallest(sq, np.broadcast_to(points, sq.shape), k)
+            best_sq[query_ids], best_idx[query_ids] = _smallest(np.concatenate((best_sq[query_ids], sq), axis=1),
+                                                                np.concatenate((best_idx[query_ids], idx), axis=1), k)
+        return _sorted(best_sq, best_idx)
+
+
+def build_index(x, backend='auto', **kwargs):
+    """
+    :param x: points (n, d)
+    :param backend: 'brute', 'kd_tree', 'ball_tree', 'ivf' or 'auto': KD tree for low dimensional sets of more
+                    than a few thousand points, exact brute force for the other small sets, approximate IVF index otherwise
+    :param kwargs: parameters of the index, e.g. nprobe for 'ivf'
+    :return: index with a query(queries, k) method returning (distances, indices)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if backend == 'auto':
+        if x.shape[1] <= TREE_MAX_DIM and x.shape[0] > TREE_MIN_POINTS:
+            backend = 'kd_tree'
+        elif x.shape[0] <= BRUTE_MAX_POINTS:
+            backend = 'brute'
+        else:
+            backend = 'ivf'
+    if backend == 'brute':
+        return BruteForceIndex(x, **kwargs)
+    if backend in ['kd_tree', 'ball_tree']:
+        return TreeIndex(x, algorithm=backend, **kwargs)
+    if backend == 'ivf':
+        return IVFIndex(x, **kwargs)
+    raise ValueError('Unknown neighbor backend {}'.format(backend))
+
+
+def benchmark_backends(x, queries=None, k=10, backends=['brute', 'kd_tree', 'ball_tree', 'ivf'], nprobes=[1, 4, 16], n_queries=1000, seed=0):
+    """
+    Compare the build time, the query latency and the recall of the neighbor backends on a latent space.
+
+    :param x: points (n, d)
+    :param queries: query points, n_queries points of x drawn at random if None
+    :param nprobes: values of nprobe tested for the 'ivf' backend
+    :return: dataframe with one row per backend setting
+    """
+    import time
+    import pandas as pd
+
+    x = np.asarray(x, dtype=np.float64)
+    if queries is None:
+        rng = np.random.RandomState(seed)
+        queries = x[rng.choice(x.shape[0], min(n_queries, x.shape[0]), replace=False)]
+    reference = BruteForceIndex(x).query(queries, k)[1]
+
+    rows = []
+    for backend in backends:
+        start = time.perf_counter()
+        index = build_index(x, backend=backend)
+        build_time = time.perf_counter() - start
+        settings = [{'nprobe': nprobe} for nprobe in nprobes] if backend == 'ivf' else [{}]
+        for setting in settings:
+            start = time.perf_counter()
+            indices = index.query(queries, k, **setting)[1]
+            query_time = time.perf_counter() - start
+            recall = np.mean([len(np.intersect1d(a, b)) for a, b in zip(indices, reference)]) / k
+            rows.append(dict({'backend': backend, 'build_s': build_time, 'query_s': query_time,
+                              'latency_ms': 1000 * query_time / len(queries), 'queries_per_s': len(queries) / query_time,
+                              'recall': recall}, **setting))
+    return pd.DataFrame(rows)
+
+
+class NeighborGraph():
+    """
+    k-nearest neighbor graph of a latent space, computed once and shared by all the targets scored on it.
+
+    A single query of n_candidates neighbors is made on the whole dataset. For a cross-validation split,
+    the neighbors of a point are its first k candidates that are not in its own fold, which are exactly
+    its k nearest neighbors in the training folds. The points with less than k candidates outside of their
+    fold (most of them when the folds are contiguous blocks of time correlated codes) are queried in one batch
+    per fold against an index of the training folds.
+    """
+    def __init__(self, x, k=5, n_candidates=None, backend='auto', **index_kwargs):
+        """
+
+        :param x: latent codes (n, d)
+        :param k: number of neighbors used for the predictions
+        :param n_candidates: number of neighbors of the global query, 4*k by default, k+1 is enough for leave-one-out scores only
+        :param backend: neighbor search backend, see build_index
+        """
+        self.x = np.asarray(x, dtype=np.float64)
+        if self.x.ndim == 1:
+            self.x = self.x[:, None]
+        self.k = k
+        n = self.x.shape[0]
+        self.n_candidates = min(n, n_candidates or 4 * k)
+        self.backend = backend
+        self.index_kwargs = index_kwargs
+        self.index = build_index(self.x, backend=backend, **index_kwargs)
+        self.distances, self.indices = self.index.query(self.x, self.n_candidates)
+        self._split_neighbors = {}
+
+    def fold_neighbors(self, folds):
+        """
+        :param folds: fold of each point, see cv_folds
+        :return: array (n, k) of the indices of the k nearest neighbors of each point outside of its fold, by increasing distance
+        """
+        folds = np.asarray(folds)
+        key = hashlib.sha1(folds.tobytes()).hexdigest()
+        if key not in self._split_neighbors:
+            neighbors, incomplete = self._neighbors_outside(self.indices, folds[self.indices] != folds[:, None])
+            #un index par fold d'entrainement, interroge en une fois par les points incomplets du fold
+            for f in np.unique(folds[incomplete]):
+                queries = incomplete[folds[incomplete] == f]
+                train = np.where(folds != f)[0]
+                index = build_index(self.x[train], backend=self.backend, **self.index_kwargs)
+                neighbors[queries] = train[index.query(self.x[queries], self.k)[1]]
+            self._split_neighbors[key] = neighbors
+        return self._split_neighbors[key]
+
+    def loo_neighbors(self):
+        """
+        :return: array (n, k) of the indices of the k nearest neighbors of each point other than itself, for a leave-one-out score
+        """
+        if 'loo' not in self._split_neighbors:
+            n = self.x.shape[0]
+            #le point lui-meme est retire par son indice, pas par sa position, en cas de doublons
+            neighbors, incomplete = self._neighbors_outside(self.indices, self.indices != np.arange(n)[:, None])
+            #les points avec plus de k doublons sont interroges a nouveau avec deux fois plus de candidats
+            n_candidates, index = self.n_candidates, self.index
+            while len(incomplete) > 0 and not (n_candidates == n and isinstance(index, BruteForceIndex)):
+                n_candidates = min(n, 2 * n_candidates)
+                #tous les points sont candidats : recherche exacte, un index approche pourrait en omettre
+                if n_candidates == n:
+                    index = BruteForceIndex(self.x)
+                indices = index.query(self.x[incomplete], n_candidates)[1]
+                found, still_incomplete = self._neighbors_outside(indices, indices != incomplete[:, None])
+                neighbors[incomplete] = found
+                incomplete = incomplete[still_incomplete]
+            self._split_neighbors['loo'] = neighbors
+        return self._split_neighbors['loo']
+
+    def _neighbors_outside(self, indices, allowed):
+        """
+        :param indices: array (n_queries, n_candidates) of candidate neighbors by increasing distance
+        :param allowed: boolean array of the candidates allowed as neighbors
+        :return: array (n_queries, k) of the first k allowed candidates, and the rows with less than k of them,
+                 whose neighbors are left to fill
+        """
+        k = self.k
+        #un index approche peut renvoyer moins de candidats (indice -1)
+        allowed = allowed & (indices >= 0)
+        #rang de chaque candidat autorise, les k premiers sont gardes
+        rank = np.cumsum(allowed, axis=1)
+        keep = allowed & (rank <= k)
+        complete = rank[:, -1] >= k
+        neighbors = np.zeros((indices.shape[0], k), dtype=np.int64)
+        neighbors[complete] = indices[complete][keep[complete]].reshape(-1, k)
+        return neighbors, np.where(~complete)[0]
+
+
+def vote_counts(neighbor_codes, n_classes):
+    """
+    :param neighbor_codes: array (n, k) of the class codes of the neighbors
+    :return: array (n, n_classes) of the number of neighbors of each class
+    """
+    n = neighbor_codes.shape[0]
+    flat = neighbor_codes + np.arange(n)[:, None] * n_classes
+    return np.bincount(flat.ravel(), minlength=n * n_classes).reshape(n, n_classes)
+
+
+def fold_accuracy(y_true, y_pred, folds):
+    n_folds = folds.max() + 1
+    return np.bincount(folds, weights=(y_true == y_pred), minlength=n_folds) / np.bincount(folds, minlength=n_folds)
+
+
+def fold_f1_macro(y_true, y_pred, folds, n_classes):
+    """
+    Macro F1 of each fold, averaged over the classes present in the true or predicted labels of the fold as f1_score does.
+    """
+    n_folds = folds.max() + 1
+    tp = np.bincount(folds * n_classes + y_true, weights=(y_true == y_pred), minlength=n_folds * n_classes)
+    n_true = np.bincount(folds * n_classes + y_true, minlength=n_folds * n_classes)
+    n_pred = np.bincount(folds * n_classes + y_pred, minlength=n_folds * n_classes)
+    tp, n_true, n_pred = [a.reshape(n_folds, n_classes) for a in (tp, n_true, n_pred)]
+    present = (n_true + n_pred) > 0
+    f1 = np.where(present, 2 * tp / np.maximum(n_true + n_pred, 1), 0)
+    return f1.sum(axis=1) / present.sum(axis=1)
+
+
+def fold_r2(y_true, y_pred, folds):
+    n_folds = folds.max() + 1
+    counts = np.bincount(folds, minlength=n_folds)
+    means = np.bincount(folds, weights=y_true, minlength=n_folds) / counts
+    ss_res = np.bincount(folds, weights=(y_true - y_pred) ** 2, minlength=n_folds)
+    ss_tot = np.bincount(folds, weights=(y_true - means[folds]) ** 2, minlength=n_folds)
+    #meme convention que r2_score quand la variance du fold est nulle
+    return np.where(ss_tot > 0, 1 - ss_res / np.where(ss_tot > 0, ss_tot, 1), np.where(ss_res == 0, 1., 0.))
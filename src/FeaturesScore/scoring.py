@@ -7,6 +7,10 @@ from sklearn.model_selection import cross_val_score
 import numpy as np
 import pandas as pd
 
+from conso.load_shape_data import get_daily_aggregates
+from FeaturesScore.baseline import randomKnnScore
+from FeaturesScore.neighbors import NeighborGraph, cv_folds, vote_counts, fold_accuracy, fold_f1_macro, fold_r2
+
 def build():
    print("building")
 
@@ -27,10 +31,59 @@ def scoreKnnResults(x,y,type='classifier',k=5,cv=10):
     #print(np.std(probScore))
     #cv_scores.append(scores.mean())
     return({'F1':np.mean(F1),'predD':np.mean(scores),'predP':probScore})
-    
 
-def predictFeaturesInLatentSPace(xconso,calendar_info,x_reduced,k=5,cv=10):
-    
+
+def scoreKnnGraph(graph,y,type='classifier',cv=10):
+    """
+    Same scores as scoreKnnResults, derived from a NeighborGraph shared by all the targets instead of refitting
+    the knn on each fold.
+
+    :param graph: NeighborGraph of the latent space
+    :param cv: number of folds, or 'loo' for exact leave-one-out scores computed on all the points at once
+    :return: dict with the F1 score, the mean score over the folds, the probability of the true class of each point
+    and, for a regressor, the cross-validated predictions
+    """
+    y=np.asarray(y)
+    if(cv=='loo'):
+        #un seul groupe : les scores sont calcules sur l'ensemble des predictions leave-one-out
+        neighbors=graph.loo_neighbors()
+        folds=np.zeros(len(y),dtype=np.int64)
+    else:
+        folds=cv_folds(graph.x,y,cv=cv,type=type)
+        neighbors=graph.fold_neighbors(folds)
+    if(type=='classifier'):
+        classes,codes=np.unique(y,return_inverse=True)
+        counts=vote_counts(codes[neighbors],len(classes))
+        #en cas d'egalite la plus petite classe est predite, comme KNeighborsClassifier
+        pred=np.argmax(counts,axis=1)
+        probScore=list(counts[np.arange(len(y)),codes]/float(graph.k))
+        return({'F1':np.mean(fold_f1_macro(codes,pred,folds,len(classes))),
+                'predD':np.mean(fold_accuracy(codes,pred,folds)),
+                'predP':probScore})
+    y=y.astype(float)
+    predictions=y[neighbors].mean(axis=1)
+    return({'F1':np.nan,'predD':np.mean(fold_r2(y,predictions,folds)),'predP':[],'predictions':predictions})
+
+
+def predictFeaturesInLatentSPace(xconso,calendar_info,x_reduced,k=5,cv=10,engine='graph',daily_aggregates=None,backend='auto',random_baseline='analytic'):
+    """
+    :param cv: number of folds, or 'loo' for leave-one-out scores from a single (k+1)-nearest-neighbor query
+    :param engine: 'graph' to derive all the scores from a single NeighborGraph, 'sklearn' to refit the knn models for each score
+    :param daily_aggregates: daily temperature aggregates from get_daily_aggregates, computed from xconso if None
+    :param backend: neighbor search backend of the graph engine, see FeaturesScore.neighbors.build_index
+    :param random_baseline: 'analytic' for the cached expected scores of randomKnnScore, 'simulation' to score a knn on a new random latent space
+    """
+    n_candidates=None
+    if(cv=='loo'):
+        if(engine!='graph'):
+            raise ValueError("cv='loo' is only available with engine='graph'")
+        n_candidates=k+1
+    if(engine=='graph'):
+        graph=NeighborGraph(x_reduced,k=k,n_candidates=n_candidates,backend=backend)
+        scoreKnn=lambda x,y,type: scoreKnnGraph(graph,y,type=type,cv=cv)
+    else:
+        scoreKnn=lambda x,y,type: scoreKnnResults(x,y,type=type,k=k,cv=cv)
+
     preditionDetermistic=[]
     preditionProbabilistic=[]
     predictionStd=[]
@@ -52,16 +105,18 @@ def predictFeaturesInLatentSPace(xconso,calendar_info,x_reduced,k=5,cv=10):
     yWkday=calendar_info['weekday']
     
 
-    temperatureMax=[max(xconso.loc[index*48:(index+1)*48-1,'temperature_France']) for index in range(0,nPoints)]
-    temperatureMean=[np.mean(xconso.loc[index*48:(index+1)*48-1,'temperature_France']) for index in range(0,nPoints)]
+    if(daily_aggregates is None):
+        daily_aggregates=get_daily_aggregates(xconso,columns=['temperature_France'])
+    temperatureMax=daily_aggregates['temperature_France_max'].values[:nPoints]
+    temperatureMean=daily_aggregates['temperature_France_mean'].values[:nPoints]
     yTemp=temperatureMean
     
     #preparation des classifiers knn
-    results_wd=scoreKnnResults(x_reduced,yWeekday,type='classifier',k=k,cv=cv)
-    results_day=scoreKnnResults(x_reduced,yWkday,type='classifier',k=k,cv=cv)
-    results_month=scoreKnnResults(x_reduced,(yMonth-1),type='classifier',k=k,cv=cv)#variable needs to start at 0
-    results_hd=scoreKnnResults(x_reduced,yHd,type='classifier',k=k,cv=cv)
-    results_temp=scoreKnnResults(x_reduced,yTemp,type='regressor',k=k,cv=cv)
+    results_wd=scoreKnn(x_reduced,yWeekday,type='classifier')
+    results_day=scoreKnn(x_reduced,yWkday,type='classifier')
+    results_month=scoreKnn(x_reduced,(yMonth-1),type='classifier')#variable needs to start at 0
+    results_hd=scoreKnn(x_reduced,yHd,type='classifier')
+    results_temp=scoreKnn(x_reduced,yTemp,type='regressor')
     
     #preditionDetermistic
     preditionDetermistic.append(results_wd['predD'])
@@ -103,8 +158,11 @@ def predictFeaturesInLatentSPace(xconso,calendar_info,x_reduced,k=5,cv=10):
         #oddHolidays=calendar_info['ds'][indicesHd[indicesOddHolidays]]
         oddHolidays=calendar_info['ds'][indicesOddHolidays]
     
-    knn_temp = KNeighborsRegressor(n_neighbors=k)   
-    predictions = cross_val_predict(knn_temp, x_reduced, yTemp, cv=10)
+    if(engine=='graph'):
+        predictions = results_temp['predictions'] if cv in [10,'loo'] else scoreKnnGraph(graph,yTemp,type='regressor',cv=10)['predictions']
+    else:
+        knn_temp = KNeighborsRegressor(n_neighbors=k)
+        predictions = cross_val_predict(knn_temp, x_reduced, yTemp, cv=10)
     error=np.abs(predictions-yTemp)
     stdPercentile=np.percentile(error, 95, axis=0)
     print(stdPercentile)
@@ -121,23 +179,38 @@ def predictFeaturesInLatentSPace(xconso,calendar_info,x_reduced,k=5,cv=10):
     predictionStd.append(0)#predictionStd.append(np.std(np.abs(yTemp-knn_temp.score(x_reduced, yTemp))))
     
     #predictionRandom
-    knn_random = KNeighborsClassifier(n_neighbors=k)
-    x_reduced_random=np.random.rand(nPoints,1)
-    predictionRandom.append(np.mean(cross_val_score(knn_random, x_reduced_random, yWeekday, cv=cv,scoring='f1_macro')))
-    
-    predictionRandom.append(np.mean(cross_val_score(knn_random, x_reduced_random, yWkday, cv=cv)))
-    
-    predictionRandom.append(np.mean(cross_val_score(knn_random, x_reduced_random, yMonth, cv=cv)))
-    
-    proba = np.array(cross_val_predict(knn_random, x_reduced_random, yHd, cv=cv, method='predict_proba'))
-    probScore=[proba[i][yHd[i]] for i in range(0,len(yHd)) ]
-    probScoreHd=np.array(probScore)[indicesHd]
-    predictionRandom.append(np.mean(probScoreHd))
-    
-    knn_random = KNeighborsRegressor(n_neighbors=k)
-    predictionRandom.append(np.mean(cross_val_score(knn_random, x_reduced_random, yTemp, cv=cv)))
-       
-    
+    if(random_baseline=='analytic'):
+        predictionRandom.append(randomKnnScore(yWeekday,'F1',k=k,cv=cv))
+        predictionRandom.append(randomKnnScore(yWkday,'accuracy',k=k,cv=cv))
+        predictionRandom.append(randomKnnScore(yMonth,'accuracy',k=k,cv=cv))
+        predictionRandom.append(randomKnnScore(yHd,'predP',k=k,cv=cv,indices=indicesHd))
+        predictionRandom.append(randomKnnScore(yTemp,'r2',k=k,cv=cv))
+    elif(engine=='graph'):
+        x_reduced_random=np.random.rand(nPoints,1)
+        graph_random=NeighborGraph(x_reduced_random,k=k,n_candidates=n_candidates)
+        predictionRandom.append(scoreKnnGraph(graph_random,yWeekday,type='classifier',cv=cv)['F1'])
+        predictionRandom.append(scoreKnnGraph(graph_random,yWkday,type='classifier',cv=cv)['predD'])
+        predictionRandom.append(scoreKnnGraph(graph_random,yMonth,type='classifier',cv=cv)['predD'])
+        probScore=scoreKnnGraph(graph_random,yHd,type='classifier',cv=cv)['predP']
+        predictionRandom.append(np.mean(np.array(probScore)[indicesHd]))
+        predictionRandom.append(scoreKnnGraph(graph_random,yTemp,type='regressor',cv=cv)['predD'])
+    else:
+        x_reduced_random=np.random.rand(nPoints,1)
+        knn_random = KNeighborsClassifier(n_neighbors=k)
+        predictionRandom.append(np.mean(cross_val_score(knn_random, x_reduced_random, yWeekday, cv=cv,scoring='f1_macro')))
+
+        predictionRandom.append(np.mean(cross_val_score(knn_random, x_reduced_random, yWkday, cv=cv)))
+
+        predictionRandom.append(np.mean(cross_val_score(knn_random, x_reduced_random, yMonth, cv=cv)))
+
+        proba = np.array(cross_val_predict(knn_random, x_reduced_random, yHd, cv=cv, method='predict_proba'))
+        probScore=[proba[i][yHd[i]] for i in range(0,len(yHd)) ]
+        probScoreHd=np.array(probScore)[indicesHd]
+        predictionRandom.append(np.mean(probScoreHd))
+
+        knn_random = KNeighborsRegressor(n_neighbors=k)
+        predictionRandom.append(np.mean(cross_val_score(knn_random, x_reduced_random, yTemp, cv=cv)))
+
     #creation d'une dataFrame pour les résultats
     modelScores=preditionDetermistic
     modelScores[0]=results_wd['F1'] #F1 score for is weekday
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from FeaturesScore.baseline import randomKnnScore, _prediction_probabilities, _baseline_cache
+from FeaturesScore.neighbors import vote_counts
+
+
+def _simulated_loo_accuracy(codes, n_classes, k, n_draws, seed=0):
+    """
+    Accuracy of k neighbors drawn at random among the other points, with the ties going to the smallest class.
+    """
+    rng = np.random.RandomState(seed)
+    n = len(codes)
+    #tirage parmi les n-1 autres points : decalage de 1 a n-1 depuis le point
+    others = (np.arange(n)[:, None, None] + rng.randint(1, n, size=(n, n_draws, k))) % n
+    votes = vote_counts(codes[others].reshape(-1, k), n_classes)
+    pred = np.argmax(votes, axis=1).reshape(n, n_draws)
+    return np.mean(pred == codes[:, None])
+
+
+def test_prediction_probabilities_sum_to_one():
+    priors = np.array([[0.5, 0.3, 0.2], [0.1, 0.1, 0.8]])
+    p = _prediction_probabilities(priors, 5)
+    np.testing.assert_allclose(p.sum(axis=1), 1.)
+    #avec un seul voisin, la classe predite suit la distribution des labels
+    np.testing.assert_allclose(_prediction_probabilities(priors, 1), priors)
+
+
+def test_loo_accuracy_with_one_neighbor_is_exact():
+    codes = np.random.RandomState(0).randint(4, size=500)
+    counts = np.bincount(codes)
+    expected = np.sum(counts * (counts - 1.)) / (len(codes) * (len(codes) - 1.))
+    assert randomKnnScore(codes, 'accuracy', k=1, cv='loo') == pytest.approx(expected, abs=1e-12)
+
+
+def test_loo_accuracy_matches_simulation():
+    codes = np.random.RandomState(1).choice(3, size=400, p=[0.6, 0.3, 0.1])
+    simulated = _simulated_loo_accuracy(codes, 3, k=5, n_draws=200)
+    assert randomKnnScore(codes, 'accuracy', k=5, cv='loo') == pytest.approx(simulated, abs=0.01)
+
+
+def test_loo_r2_matches_simulation():
+    rng = np.random.RandomState(2)
+    y = rng.randn(300) * 3 + 10
+    n, k = len(y), 5
+    others = (np.arange(n)[:, None, None] + rng.randint(1, n, size=(n, 500, k))) % n
+    predictions = y[others].mean(axis=2)
+    ss_res = np.mean(np.sum((y[:, None] - predictions) ** 2, axis=0))
+    simulated = 1 - ss_res / np.sum((y - y.mean()) ** 2)
+    assert randomKnnScore(y, 'r2', k=k, cv='loo') == pytest.approx(simulated, abs=0.01)
+
+
+def test_baseline_is_cached_per_label_set():
+    codes = np.random.RandomState(3).randint(7, size=700)
+    first = randomKnnScore(codes, 'F1', k=5, cv=10)
+    n_cached = len(_baseline_cache)
+    #memes labels dans un autre tableau : le score est relu dans le cache
+    assert randomKnnScore(codes.copy(), 'F1', k=5, cv=10) == first
+    assert len(_baseline_cache) == n_cached
+    randomKnnScore(codes, 'F1', k=3, cv=10)
+    assert len(_baseline_cache) == n_cached + 1
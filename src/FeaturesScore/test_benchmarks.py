@@ -0,0 +1,37 @@
+import json
+import tracemalloc
+
+import numpy as np
+
+from FeaturesScore import benchmarks
+from FeaturesScore.benchmarks import runBenchmarks, compareBenchmarks
+
+
+def test_run_and_compare_benchmarks(tmp_path):
+    output_path = str(tmp_path / 'results.json')
+    report = runBenchmarks(sizes=[300], names=['neighbor_graph', 'predict_graph_cv10'], output_path=output_path)
+    with open(output_path) as f:
+        assert json.load(f)['results'] == report['results']
+    assert [(r['benchmark'], r['n_days']) for r in report['results']] == [('neighbor_graph', 300), ('predict_graph_cv10', 300)]
+    for result in report['results']:
+        assert result['seconds'] > 0 and result['peak_memory_mb'] > 0
+        np.testing.assert_allclose(result['days_per_second'], 300 / result['seconds'])
+
+    comparison = compareBenchmarks(output_path, output_path)
+    assert len(comparison) == 2
+    np.testing.assert_allclose(comparison['time_ratio'], 1.)
+    np.testing.assert_allclose(comparison['memory_ratio'], 1.)
+
+
+def test_timed_runs_are_not_traced(monkeypatch):
+    tracing = []
+
+    def record(x_reduced, calendar_info, daily_aggregates):
+        tracing.append(tracemalloc.is_tracing())
+        np.ones(10 ** 5)
+
+    monkeypatch.setattr(benchmarks, '_benchmarks', lambda: {'record': (record, None)})
+    report = runBenchmarks(sizes=[50], repeat=3)
+    #trois runs chronometres sans tracemalloc, puis un run de mesure de la memoire
+    assert tracing == [False, False, False, True]
+    assert report['results'][0]['peak_memory_mb'] > 0.5
@@ -0,0 +1,22 @@
+import os
+import pandas as pd
+
+from FeaturesScore.compare_models import compareProjectors
+
+PROJECTORS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Projectors_publication')
+MODELS = ['projector_Conso_CVAE_5couches-Day_WorkingDays_L1', 'projector_Conso_CVAE_5couches-Month_Temp_Day-L1']
+
+
+def test_parallel_comparison_is_quiet_and_matches_sequential(tmp_path, capfd):
+    projector_dirs = [os.path.join(PROJECTORS, model) for model in MODELS]
+    report, overlap = compareProjectors(projector_dirs, str(tmp_path / 'comparison.csv'), max_workers=2)
+    #seul le resume est affiche, les tables des processus ne s'entrelacent plus
+    lines = capfd.readouterr().out.strip().split('\n')
+    assert len(lines) == 1 and lines[0].startswith('2 models scored')
+
+    sequential, sequential_overlap = compareProjectors(projector_dirs, max_workers=1)
+    columns = [c for c in report.columns if not c.endswith('_s')]
+    pd.testing.assert_frame_equal(report[columns], sequential[columns])
+    pd.testing.assert_frame_equal(overlap, sequential_overlap)
+    assert list(report['n_days']) == [1500, 1500]
+    assert os.path.isfile(str(tmp_path / 'comparison_overlap.csv'))
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from FeaturesScore.benchmarks import make_synthetic_latent
+from FeaturesScore.incremental import IncrementalLatentScorer
+from FeaturesScore.scoring import predictFeaturesInLatentSPace
+
+
+def test_weekly_appends_match_a_full_recomputation():
+    x_reduced, calendar_info, daily_aggregates = make_synthetic_latent(800, separation=1.)
+    n_start = 660
+    scorer = IncrementalLatentScorer(x_reduced[:n_start], calendar_info[:n_start], daily_aggregates[:n_start], k=5)
+    for start in range(n_start, 800, 7):
+        stop = min(start + 7, 800)
+        scorer.append(x_reduced[start:stop], calendar_info[start:stop], daily_aggregates[start:stop])
+
+    expected = predictFeaturesInLatentSPace(None, calendar_info, x_reduced, k=5, cv='loo', daily_aggregates=daily_aggregates)
+    pd.testing.assert_frame_equal(scorer.scores(), expected['dataFrame'], check_exact=False, rtol=1e-10)
+    odd_days = scorer.odd_days()
+    for name in ['oddWeekdays', 'oddHolidays', 'oddTemp']:
+        assert list(odd_days[name]) == list(expected[name])
+    full = IncrementalLatentScorer(x_reduced, calendar_info, daily_aggregates, k=5)
+    np.testing.assert_array_equal(scorer.neighbors, full.neighbors)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from sklearn.neighbors import NearestNeighbors
+
+from FeaturesScore.neighbors import build_index, NeighborGraph, IVFIndex
+
+
+@pytest.fixture(scope='module')
+def points():
+    rng = np.random.RandomState(0)
+    centers = rng.randn(20, 6) * 5
+    return centers[rng.randint(20, size=3000)] + rng.randn(3000, 6)
+
+
+@pytest.mark.parametrize('backend', ['brute', 'kd_tree', 'ball_tree'])
+def test_exact_backends_match_nearest_neighbors(points, backend):
+    queries = points[:200] + 0.01
+    expected_distances, expected_indices = NearestNeighbors(n_neighbors=10).fit(points).kneighbors(queries)
+    distances, indices = build_index(points, backend=backend).query(queries, 10)
+    np.testing.assert_array_equal(indices, expected_indices)
+    np.testing.assert_allclose(distances, expected_distances, atol=1e-8)
+
+
+def test_brute_force_blocks_do_not_change_the_result(points):
+    expected = build_index(points, backend='brute').query(points[:100], 5)[1]
+    #blocs de quelques points pour forcer la fusion des top-k partiels
+    np.testing.assert_array_equal(build_index(points, backend='brute', block_elements=64).query(points[:100], 5)[1], expected)
+
+
+def test_ivf_is_exact_when_all_lists_are_probed(points):
+    index = IVFIndex(points, n_lists=16)
+    expected = build_index(points, backend='brute').query(points[:200], 10)[1]
+    np.testing.assert_array_equal(index.query(points[:200], 10, nprobe=16)[1], expected)
+    recall = np.mean([len(np.intersect1d(a, b)) for a, b in zip(index.query(points[:200], 10, nprobe=4)[1], expected)]) / 10
+    assert recall > 0.9
+
+
+def test_neighbor_graph_does_not_depend_on_the_backend(points):
+    expected = NeighborGraph(points, k=5, n_candidates=6, backend='brute').loo_neighbors()
+    for backend in ['kd_tree', 'ivf']:
+        #l'index IVF est exact quand toutes ses listes sont visitees
+        graph = NeighborGraph(points, k=5, n_candidates=6, backend=backend, **({'nprobe': 16, 'n_lists': 16} if backend == 'ivf' else {}))
+        np.testing.assert_array_equal(graph.loo_neighbors(), expected)
+
+
+def test_fold_neighbors_of_contiguous_folds_match_the_training_folds():
+    rng = np.random.RandomState(1)
+    #codes correles dans le temps : les candidats d'un point sont surtout dans son propre fold
+    x = np.cumsum(rng.randn(2000, 4) * 0.1, axis=0)
+    folds = np.repeat(np.arange(10), 200)
+    neighbors = NeighborGraph(x, k=5).fold_neighbors(folds)
+    for f in range(10):
+        train = np.where(folds != f)[0]
+        expected = NearestNeighbors(n_neighbors=5).fit(x[train]).kneighbors(x[folds == f])[1]
+        np.testing.assert_array_equal(neighbors[folds == f], train[expected])
+
+
+def test_loo_neighbors_with_more_duplicates_than_candidates():
+    rng = np.random.RandomState(2)
+    #chaque point est present 8 fois : parmi les 3 candidats de la premiere recherche figure souvent le point lui-meme
+    x = np.tile(rng.rand(30, 3), (8, 1))
+    neighbors = NeighborGraph(x, k=3, n_candidates=3).loo_neighbors()
+    assert np.all(neighbors != np.arange(240)[:, None])
+    np.testing.assert_array_equal(x[neighbors], np.repeat(x[:, None], 3, axis=1))
+
+
+def test_auto_backend():
+    rng = np.random.RandomState(3)
+    assert build_index(rng.rand(6000, 4)).name == 'kd_tree'
+    assert build_index(rng.rand(1000, 4)).name == 'brute'
+    assert build_index(rng.rand(6000, 16)).name == 'brute'
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.model_selection import LeaveOneOut, cross_val_predict
+from sklearn.neighbors import KNeighborsClassifier, KNeighborsRegressor
+from sklearn.metrics import accuracy_score, f1_score, r2_score
+
+from FeaturesScore.benchmarks import make_synthetic_latent
+from FeaturesScore.neighbors import NeighborGraph
+from FeaturesScore.scoring import predictFeaturesInLatentSPace, scoreKnnGraph, scoreKnnResults
+
+
+@pytest.fixture(scope='module')
+def latent():
+    return make_synthetic_latent(600, separation=1.)
+
+
+def test_graph_engine_matches_sklearn_engine(latent):
+    x_reduced, calendar_info, daily_aggregates = latent
+    results = [predictFeaturesInLatentSPace(None, calendar_info, x_reduced, k=5, cv=10, engine=engine,
+                                            daily_aggregates=daily_aggregates)
+               for engine in ['sklearn', 'graph']]
+    pd.testing.assert_frame_equal(results[0]['dataFrame'], results[1]['dataFrame'])
+    for key in ['oddWeekdays', 'oddHolidays', 'oddTemp']:
+        assert list(results[0][key]) == list(results[1][key])
+
+
+@pytest.mark.parametrize('target', ['is_weekday', 'weekday', 'month'])
+def test_graph_fold_scores_match_scoreKnnResults(latent, target):
+    x_reduced, calendar_info, _ = latent
+    y = calendar_info[target].values
+    #les classes doivent commencer a 0 pour predP, comme dans predictFeaturesInLatentSPace
+    y = y - y.min()
+    expected = scoreKnnResults(x_reduced, y, k=5, cv=10)
+    scores = scoreKnnGraph(NeighborGraph(x_reduced, k=5), y, cv=10)
+    assert scores['predD'] == pytest.approx(expected['predD'], abs=1e-12)
+    assert scores['F1'] == pytest.approx(expected['F1'], abs=1e-12)
+    np.testing.assert_allclose(scores['predP'], expected['predP'])
+
+
+def test_loo_scores_match_leave_one_out(latent):
+    x_reduced, calendar_info, daily_aggregates = latent
+    x_reduced = x_reduced[:300]
+    graph = NeighborGraph(x_reduced, k=5, n_candidates=6)
+
+    y = calendar_info['weekday'].values[:300]
+    scores = scoreKnnGraph(graph, y, cv='loo')
+    knn = KNeighborsClassifier(n_neighbors=5)
+    pred = cross_val_predict(knn, x_reduced, y, cv=LeaveOneOut())
+    proba = cross_val_predict(knn, x_reduced, y, cv=LeaveOneOut(), method='predict_proba')
+    assert scores['predD'] == pytest.approx(accuracy_score(y, pred), abs=1e-12)
+    assert scores['F1'] == pytest.approx(f1_score(y, pred, average='macro'), abs=1e-12)
+    np.testing.assert_allclose(scores['predP'], proba[np.arange(len(y)), y])
+
+    temperature = daily_aggregates['temperature_France_mean'].values[:300]
+    scores = scoreKnnGraph(graph, temperature, type='regressor', cv='loo')
+    predictions = cross_val_predict(KNeighborsRegressor(n_neighbors=5), x_reduced, temperature, cv=LeaveOneOut())
+    np.testing.assert_allclose(scores['predictions'], predictions)
+    assert scores['predD'] == pytest.approx(r2_score(temperature, predictions), abs=1e-12)
+
+
+def test_loo_neighbors_drop_the_point_itself_among_duplicates():
+    rng = np.random.RandomState(0)
+    x = rng.rand(50, 3)
+    #chaque point est present deux fois : son plus proche voisin est son double, pas lui-meme
+    x = np.concatenate((x, x))
+    neighbors = NeighborGraph(x, k=3, n_candidates=4).loo_neighbors()
+    assert np.all(neighbors != np.arange(100)[:, None])
+    np.testing.assert_array_equal(neighbors[:, 0], (np.arange(100) + 50) % 100)
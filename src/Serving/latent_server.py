@@ -0,0 +1,343 @@
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+import numpy as np
+
+#nombre de latences conservees par endpoint pour le calcul des percentiles
+LATENCY_WINDOW = 10000
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class MicroBatcher():
+    """
+    Coalesce concurrent requests into micro-batches. A batch is run when it reaches max_batch_size rows
+    or when its first request has waited max_latency_ms.
+    """
+    def __init__(self, fn, max_batch_size=256, max_latency_ms=5.):
+        """
+
+        :param fn: function taking a list of input arrays (stacked rows of all the requests) and returning a list of output arrays
+        :param max_batch_size: maximal number of rows of a batch
+        :param max_latency_ms: latency budget waited for other requests before running a batch
+        """
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.
+        self.queue = asyncio.Queue()
+        self.n_batches = 0
+        self.n_rows = 0
+        self._worker = None
+
+    @property
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, inputs):
+        """
+        :param inputs: list of arrays with the same number of rows
+        :return: list of output arrays for these rows
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((inputs, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            n_rows = items[0][0][0].shape[0]
+            deadline = loop.time() + self.max_latency
+            while n_rows < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                n_rows += item[0][0].shape[0]
+            await self._run_batch(items, loop)
+
+    async def _run_batch(self, items, loop):
+        """
+        Run the requests of items as one batch and set their futures. If the batch fails, each request is run
+        alone, so that an invalid request (e.g. rows of another width) does not fail the others.
+        """
+        sizes = [item[0][0].shape[0] for item in items]
+        try:
+            inputs = [np.concatenate([item[0][j] for item in items]) for j in range(len(items[0][0]))]
+            outputs = await loop.run_in_executor(None, self.fn, inputs)
+        except Exception as e:
+            if len(items) > 1:
+                for item in items:
+                    await self._run_batch([item], loop)
+            elif not items[0][1].done():
+                items[0][1].set_exception(e)
+            return
+
+        self.n_batches += 1
+        self.n_rows += sum(sizes)
+        bounds = np.cumsum([0] + sizes)
+        for i, (_, future) in enumerate(items):
+            if not future.done():
+                future.set_result([out[bounds[i]:bounds[i + 1]] for out in outputs])
+
+
+class LatentServer():
+    """
+    Local HTTP server around a loaded model to query its latent space.
+
+    POST endpoints take a json body {"x": [[...], ...], "conditions": [[[...], ...], ...]} where conditions
+    follows the layout of dataset['train']['x'][1:]:
+    - /encode: latent codes z
+    - /reconstruct: reconstructed curves
+    - /reconstruction_error: mean absolute reconstruction error of each day
+    - /nearest_days: nearest reference days in the latent space, the body can also give "z" directly
+    GET /metrics returns the p50/p99 latencies, the queue depths and the batch sizes.
+    """
+    def __init__(self, model, reference_latent=None, reference_ds=None, n_neighbors=5,
+                 max_batch_size=256, max_latency_ms=5., host='127.0.0.1', port=8765):
+        """
+
+        :param model: InferenceModel, or a trained CAE/CVAE/CVAE_emb exported on the fly
+        :param reference_latent: latent codes of the reference days for /nearest_days
+        :param reference_ds: dates of the reference days
+        :param n_neighbors: default number of nearest days returned
+        """
+        from CVAE.export import InferenceModel
+
+        if not isinstance(model, InferenceModel):
+            model = InferenceModel.from_model(model)
+        self.model = model
+        self.reference_latent = None if reference_latent is None else np.asarray(reference_latent, dtype=np.float64)
+        self.reference_ds = None if reference_ds is None else [str(d) for d in reference_ds]
+        self.n_neighbors = n_neighbors
+        self.host = host
+        self.port = port
+        self.max_batch_size = max_batch_size
+        self.max_latency_ms = max_latency_ms
+        self.batchers = {}
+        self.latencies = {}
+        self.n_requests = {}
+        self._server = None
+
+    #fonctions appliquees sur un micro-batch
+
+    def _encode(self, inputs):
+        return [self.model.encode(inputs)]
+
+    def _reconstruct(self, inputs):
+        return [self.model.reconstruct(inputs)]
+
+    def _reconstruction_error(self, inputs):
+        return [self.model.reconstruction_error(inputs)]
+
+    def _nearest(self, inputs, k):
+        z = inputs[0]
+        sq_dist = (np.sum(z ** 2, axis=1)[:, None] + np.sum(self.reference_latent ** 2, axis=1)[None, :]
+                   - 2 * np.dot(z, self.reference_latent.T))
+        k = min(k, self.reference_latent.shape[0])
+        idx = np.argpartition(sq_dist, k - 1, axis=1)[:, :k]
+        dist = np.take_along_axis(sq_dist, idx, axis=1)
+        order = np.argsort(dist, axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+        dist = np.sqrt(np.maximum(np.take_along_axis(dist, order, axis=1), 0))
+        return [idx, dist]
+
+    async def start(self):
+        loop_fns = {'encode': self._encode,
+                    'reconstruct': self._reconstruct,
+                    'reconstruction_error': self._reconstruction_error}
+        for name, fn in loop_fns.items():
+            self.batchers[name] = MicroBatcher(fn, self.max_batch_size, self.max_latency_ms)
+            self.batchers[name].start()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        #port effectif quand port=0
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for batcher in self.batchers.values():
+            await batcher.stop()
+
+    async def serve_forever(self):
+        await self.start()
+        print('Latent server listening on http://{}:{}'.format(self.host, self.port))
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    def metrics(self):
+        endpoints = {}
+        for name, latencies in self.latencies.items():
+            values = np.array(latencies) * 1000.
+            endpoints[name] = {'requests': self.n_requests[name],
+                               'latency_p50_ms': float(np.percentile(values, 50)),
+                               'latency_p99_ms': float(np.percentile(values, 99))}
+        batchers = {name: {'queue_depth': b.queue_depth,
+                           'batches': b.n_batches,
+                           'mean_batch_size': b.n_rows / b.n_batches if b.n_batches else 0.}
+                    for name, b in self.batchers.items()}
+        return {'endpoints': endpoints, 'batchers': batchers}
+
+    async def _handle(self, method, path, body):
+        endpoint = path.strip('/').split('?')[0]
+        if method == 'GET' and endpoint == 'metrics':
+            return 200, self.metrics()
+        if method == 'GET' and endpoint == 'health':
+            return 200, {'status': 'ok'}
+        if endpoint not in list(self.batchers) + ['nearest_days']:
+            return 404, {'error': 'unknown endpoint {}'.format(path)}
+        if method != 'POST':
+            return 405, {'error': 'use POST for {}'.format(path)}
+
+        request = json.loads(body.decode('utf-8')) if body else {}
+        if endpoint == 'nearest_days':
+            return 200, await self._nearest_days(request)
+
+        inputs = self._parse_inputs(request)
+        outputs = await self.batchers[endpoint].submit(inputs)
+        key = {'encode': 'z', 'reconstruct': 'x_hat', 'reconstruction_error': 'error'}[endpoint]
+        return 200, {key: outputs[0].tolist()}
+
+    def _parse_inputs(self, request):
+        if 'x' not in request:
+            raise ValueError('missing "x" in the request')
+        x = np.atleast_2d(np.asarray(request['x'], dtype=np.float64))
+        conditions = [np.atleast_2d(np.asarray(c, dtype=np.float64)) for c in request.get('conditions', [])]
+        for c in conditions:
+            if c.shape[0] != x.shape[0]:
+                raise ValueError('conditions and x must have the same number of rows')
+        return [x] + conditions
+
+    async def _nearest_days(self, request):
+        if self.reference_latent is None:
+            raise ValueError('the server was started without reference latent codes')
+        if 'z' in request:
+            z = np.atleast_2d(np.asarray(request['z'], dtype=np.float64))
+        else:
+            z = (await self.batchers['encode'].submit(self._parse_inputs(request)))[0]
+        k = int(request.get('k', self.n_neighbors))
+        loop = asyncio.get_running_loop()
+        idx, dist = await loop.run_in_executor(None, self._nearest, [z], k)
+        response = {'z': z.tolist(), 'indices': idx.tolist(), 'distances': dist.tolist()}
+        if self.reference_ds is not None:
+            response['dates'] = [[self.reference_ds[i] for i in row] for row in idx]
+        return response
+
+    async def _read_request(self, reader):
+        """
+        :return: method, path, version, headers and body of the next request, None when the client closed the connection
+        """
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        parts = request_line.decode('latin-1').strip().split(' ', 2)
+        if len(parts) != 3:
+            raise ValueError('malformed request line {!r}'.format(request_line.decode('latin-1').strip()))
+        method, path, version = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if b':' not in line:
+                raise ValueError('malformed header {!r}'.format(line.decode('latin-1').strip()))
+            key, value = line.decode('latin-1').split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+        length = headers.get('content-length', '0')
+        if not length.isdigit():
+            raise ValueError('invalid content-length {!r}'.format(length))
+        body = await reader.readexactly(int(length))
+        return method, path, version, headers, body
+
+    async def _respond(self, writer, status, response, keep_alive):
+        payload = json.dumps(response).encode('utf-8')
+        writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+            status, HTTP_REASONS.get(status, ''), len(payload), 'keep-alive' if keep_alive else 'close').encode('latin-1'))
+        writer.write(payload)
+        await writer.drain()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except ValueError as e:
+                    #la suite du flux ne peut plus etre lue : reponse 400 puis fermeture de la connexion
+                    await self._respond(writer, 400, {'error': str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, version, headers, body = request
+
+                start = time.perf_counter()
+                try:
+                    status, response = await self._handle(method, path, body)
+                except (ValueError, KeyError, TypeError) as e:
+                    status, response = 400, {'error': str(e)}
+                except Exception as e:
+                    status, response = 500, {'error': str(e)}
+                endpoint = path.strip('/').split('?')[0]
+                if status == 200 and method == 'POST':
+                    self.latencies.setdefault(endpoint, deque(maxlen=LATENCY_WINDOW)).append(time.perf_counter() - start)
+                    self.n_requests[endpoint] = self.n_requests.get(endpoint, 0) + 1
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                await self._respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the latent space of a saved model on localhost')
+    parser.add_argument('bundle', help='folder of a model saved with save_bundle')
+    parser.add_argument('--reference', default=None, help='npz file with the reference latent codes "z" and dates "ds"')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    parser.add_argument('--max-latency-ms', type=float, default=5.)
+    args = parser.parse_args()
+
+    from CVAE.bundle import load_bundle
+
+    reference_latent = None
+    reference_ds = None
+    if args.reference is not None:
+        reference = np.load(args.reference, allow_pickle=True)
+        reference_latent = reference['z']
+        reference_ds = reference['ds'] if 'ds' in reference else None
+
+    server = LatentServer(load_bundle(args.bundle).inference_model(), reference_latent=reference_latent,
+                          reference_ds=reference_ds, max_batch_size=args.max_batch_size,
+                          max_latency_ms=args.max_latency_ms, host=args.host, port=args.port)
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import json
+import asyncio
+import numpy as np
+import pytest
+
+from CVAE.export import DenseGraph, InferenceModel
+from Serving.latent_server import LatentServer
+
+
+def _dense(name, inbound, n_in, n_out, rng, activation='linear'):
+    return {'name': name, 'class_name': 'Dense', 'inbound': inbound, 'config': {'activation': activation},
+            'weights': [rng.randn(n_in, n_out).astype(np.float32), rng.randn(n_out).astype(np.float32)]}
+
+
+def _model(input_dim=8, cond_dim=3, z_dim=2):
+    rng = np.random.RandomState(0)
+    inputs = [{'name': name, 'class_name': 'InputLayer', 'inbound': [], 'config': {}, 'weights': []} for name in ['x', 'cond']]
+    concat = {'name': 'concat', 'class_name': 'Concatenate', 'inbound': ['x', 'cond'], 'config': {'axis': -1}, 'weights': []}
+    encoder = DenseGraph('encoder', ['x', 'cond'], ['z_mu', 'z_log_sigma'],
+                         inputs + [concat, _dense('hidden', ['concat'], input_dim + cond_dim, 6, rng, 'relu'),
+                                   _dense('z_mu', ['hidden'], 6, z_dim, rng), _dense('z_log_sigma', ['hidden'], 6, z_dim, rng)])
+    inputs = [{'name': name, 'class_name': 'InputLayer', 'inbound': [], 'config': {}, 'weights': []} for name in ['z', 'cond']]
+    concat = {'name': 'concat', 'class_name': 'Concatenate', 'inbound': ['z', 'cond'], 'config': {'axis': -1}, 'weights': []}
+    decoder = DenseGraph('decoder', ['z', 'cond'], ['x_hat'],
+                         inputs + [concat, _dense('x_hat', ['concat'], z_dim + cond_dim, input_dim, rng)])
+    return InferenceModel(encoder, decoder)
+
+
+async def _request(port, raw):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(raw)
+    await writer.drain()
+    status_line = await reader.readline()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        key, value = line.decode('latin-1').split(':', 1)
+        headers[key.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers['content-length']))
+    writer.close()
+    return int(status_line.split()[1]), json.loads(body.decode('utf-8'))
+
+
+def _post(path, request):
+    body = json.dumps(request).encode('utf-8')
+    return 'POST {} HTTP/1.1\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'.format(path, len(body)).encode('latin-1') + body
+
+
+async def _with_server(model, scenario, **kwargs):
+    server = LatentServer(model, port=0, **kwargs)
+    await server.start()
+    try:
+        return await scenario(server)
+    finally:
+        await server.stop()
+
+
+def test_concurrent_requests_are_batched_and_match_direct_encode():
+    model = _model()
+    rng = np.random.RandomState(1)
+    x = rng.rand(50, 8)
+    cond = np.eye(3)[rng.randint(3, size=50)]
+
+    async def scenario(server):
+        responses = await asyncio.gather(*[_request(server.port, _post('/encode', {'x': [x[i].tolist()], 'conditions': [[cond[i].tolist()]]}))
+                                           for i in range(50)])
+        return responses, server.batchers['encode'].n_batches
+
+    responses, n_batches = asyncio.run(_with_server(model, scenario, max_latency_ms=50.))
+    assert all(status == 200 for status, _ in responses)
+    z = np.array([response['z'][0] for _, response in responses])
+    np.testing.assert_allclose(z, model.encode([x, cond]), rtol=1e-6, atol=1e-6)
+    assert n_batches < 50
+
+
+@pytest.mark.parametrize('raw', [b'GARBAGE\r\n\r\n',
+                                 b'POST /encode HTTP/1.1\r\nno colon here\r\n\r\n',
+                                 b'POST /encode HTTP/1.1\r\nContent-Length: abc\r\n\r\n',
+                                 b'POST /encode HTTP/1.1\r\nContent-Length: -1\r\n\r\n'])
+def test_malformed_requests_get_400(raw):
+    async def scenario(server):
+        bad = await _request(server.port, raw)
+        #le serveur repond toujours aux requetes suivantes
+        health = await _request(server.port, b'GET /health HTTP/1.1\r\nConnection: close\r\n\r\n')
+        return bad, health
+
+    (status, response), (health_status, _) = asyncio.run(_with_server(_model(), scenario))
+    assert status == 400
+    assert 'error' in response
+    assert health_status == 200
+
+
+def test_invalid_request_does_not_fail_its_batch():
+    model = _model()
+    rng = np.random.RandomState(2)
+    x = rng.rand(8)
+    cond = np.eye(3)[0]
+
+    async def scenario(server):
+        #les deux requetes arrivent dans le meme micro-batch, la seconde a une ligne trop courte
+        return await asyncio.gather(_request(server.port, _post('/encode', {'x': [x.tolist()], 'conditions': [[cond.tolist()]]})),
+                                    _request(server.port, _post('/encode', {'x': [x[:7].tolist()], 'conditions': [[cond.tolist()]]})))
+
+    (status, response), (bad_status, bad_response) = asyncio.run(_with_server(model, scenario, max_latency_ms=50.))
+    assert status == 200
+    np.testing.assert_allclose(response['z'], model.encode([x[None], cond[None]]), rtol=1e-6, atol=1e-6)
+    assert bad_status == 400 and 'error' in bad_response
@@ -1,13 +1,135 @@
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-from matplotlib import pyplot as plt
 import numpy as np
 import os
-from tensorflow.contrib.tensorboard.plugins import projector
-import tensorflow as tf
-from matplotlib.figure import Figure
+#matplotlib et tensorflow ne sont importes que dans les fonctions qui les utilisent
+
+#dimensions des vignettes de profils de consommation (figure matplotlib de 6x6 pouces a 30 dpi)
+THUMBNAIL_SIZE = 180
+#position des axes dans la figure (valeurs par defaut de matplotlib : left, bottom, right, top)
+AXES_BOX = (0.125, 0.11, 0.9, 0.88)
+#marge relative autour des courbes, comme l'autoscale de matplotlib
+AXES_MARGIN = 0.05
+#epaisseur en pixels des courbes et du cadre, mesuree sur les vignettes matplotlib
+LINE_WIDTH = 1.0
+FRAME_WIDTH = 0.8 * 30 / 72.
+#couleurs de fond de la figure et des axes (whitesmoke), des courbes originales (rouge) et reconstruites (bleu)
+FIGURE_COLOR = (255, 255, 255)
+AXES_COLOR = (245, 245, 245)
+CURVE_COLORS = [(255, 0, 0), (0, 0, 255)]
+
+
+def _splat_segments(p0, p1, width, n_pixels, height, image_width, offsets):
+    """
+    Anti-aliased coverage of line segments: each segment is sampled every pixel and each sample spreads
+    its share of the segment area on the 4 nearest pixels (bilinear weights).
+
+    :param p0, p1: arrays (m, 2) of the (column, row) pixel coordinates of the segment ends
+    :param offsets: array (m,) offset of the image of each segment in the flattened coverage
+    :return: flattened coverage (n_pixels,)
+    """
+    length = np.hypot(p1[:, 0] - p0[:, 0], p1[:, 1] - p0[:, 1])
+    n_samples = np.maximum(np.ceil(length).astype(np.int64), 1)
+    segment = np.repeat(np.arange(len(length)), n_samples)
+    starts = np.cumsum(n_samples) - n_samples
+    t = (np.arange(n_samples.sum()) - starts[segment] + 0.5) / n_samples[segment]
+    points = p0[segment] + t[:, None] * (p1[segment] - p0[segment])
+    weight = (length * width / n_samples)[segment]
+
+    #le pixel i couvre [i, i+1), son centre est en i+0.5
+    u = points[:, 0] - 0.5
+    v = points[:, 1] - 0.5
+    u0 = np.floor(u).astype(np.int64)
+    v0 = np.floor(v).astype(np.int64)
+    fu = u - u0
+    fv = v - v0
+    index = []
+    weights = []
+    for du, dv, w in [(0, 0, (1 - fu) * (1 - fv)), (1, 0, fu * (1 - fv)), (0, 1, (1 - fu) * fv), (1, 1, fu * fv)]:
+        col = u0 + du
+        row = v0 + dv
+        inside = (col >= 0) & (col < image_width) & (row >= 0) & (row < height)
+        index.append(offsets[segment[inside]] + row[inside] * image_width + col[inside])
+        weights.append((weight * w)[inside])
+    coverage = np.bincount(np.concatenate(index), weights=np.concatenate(weights), minlength=n_pixels)
+    return coverage
+
+
+def _thumbnail_background(height, width):
+    """
+    Figure background with the whitesmoke axes area and its black frame.
+    """
+    left, bottom, right, top = AXES_BOX
+    x0, x1 = left * width, right * width
+    y0, y1 = (1 - top) * height, (1 - bottom) * height
+    background = np.empty((height, width, 3))
+    background[:] = FIGURE_COLOR
+    background[int(round(y0)):int(round(y1)), int(round(x0)):int(round(x1))] = AXES_COLOR
+    corners = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+    frame = _splat_segments(corners, np.roll(corners, -1, axis=0), FRAME_WIDTH, height * width, height, width,
+                            np.zeros(4, dtype=np.int64))
+    alpha = np.minimum(frame, 1).reshape(height, width, 1)
+    return np.round(background * (1 - alpha)).astype(np.uint8)
+
+
+def rasterizeLoadProfiles(x, x_hat, nPoints=None, height=THUMBNAIL_SIZE, width=THUMBNAIL_SIZE, batch_size=256):
+    """
+    Draw the original (red) and reconstructed (blue) load profiles of each day on a whitesmoke axes area, as the
+    matplotlib thumbnails of createLoadProfileImages but without the tick labels, directly into one uint8 array.
+    The segments of all the days of a batch are rasterized together.
+
+    :param x: array (n_days, n_steps) of the original profiles
+    :param x_hat: array (n_days, n_steps) of the reconstructed profiles
+    :return: images, array (nPoints, height, width, 3) of uint8
+    """
+    x = np.asarray(x, dtype=np.float64)
+    x_hat = np.asarray(x_hat, dtype=np.float64)
+    nPoints = x.shape[0] if nPoints is None else nPoints
+    n_steps = x.shape[1]
+
+    left, bottom, right, top = AXES_BOX
+    x0, x1 = left * width, right * width
+    y0, y1 = (1 - top) * height, (1 - bottom) * height
+    #abscisses des pas de temps, identiques pour tous les jours
+    columns = x0 + (x1 - x0) * (AXES_MARGIN + (1 - 2 * AXES_MARGIN) * np.arange(n_steps) / max(n_steps - 1, 1))
+    background = _thumbnail_background(height, width)
+
+    images = np.empty((nPoints, height, width, 3), dtype=np.uint8)
+    for start in range(0, nPoints, batch_size):
+        stop = min(start + batch_size, nPoints)
+        m = stop - start
+        curves = [x[start:stop], x_hat[start:stop]]
+        low = np.minimum(curves[0].min(axis=1), curves[1].min(axis=1))
+        high = np.maximum(curves[0].max(axis=1), curves[1].max(axis=1))
+        span = high - low
+        span[span == 0] = 1
+        low = low - AXES_MARGIN * span
+        span = span * (1 + 2 * AXES_MARGIN)
+
+        images[start:stop] = background
+        batch = images[start:stop].reshape(-1, 3)
+        offsets = np.repeat(np.arange(m) * height * width, n_steps - 1)
+        for curve, color in zip(curves, CURVE_COLORS):
+            rows = y1 - (y1 - y0) * (curve - low[:, None]) / span[:, None]
+            points = np.stack([np.broadcast_to(columns, rows.shape), rows], axis=2)
+            coverage = _splat_segments(points[:, :-1].reshape(-1, 2), points[:, 1:].reshape(-1, 2), LINE_WIDTH,
+                                       m * height * width, height, width, offsets)
+            #seuls les pixels touches par la courbe sont melanges
+            touched = np.nonzero(coverage)[0]
+            alpha = np.minimum(coverage[touched], 1)[:, None]
+            batch[touched] = np.round(batch[touched] * (1 - alpha) + alpha * np.array(color, dtype=np.float64))
+    return images
+
 
 #creer un tenseur d'images de profils journaliers de consommation à la granularité 30 minutes (1/2 heure)
-def createLoadProfileImages(x,x_hat,nPoints):
+def createLoadProfileImages(x,x_hat,nPoints,method='numpy'):
+    """
+    :param method: 'numpy' to draw all the thumbnails with rasterizeLoadProfiles, 'matplotlib' to draw one figure per day
+    """
+    if(method=='numpy'):
+        return rasterizeLoadProfiles(x,x_hat,nPoints)
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+    from matplotlib import pyplot as plt
+
     images=[]
     xAxis=np.arange(0, 24, 0.5)
     #for index in range(0,calendar_info.shape[0]):
@@ -23,8 +145,8 @@ def createLoadProfileImages(x,x_hat,nPoints):
         ax.plot(xAxis,x_hat[index,],'-b')
         canvas = FigureCanvas(fig)
         canvas.draw()       # draw the canvas, cache the renderer
-        width, height = fig.get_size_inches() * fig.get_dpi() #and img = np.fromstring(canvas.to_string_rgb(), dtype='uint8').reshape(height, width, 3)
-        image = np.fromstring(canvas.tostring_rgb(), dtype='uint8').reshape(int(height),int(width), 3)
+        #tostring_rgb n'existe plus dans les versions recentes de matplotlib
+        image = np.asarray(canvas.buffer_rgba())[..., :3].copy()
         images.append(image)
         #plt.savefig(os.path.join(log_dir, str(index)+'_fig.png'))
         plt.close(fig)
@@ -44,75 +166,266 @@ def images_to_sprite(data):
           data: Properly shaped HxWx3 image with any necessary padding.
         """
         if len(data.shape) == 3:
-            data = np.tile(data[..., np.newaxis], (1, 1, 1, 3))
-        data = data.astype(np.float32)
-        min = np.min(data.reshape((data.shape[0], -1)), axis=1)
-        data = (data.transpose(1, 2, 3, 0) - min).transpose(3, 0, 1, 2)
-        max = np.max(data.reshape((data.shape[0], -1)), axis=1)
-        data = (data.transpose(1, 2, 3, 0) / max).transpose(3, 0, 1, 2)
-        # Inverting the colors seems to look better for MNIST
-        # data = 1 - data
-
+            data = data[..., np.newaxis]
         n = int(np.ceil(np.sqrt(data.shape[0])))
-        padding = ((0, n ** 2 - data.shape[0]), (0, 0),
-                   (0, 0)) + ((0, 0),) * (data.ndim - 3)
-        # padding = ((0, 0), (0, 0),
-        #        (0, 0)) + ((0, 0),) * (data.ndim - 3)
-        data = np.pad(data, padding, mode='constant',
-                      constant_values=0)
-        # Tile the individual thumbnails into an image.
-        data = data.reshape((n, n) + data.shape[1:]).transpose((0, 2, 1, 3)
-                                                               + tuple(range(4, data.ndim + 1)))
-        data = data.reshape((n * data.shape[1], n * data.shape[3]) + data.shape[4:])
-        data = (data * 255).astype(np.uint8)
-        return data
+        height, width = data.shape[1], data.shape[2]
+        sprite = np.zeros((n * height, n * width, 3), dtype=np.uint8)
+        for index in range(data.shape[0]):
+            row, column = divmod(index, n)
+            sprite[row * height:(row + 1) * height, column * width:(column + 1) * width] = normalize_image(data[index])
+        return sprite
+
+#normalise une image entre 0 et 255, comme images_to_sprite
+def normalize_image(image):
+        """
+        Args:
+          image: HxWxC image, C is 1 or 3.
+
+        Returns:
+          HxWx3 uint8 image scaled by its own min and max.
+        """
+        image = image.astype(np.float32)
+        image -= image.min()
+        image /= image.max()
+        image *= 255
+        return np.broadcast_to(image.astype(np.uint8), image.shape[:2] + (3,))
+
+#ecrit le fichier de configuration du projector de tensorboard sans tensorflow
+def writeProjectorConfig(log_dir,embeddings):
+    """
+    :param embeddings: list of dict (tensor_name, tensor_path, tensor_shape, metadata_path, sprite) as returned by
+                       readProjectorConfig, sprite being a dict (image_path, single_image_dim)
+    """
+    lines=[]
+    for embedding in embeddings:
+        lines.append('embeddings {')
+        for key,value in embedding.items():
+            if(isinstance(value,dict)):
+                lines.append('  {} {{'.format(key))
+                for sub_key,sub_value in value.items():
+                    for v in (sub_value if isinstance(sub_value,(list,tuple)) else [sub_value]):
+                        lines.append('    {}: {}'.format(sub_key,v if isinstance(v,(int,np.integer)) else '"{}"'.format(v)))
+                lines.append('  }')
+            else:
+                for v in (value if isinstance(value,(list,tuple)) else [value]):
+                    lines.append('  {}: {}'.format(key,v if isinstance(v,(int,np.integer)) else '"{}"'.format(v)))
+        lines.append('}')
+    with open(os.path.join(log_dir,'projector_config.pbtxt'),'w') as f:
+        f.write('\n'.join(lines)+'\n')
 
 #creer un fichier de metadata des features que l'on souhaite visualiser et explorer au sein de la visualisation de la projection de tensorboard
-def writeMetaData(log_dir,x_conso,calendar_info,nPoints,has_Odd=False,has_nonWorkingDays=False):
+#colonnes optionnelles du fichier de metadata et colonnes de calendar_info dont elles sont issues
+ODD_COLUMNS={'OddWeekday':'oddWeekDays','OddHoliday':'oddHolidays','OddTemp':'oddTemp','OddNeighbor':'oddNeighbor','HD_predicted':'HD_predicted'}
+NON_WORKING_DAY_COLUMNS={'nonWorkingDay':'nonWorkingDay'}
+
+def _format_column(values):
+    """
+    :return: list of str() of the values; the labels are formatted once per distinct value
+    """
+    values=np.asarray(values)
+    if(values.dtype.kind=='M'):
+        import pandas as pd
+        return pd.Series(values).dt.strftime('%Y-%m-%d %H:%M:%S').tolist()
+    if(values.dtype.kind in 'fO'):
+        return list(map(str,values.tolist()))
+    distinct,inverse=np.unique(values,return_inverse=True)
+    return np.array([str(v) for v in distinct.tolist()],dtype=object)[inverse.ravel()].tolist()
+
+def writeMetaData(log_dir,x_conso,calendar_info,nPoints,has_Odd=False,has_nonWorkingDays=False,daily_aggregates=None,extra_columns=None):
+    """
+    Write the df_labels.tsv metadata file of the projector from a dataframe of all the fields, in one write.
+
+    :param has_Odd: fill the Odd columns from the oddWeekDays, oddHolidays, oddTemp, oddNeighbor and HD_predicted columns of calendar_info
+    :param has_nonWorkingDays: fill the nonWorkingDay column from calendar_info
+    :param extra_columns: dict header -> name of a column of calendar_info or array of nPoints values, appended after ToTag
+    """
+    import pandas as pd
+    from conso.load_shape_data import get_daily_aggregates
+
     metadata_path = os.path.join(log_dir, 'df_labels.tsv')
+    if(daily_aggregates is None):
+        daily_aggregates=get_daily_aggregates(x_conso,columns=['temperature_France'])
+    calendar=calendar_info.iloc[:nPoints]
+    aggregates=daily_aggregates.iloc[:nPoints]
 
-	
+    metadata=pd.DataFrame({'Date':pd.to_datetime(calendar['ds']).values,
+                           'MaxTemperature':aggregates['temperature_France_max'].values,
+                           'MinTemperature':aggregates['temperature_France_min'].values,
+                           'Month':calendar['month'].values,
+                           'WeekDay':calendar['weekday'].values,
+                           'is_WeekDay':calendar['is_weekday'].values,
+                           'Holiday':np.where(calendar['is_holiday_day'].values.astype(bool),'Holiday','Day'),
+                           'Index':np.arange(1,nPoints+1)})
+    optional_columns={}
+    if(has_Odd):
+        optional_columns.update(ODD_COLUMNS)
+    if(has_nonWorkingDays):
+        optional_columns.update(NON_WORKING_DAY_COLUMNS)
+    for column in list(ODD_COLUMNS)+list(NON_WORKING_DAY_COLUMNS)+['ToTag']:
+        metadata[column]=calendar[optional_columns[column]].values if column in optional_columns else 0
+    for column,values in (extra_columns or {}).items():
+        metadata[column]=calendar[values].values if isinstance(values,str) else np.asarray(values)[:nPoints]
+
+    writeMetaDataFrame(metadata_path,metadata)
+
+#ecrit un dataframe de metadata au format de writeMetaData
+def writeMetaDataFrame(metadata_path,metadata):
+    #chaque colonne est formatee en une fois (str() des valeurs, comme l'ancien format ligne a ligne) puis les lignes
+    #sont assemblees et ecrites en un seul appel, plus vite que le writer csv de pandas
+    columns=[_format_column(metadata[c].values) for c in metadata.columns]
     with open(metadata_path, 'w') as metadata_file:
-        metadata_file.write('"Date"\t"MaxTemperature\t"MinTemperature\t"Month"\t"WeekDay"\t"is_WeekDay"\t"Holiday"\t"Index"\t"OddWeekday"\t"OddHoliday"\t"OddTemp"\t"OddNeighbor"\t"HD_predicted"\t"nonWorkingDay"\t"ToTag"\n')
-        for index in range(0,nPoints):
-            #print(index)
-            is_hd=calendar_info.loc[index,'is_holiday_day']
-            date=calendar_info.loc[index,'ds']#.str
-            if is_hd:
-                label="Holiday"
-            else:
-                label="Day"
-            temperatureMax=max(x_conso.loc[index*48:(index+1)*48-1,'temperature_France'])
-            temperatureMin=min(x_conso.loc[index*48:(index+1)*48-1,'temperature_France'])
-            weekday=calendar_info.loc[index,'weekday']
-            month=calendar_info.loc[index,'month']
-            isWeekday=calendar_info.loc[index,'is_weekday']
-	    
-            isOddWeekday=0
-            isOddHoliday=0
-            isOddTemp=0
-            isOddNeighbor=0
-            isHDPredicted=0
-            isnonWorkingDay=0
-            ToTag=0
-        
-            if(has_Odd):
-                isOddWeekday=calendar_info.loc[index,'oddWeekDays']
-                isOddHoliday=calendar_info.loc[index,'oddHolidays']
-                isOddTemp=calendar_info.loc[index,'oddTemp']
-                isOddNeighbor=calendar_info.loc[index,'oddNeighbor']
-                isHDPredicted=calendar_info.loc[index,'HD_predicted']
-            if(has_nonWorkingDays):
-                isnonWorkingDay=calendar_info.loc[index,'nonWorkingDay']
-            #label = calendar_info.loc[index,'is_hd']
-            #metadata_file.write('{}\t{}\n'.format(index+1, label))
-            
-            metadata_file.write('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n'.format(date,temperatureMax,temperatureMin, month,weekday,isWeekday, label, index+1,isOddWeekday,isOddHoliday,isOddTemp,isOddNeighbor,isHDPredicted,isnonWorkingDay,ToTag))
+        metadata_file.write('\t'.join('"{}"'.format(c) for c in metadata.columns)+'\n')
+        metadata_file.write(''.join('\t'.join(row)+'\n' for row in zip(*columns)))
+
+
+#ecrit un tenseur au format binaire float32 lu par le projector (tensor_path et tensor_shape)
+def writeTensor(log_dir,x,file_name):
+    """
+    :return: dict (tensor_path, tensor_shape) of the embedding in the projector config
+    """
+    x=np.asarray(x)
+    x.astype('<f4').tofile(os.path.join(log_dir,file_name))
+    return {'tensor_path':file_name,'tensor_shape':[int(d) for d in x.shape]}
+
+MANIFEST_NAME='projector_manifest.json'
+
+def _readManifest(log_dir):
+    import json
+    manifest_path=os.path.join(log_dir,MANIFEST_NAME)
+    if(not os.path.exists(manifest_path)):
+        return {}
+    with open(manifest_path,'r') as f:
+        return json.load(f)
+
+def _writeManifest(log_dir,manifest):
+    import json
+    with open(os.path.join(log_dir,MANIFEST_NAME),'w') as f:
+        json.dump(manifest,f,indent=2)
 
+#reecrit le sprite quand les vignettes ont change depuis son ecriture, d'apres le hash garde dans le manifest
+def _writeSpriteIfChanged(log_dir,images):
+    """
+    :param images: thumbnails (n, height, width, 3); an empty array keeps the existing sprite (mergeProjectors)
+    :return: True if the sprite was written
+    """
+    from conso.hashing import input_hash
 
+    path='sprite_4_classes.png'
+    if(images.shape[0]==0):
+        return False
+    digest=input_hash(images)
+    manifest=_readManifest(log_dir)
+    entry=manifest.get('sprite',{})
+    if(entry.get('hash')==digest and entry.get('path')==path and os.path.exists(os.path.join(log_dir,path))):
+        return False
+    from Visualisation.sprites import writeSprite
+    writeSprite(os.path.join(log_dir,path),images,0,images.shape[0],int(np.ceil(np.sqrt(images.shape[0]))))
+    manifest['sprite']={'hash':digest,'path':path}
+    _writeManifest(log_dir,manifest)
+    return True
 
 #creer un projecteur de l'espace latent x de l'autoencoder
-def buildProjector(x,images,log_dir,tensor_name=None):
+def buildProjector(x,images,log_dir,tensor_name=None,method='bytes'):
+    """
+    :param images: thumbnails of the points; the sprite is rewritten from them when they changed since the last call
+    :param method: 'bytes' to write the tensor as a raw float32 file referenced by the config, without tensorflow,
+                   'checkpoint' to save it in a tensorflow checkpoint
+    """
+    if(method=='checkpoint'):
+        return _buildCheckpointProjector(x,images,log_dir,tensor_name)
+
+    file_name='tensor.bytes'
+    if(tensor_name):
+        file_name=tensor_name+'_tensor.bytes'
+    embedding={'tensor_name':tensor_name or 'embedding'}
+    embedding.update(writeTensor(log_dir,x,file_name))
+    #chemins relatifs au dossier du projector pour qu'il puisse etre deplace
+    embedding['metadata_path']='df_labels.tsv'
+    if(images is not None):
+        _writeSpriteIfChanged(log_dir,images)
+        embedding['sprite']={'image_path':'sprite_4_classes.png','single_image_dim':[int(images.shape[1]),int(images.shape[2])]}
+    writeProjectorConfig(log_dir,[embedding])
+
+#creer un seul projecteur des espaces latents de plusieurs modeles, qui partagent les metadata et le sprite
+def buildMultiModelProjector(embeddings,images,log_dir):
+    """
+    Write one projector config with one embedding per model. All the embeddings reference the same df_labels.tsv
+    (written beforehand by writeMetaData or mergeProjectors) and the same sprite, so that the models can be compared
+    in a single tensorboard session.
+
+    :param embeddings: dict model name -> latent codes (n, d) of the same n days
+    :param images: thumbnails of the days, the sprite is rewritten from them when they changed since the last call
+    """
+    n_points={name:np.asarray(x).shape[0] for name,x in embeddings.items()}
+    if(len(set(n_points.values()))>1):
+        raise ValueError('The embeddings must have the same number of points, got {}'.format(n_points))
+    if(images is not None):
+        _writeSpriteIfChanged(log_dir,images)
+
+    config=[]
+    for name,x in embeddings.items():
+        embedding={'tensor_name':name}
+        embedding.update(writeTensor(log_dir,x,name+'_tensor.bytes'))
+        embedding['metadata_path']='df_labels.tsv'
+        if(images is not None):
+            embedding['sprite']={'image_path':'sprite_4_classes.png','single_image_dim':[int(images.shape[1]),int(images.shape[2])]}
+        config.append(embedding)
+    writeProjectorConfig(log_dir,config)
+
+#regroupe des projecteurs d'un modele chacun (par exemple Projectors_publication) en un projecteur multi-modeles
+def mergeProjectors(projector_dirs,log_dir,names=None):
+    """
+    The metadata columns that are equal for all the models are written once, the others (e.g. the odd days of
+    each model) are suffixed by the model name. The sprite of the first projector that has one is copied.
+
+    :param names: model names, the folder names if None
+    :return: dict model name -> latent codes
+    """
+    import shutil
+    import pandas as pd
+    from Visualisation.projector_reader import loadProjectorEmbeddings, readProjectorConfig, _projector_path
+
+    names=names or [os.path.basename(os.path.normpath(d)) for d in projector_dirs]
+    embeddings={}
+    metadatas={}
+    for name,projector_dir in zip(names,projector_dirs):
+        loaded=loadProjectorEmbeddings(projector_dir)[0]
+        embeddings[name]=loaded['tensor']
+        metadatas[name]=loaded['metadata']
+
+    reference=metadatas[names[0]]
+    columns={}
+    for column in reference.columns:
+        if(all(column in m.columns and m[column].equals(reference[column]) for m in metadatas.values())):
+            columns[column]=reference[column].values
+        else:
+            for name,m in metadatas.items():
+                if(column in m.columns):
+                    columns['{}_{}'.format(column,name)]=m[column].values
+    writeMetaDataFrame(os.path.join(log_dir,'df_labels.tsv'),pd.DataFrame(columns))
+
+    images=None
+    for projector_dir in projector_dirs:
+        sprite=readProjectorConfig(projector_dir)[0].get('sprite')
+        if(sprite is None):
+            continue
+        sprite_path=_projector_path(projector_dir,sprite['image_path'])
+        if(os.path.exists(sprite_path)):
+            shutil.copyfile(sprite_path,os.path.join(log_dir,'sprite_4_classes.png'))
+            #le sprite copie ne correspond plus au hash eventuellement garde dans le manifest
+            manifest=_readManifest(log_dir)
+            if(manifest.pop('sprite',None) is not None):
+                _writeManifest(log_dir,manifest)
+            #seules les dimensions des vignettes sont utilisees quand le sprite existe deja
+            images=np.empty((0,)+tuple(sprite['single_image_dim']))
+            break
+    buildMultiModelProjector(embeddings,images,log_dir)
+    return embeddings
+
+def _buildCheckpointProjector(x,images,log_dir,tensor_name=None):
+    from tensorflow.contrib.tensorboard.plugins import projector
+    import tensorflow as tf
+
 ## Running TensorFlow Session
     tf_data = tf.Variable(x)
     #with tf.InteractiveSession() as sess:
@@ -142,4 +455,67 @@ def buildProjector(x,images,log_dir,tensor_name=None):
         embedding.sprite.single_image_dim.extend([int(images.shape[1]), int(images.shape[2])])
 
      # Saves a config file that TensorBoard will read during startup.
-    projector.visualize_embeddings(tf.summary.FileWriter(log_dir), config)
\ No newline at end of file
+    projector.visualize_embeddings(writer, config)
+    writer.close()
+    sess.close()
+
+#manifeste des empreintes des entrees de chaque fichier du projector
+def refreshProjector(log_dir,x,calendar_info,nPoints=None,x_conso=None,daily_aggregates=None,profiles=None,tensor_name=None,metadata_kwargs=None):
+    """
+    Build or update a projector, regenerating only the files whose inputs changed since the last call. The hashes of
+    the inputs of the tensor, the metadata and the sprite are kept in projector_manifest.json in log_dir, so that
+    iterating on a model only rewrites the tensor file.
+
+    :param x: latent codes (n, d)
+    :param calendar_info, x_conso, daily_aggregates: inputs of writeMetaData
+    :param profiles: (original, reconstructed) load profiles drawn in the sprite with rasterizeLoadProfiles, no sprite if None
+    :param metadata_kwargs: other arguments of writeMetaData (has_Odd, has_nonWorkingDays, extra_columns)
+    :return: list of the regenerated files among 'tensor', 'metadata' and 'sprite'
+    """
+    from conso.load_shape_data import get_daily_aggregates
+    from conso.hashing import input_hash
+
+    x=np.asarray(x)
+    nPoints=x.shape[0] if nPoints is None else nPoints
+    x=x[:nPoints]
+    metadata_kwargs=metadata_kwargs or {}
+    if(daily_aggregates is None):
+        daily_aggregates=get_daily_aggregates(x_conso,columns=['temperature_France'])
+
+    manifest=_readManifest(log_dir)
+
+    file_name='tensor.bytes'
+    if(tensor_name):
+        file_name=tensor_name+'_tensor.bytes'
+    artifacts={'tensor':(file_name,lambda:input_hash(x)),
+               'metadata':('df_labels.tsv',lambda:input_hash(calendar_info.iloc[:nPoints],daily_aggregates.iloc[:nPoints],metadata_kwargs))}
+    if(profiles is not None):
+        original,reconstructed=np.asarray(profiles[0])[:nPoints],np.asarray(profiles[1])[:nPoints]
+        artifacts['sprite']=('sprite_4_classes.png',lambda:input_hash(original,reconstructed,THUMBNAIL_SIZE))
+
+    regenerated=[]
+    for artifact,(path,artifact_hash) in artifacts.items():
+        digest=artifact_hash()
+        entry=manifest.get(artifact,{})
+        if(entry.get('hash')==digest and entry.get('path')==path and os.path.exists(os.path.join(log_dir,path))):
+            continue
+        if(artifact=='tensor'):
+            writeTensor(log_dir,x,file_name)
+        elif(artifact=='metadata'):
+            writeMetaData(log_dir,None,calendar_info,nPoints,daily_aggregates=daily_aggregates,**metadata_kwargs)
+        else:
+            from Visualisation.sprites import writeSprite
+            writeSprite(os.path.join(log_dir,path),lambda start,stop:rasterizeLoadProfiles(original[start:stop],reconstructed[start:stop]),
+                        0,nPoints,int(np.ceil(np.sqrt(nPoints))))
+        manifest[artifact]={'hash':digest,'path':path}
+        regenerated.append(artifact)
+    if('sprite' not in artifacts):
+        manifest.pop('sprite',None)
+
+    embedding={'tensor_name':tensor_name or 'embedding','tensor_path':file_name,'tensor_shape':[int(d) for d in x.shape],
+               'metadata_path':'df_labels.tsv'}
+    if(profiles is not None):
+        embedding['sprite']={'image_path':'sprite_4_classes.png','single_image_dim':[THUMBNAIL_SIZE,THUMBNAIL_SIZE]}
+    writeProjectorConfig(log_dir,[embedding])
+    _writeManifest(log_dir,manifest)
+    return regenerated
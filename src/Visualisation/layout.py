@@ -0,0 +1,99 @@
+import os
+import numpy as np
+
+from conso.hashing import input_hash
+from Visualisation.buildProjector import writeTensor, writeProjectorConfig
+from Visualisation.projector_reader import readProjectorConfig
+
+#methodes de projection precalculees pour le projector
+LAYOUT_METHODS = ['tsne', 'spectral']
+
+
+def _tsne_layout(x, n_components, seed, perplexity=30., n_jobs=-1):
+    from sklearn.manifold import TSNE
+
+    perplexity = min(perplexity, (x.shape[0] - 1) / 3.)
+    return TSNE(n_components=n_components, perplexity=perplexity, init='pca', method='barnes_hut',
+                random_state=seed, n_jobs=n_jobs).fit_transform(x)
+
+
+def _spectral_layout(x, n_components, seed, k=15):
+    """
+    Spectral embedding of the symmetrized knn graph of the latent space.
+    """
+    from scipy import sparse
+    from sklearn.manifold import spectral_embedding
+    from FeaturesScore.neighbors import NeighborGraph
+
+    neighbors = NeighborGraph(x, k=k, n_candidates=k + 1).loo_neighbors()
+    rows = np.repeat(np.arange(x.shape[0]), k)
+    graph = sparse.csr_matrix((np.ones(len(rows)), (rows, neighbors.ravel())), shape=(x.shape[0], x.shape[0]))
+    graph = ((graph + graph.T) > 0).astype(np.float64)
+    #lobpcg converge en moins d'une seconde la ou arpack prend plus d'une minute sur 20000 points
+    return spectral_embedding(graph, n_components=n_components, random_state=seed, drop_first=True, eigen_solver='lobpcg')
+
+
+def computeLayout(x, method='tsne', n_components=2, seed=0, cache_dir=None, **kwargs):
+    """
+    2D or 3D layout of the latent codes, cached on disk by the hash of the codes and of the parameters.
+
+    :param method: 'tsne' (seeded Barnes-Hut t-SNE, the neighbor search uses all the cores) or 'spectral'
+                   (spectral embedding of the knn graph, much faster on large latent spaces)
+    :param cache_dir: folder of the cached layouts, no cache if None
+    :param kwargs: perplexity and n_jobs for 'tsne', k for 'spectral'
+    :return: array (n, n_components)
+    """
+    if method not in LAYOUT_METHODS:
+        raise ValueError('Unknown layout method {}, expected one of {}'.format(method, LAYOUT_METHODS))
+    x = np.asarray(x, dtype=np.float64)
+    cache_path = None
+    if cache_dir is not None:
+        digest = input_hash(x, method, n_components, seed, kwargs)
+        cache_path = os.path.join(cache_dir, 'layout_{}.npy'.format(digest))
+        if os.path.exists(cache_path):
+            return np.load(cache_path)
+
+    if method == 'tsne':
+        layout = _tsne_layout(x, n_components, seed, **kwargs)
+    else:
+        layout = _spectral_layout(x, n_components, seed, **kwargs)
+
+    if cache_path is not None:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        np.save(cache_path, layout)
+    return layout
+
+
+def addLayoutEmbeddings(log_dir, x, tensor_name=None, layouts=[('tsne', 2), ('tsne', 3)], seed=0, cache_dir=None):
+    """
+    Add precomputed layouts of x to the projector of log_dir, as extra embeddings next to the raw latent codes
+    sharing their metadata and sprite, so that tensorboard shows them without computing t-SNE in the browser.
+
+    :param tensor_name: embedding of the config whose metadata and sprite are reused, the first one if None
+    :param layouts: list of (method, n_components)
+    :param cache_dir: folder of the cached layouts, log_dir/layouts if None
+    :return: list of the names of the added embeddings
+    """
+    cache_dir = os.path.join(log_dir, 'layouts') if cache_dir is None else cache_dir
+    config = readProjectorConfig(log_dir)
+    base = config[0]
+    for embedding in config:
+        if embedding.get('tensor_name') == tensor_name:
+            base = embedding
+    prefix = tensor_name or base.get('tensor_name', 'embedding')
+
+    names = []
+    for method, n_components in layouts:
+        name = '{}_{}_{}d'.format(prefix, method, n_components)
+        layout = computeLayout(x, method, n_components, seed, cache_dir)
+        embedding = {'tensor_name': name}
+        embedding.update(writeTensor(log_dir, layout, name + '_tensor.bytes'))
+        for key in ['metadata_path', 'sprite']:
+            if key in base:
+                embedding[key] = base[key]
+        #une projection deja exportee est remplacee
+        config = [e for e in config if e.get('tensor_name') != name] + [embedding]
+        names.append(name)
+    writeProjectorConfig(log_dir, config)
+    return names
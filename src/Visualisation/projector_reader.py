@@ -0,0 +1,227 @@
+import os
+import re
+import struct
+import numpy as np
+import pandas as pd
+
+#types des tenseurs tensorflow (enum DataType) lus dans les checkpoints
+TF_DTYPES = {1: np.float32, 2: np.float64, 3: np.int32, 9: np.int64, 19: np.float16}
+
+#nombre magique des tables (SSTable) des index de checkpoint tensorflow
+TABLE_MAGIC = 0xdb4775248b80fb57
+
+
+#lecture sans tensorflow des projections sauvegardees pour le projector de tensorboard
+
+def readProjectorConfig(projector_dir):
+    """
+    :param projector_dir: folder with a projector_config.pbtxt file
+    :return: list of the embeddings of the config, each as a dict (tensor_name, tensor_path, tensor_shape, metadata_path, sprite)
+    """
+    with open(os.path.join(projector_dir, 'projector_config.pbtxt'), 'r') as f:
+        text = f.read()
+
+    embeddings = []
+    stack = []
+    current = None
+    for token in re.findall(r'[A-Za-z_]+\s*\{|\}|[A-Za-z_]+\s*:\s*(?:"[^"]*"|[^\s]+)', text):
+        if token.endswith('{'):
+            block = {}
+            name = token[:-1].strip()
+            if name == 'embeddings':
+                embeddings.append(block)
+            elif current is not None:
+                current[name] = block
+            stack.append(current)
+            current = block
+        elif token == '}':
+            current = stack.pop()
+        else:
+            key, value = [t.strip() for t in token.split(':', 1)]
+            value = value.strip('"') if value.startswith('"') else int(value) if value.isdigit() else value
+            #les champs repetes (tensor_shape, single_image_dim) sont des listes
+            if key in ['tensor_shape', 'single_image_dim']:
+                current.setdefault(key, []).append(value)
+            else:
+                current[key] = value
+    return embeddings
+
+
+def _varint(buffer, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, pos
+
+
+def _proto_fields(buffer):
+    """
+    :return: list of (field number, value) of a serialized protobuf message, bytes for the length-delimited fields
+    """
+    fields = []
+    pos = 0
+    while pos < len(buffer):
+        key, pos = _varint(buffer, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _varint(buffer, pos)
+        elif wire_type == 1:
+            value, pos = buffer[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = _varint(buffer, pos)
+            value, pos = buffer[pos:pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = buffer[pos:pos + 4], pos + 4
+        else:
+            raise ValueError('Unsupported protobuf wire type {}'.format(wire_type))
+        fields.append((field, value))
+    return fields
+
+
+def _block_entries(table, offset, size):
+    """
+    Key/value entries of an uncompressed SSTable block.
+    """
+    if table[offset + size] != 0:
+        raise ValueError('Compressed checkpoint index blocks are not supported')
+    block = table[offset:offset + size]
+    n_restarts = struct.unpack('<I', block[-4:])[0]
+    end = len(block) - 4 * (n_restarts + 1)
+    entries = []
+    pos = 0
+    key = b''
+    while pos < end:
+        shared, pos = _varint(block, pos)
+        non_shared, pos = _varint(block, pos)
+        value_length, pos = _varint(block, pos)
+        key = key[:shared] + block[pos:pos + non_shared]
+        pos += non_shared
+        entries.append((key, block[pos:pos + value_length]))
+        pos += value_length
+    return entries
+
+
+def readCheckpointIndex(checkpoint_prefix):
+    """
+    :param checkpoint_prefix: path of the checkpoint without the .index suffix, e.g. ./tf_data.ckpt
+    :return: dict variable name -> dict (dtype, shape, shard_id, offset, size)
+    """
+    with open(checkpoint_prefix + '.index', 'rb') as f:
+        table = f.read()
+    footer = table[-48:]
+    if struct.unpack('<Q', footer[-8:])[0] != TABLE_MAGIC:
+        raise ValueError('{}.index is not a tensorflow checkpoint index'.format(checkpoint_prefix))
+    _, pos = _varint(footer, 0)
+    _, pos = _varint(footer, pos)
+    index_offset, pos = _varint(footer, pos)
+    index_size, pos = _varint(footer, pos)
+
+    variables = {}
+    for _, handle in _block_entries(table, index_offset, index_size):
+        offset, pos = _varint(handle, 0)
+        size, _ = _varint(handle, pos)
+        for key, value in _block_entries(table, offset, size):
+            #la cle vide est l'en-tete du checkpoint
+            if not key:
+                continue
+            entry = {'dtype': 1, 'shape': [], 'shard_id': 0, 'offset': 0, 'size': 0}
+            for field, field_value in _proto_fields(value):
+                if field == 1:
+                    entry['dtype'] = field_value
+                elif field == 2:
+                    entry['shape'] = [dict(_proto_fields(dim)).get(1, 0) for f, dim in _proto_fields(field_value) if f == 2]
+                elif field == 3:
+                    entry['shard_id'] = field_value
+                elif field == 4:
+                    entry['offset'] = field_value
+                elif field == 5:
+                    entry['size'] = field_value
+            variables[key.decode('utf-8')] = entry
+    return variables
+
+
+def readCheckpointTensor(checkpoint_prefix, variable_name=None):
+    """
+    Read a tensor from a tensorflow checkpoint without tensorflow.
+
+    :param checkpoint_prefix: path of the checkpoint without the .index suffix
+    :param variable_name: name of the variable, e.g. 'Variable' or 'Variable:0', the only variable of the checkpoint if None
+    :return: np.array
+    """
+    variables = readCheckpointIndex(checkpoint_prefix)
+    if variable_name is not None:
+        variable_name = variable_name.split(':')[0]
+    if variable_name not in variables:
+        if len(variables) != 1:
+            raise ValueError('Variable {} not found in {}, available: {}'.format(variable_name, checkpoint_prefix, sorted(variables)))
+        variable_name = list(variables)[0]
+    entry = variables[variable_name]
+    if entry['dtype'] not in TF_DTYPES:
+        raise ValueError('Unsupported tensor type {}'.format(entry['dtype']))
+
+    shard_files = sorted(p for p in os.listdir(os.path.dirname(checkpoint_prefix) or '.')
+                         if p.startswith(os.path.basename(checkpoint_prefix) + '.data-'))
+    data_path = os.path.join(os.path.dirname(checkpoint_prefix), shard_files[entry['shard_id']])
+    dtype = np.dtype(TF_DTYPES[entry['dtype']]).newbyteorder('<')
+    with open(data_path, 'rb') as f:
+        f.seek(entry['offset'])
+        data = f.read(entry['size'])
+    return np.frombuffer(data, dtype=dtype).reshape(entry['shape'])
+
+
+def _projector_path(projector_dir, path, suffix=''):
+    """
+    Paths of the projector files are relative to its folder. Absolute paths written on another machine
+    are looked up in the projector folder.
+    """
+    if not os.path.isabs(path):
+        return os.path.join(projector_dir, path)
+    if not os.path.exists(path + suffix):
+        return os.path.join(projector_dir, os.path.basename(path))
+    return path
+
+
+def _checkpoint_prefix(projector_dir):
+    with open(os.path.join(projector_dir, 'checkpoint'), 'r') as f:
+        path = re.search(r'model_checkpoint_path:\s*"([^"]*)"', f.read()).group(1)
+    return _projector_path(projector_dir, path, suffix='.index')
+
+
+def readMetaData(metadata_path):
+    """
+    Read a metadata file written by writeMetaData. The quotes of the header are removed, including
+    the unbalanced ones of the older files.
+    """
+    import csv
+
+    metadata = pd.read_csv(metadata_path, sep='\t', quoting=csv.QUOTE_NONE, float_precision='round_trip')
+    metadata.columns = [c.strip('"') for c in metadata.columns]
+    return metadata
+
+
+def loadProjectorEmbeddings(projector_dir):
+    """
+    :param projector_dir: folder written by buildProjector
+    :return: list of dict (name, tensor, metadata) for each embedding of the projector config
+    """
+    results = []
+    for embedding in readProjectorConfig(projector_dir):
+        if 'tensor_path' in embedding:
+            path = _projector_path(projector_dir, embedding['tensor_path'])
+            if 'tensor_shape' in embedding:
+                tensor = np.fromfile(path, dtype='<f4').reshape(embedding['tensor_shape'])
+            else:
+                tensor = pd.read_csv(path, sep='\t', header=None).values
+        else:
+            tensor = readCheckpointTensor(_checkpoint_prefix(projector_dir), embedding.get('tensor_name'))
+        metadata = None
+        if 'metadata_path' in embedding:
+            metadata = readMetaData(_projector_path(projector_dir, embedding['metadata_path']))
+        results.append({'name': embedding.get('tensor_name', os.path.basename(os.path.normpath(projector_dir))),
+                        'tensor': tensor, 'metadata': metadata})
+    return results
@@ -0,0 +1,157 @@
+import os
+import zlib
+import struct
+import numpy as np
+
+from Visualisation.buildProjector import normalize_image, writeProjectorConfig, writeTensor
+
+#taille maximale (en pixels) d'une image sprite chargee par le projector de tensorboard
+MAX_SPRITE_SIZE = 8192
+
+#taille des blocs compresses ecrits dans le fichier png
+PNG_CHUNK_SIZE = 1 << 20
+
+
+class PNGWriter():
+    """
+    Write an RGB png file row by row: the rows are compressed as they come and written in IDAT chunks,
+    so that the whole image is never held in memory.
+    """
+    def __init__(self, path, height, width):
+        self.height = height
+        self.width = width
+        self.n_rows = 0
+        self.file = open(path, 'wb')
+        self.compressor = zlib.compressobj(6)
+        self.buffer = b''
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        #profondeur 8 bits, couleur RGB, pas d'entrelacement
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, chunk_type, data):
+        self.file.write(struct.pack('>I', len(data)) + chunk_type + data
+                        + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    def write_rows(self, rows):
+        """
+        :param rows: uint8 array (n_rows, width, 3)
+        """
+        rows = np.ascontiguousarray(rows, dtype=np.uint8).reshape(rows.shape[0], -1)
+        #chaque ligne est precedee du type de filtre png (0, sans filtre)
+        filtered = np.zeros((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 1:] = rows
+        self.buffer += self.compressor.compress(filtered.tobytes())
+        self.n_rows += rows.shape[0]
+        while len(self.buffer) >= PNG_CHUNK_SIZE:
+            self._chunk(b'IDAT', self.buffer[:PNG_CHUNK_SIZE])
+            self.buffer = self.buffer[PNG_CHUNK_SIZE:]
+
+    def close(self):
+        if self.n_rows != self.height:
+            raise ValueError('{} rows written for a png of height {}'.format(self.n_rows, self.height))
+        self.buffer += self.compressor.flush()
+        if self.buffer:
+            self._chunk(b'IDAT', self.buffer)
+        self._chunk(b'IEND', b'')
+        self.file.close()
+
+
+def spriteGrid(n_images, image_height, image_width, max_size=MAX_SPRITE_SIZE):
+    """
+    :return: number of images per atlas and number of columns of the square grid of the atlases
+    """
+    n_columns = min(max_size // image_width, max_size // image_height)
+    if n_columns == 0:
+        raise ValueError('Images of {}x{} do not fit in a sprite of {} pixels'.format(image_height, image_width, max_size))
+    capacity = n_columns ** 2
+    if n_images <= capacity:
+        n_columns = int(np.ceil(np.sqrt(n_images)))
+        capacity = n_columns ** 2
+    return capacity, n_columns
+
+
+def _thumbnails(images, start, stop):
+    if callable(images):
+        return images(start, stop)
+    return images[start:stop]
+
+
+def writeSprite(path, images, start, stop, n_columns, normalize=True):
+    """
+    Stream the images start:stop into one png atlas of n_columns x n_columns thumbnails, one row of thumbnails
+    at a time. The layout is the one of images_to_sprite, the missing thumbnails are black.
+
+    :param images: uint8 array (n, H, W, 3), or function(start, stop) returning the thumbnails start:stop
+    :param normalize: scale each thumbnail by its min and max, as images_to_sprite
+    :return: single image dimensions [H, W]
+    """
+    writer = None
+    for row_start in range(start, start + n_columns ** 2, n_columns):
+        row_stop = min(row_start + n_columns, stop)
+        thumbnails = _thumbnails(images, row_start, row_stop) if row_start < stop else None
+        if writer is None:
+            height, width = thumbnails.shape[1], thumbnails.shape[2]
+            writer = PNGWriter(path, n_columns * height, n_columns * width)
+            strip = np.zeros((height, n_columns, width, 3), dtype=np.uint8)
+        strip[:] = 0
+        for column in range(0 if thumbnails is None else thumbnails.shape[0]):
+            image = thumbnails[column]
+            if image.ndim == 2:
+                image = image[..., np.newaxis]
+            strip[:, column] = normalize_image(image) if normalize else np.broadcast_to(image, (height, width, 3))
+        writer.write_rows(strip.reshape(height, n_columns * width, 3))
+    writer.close()
+    return [height, width]
+
+
+def _split_metadata(metadata_path, shards, log_dir, prefix):
+    """
+    Split a metadata tsv file (one header line, then one line per point) into one file per shard.
+    """
+    paths = []
+    with open(metadata_path, 'r') as metadata_file:
+        header = metadata_file.readline()
+        for i, (start, stop) in enumerate(shards):
+            path = '{}_{}_labels.tsv'.format(prefix, i)
+            with open(os.path.join(log_dir, path), 'w') as shard_file:
+                shard_file.write(header)
+                for _ in range(stop - start):
+                    shard_file.write(metadata_file.readline())
+            paths.append(path)
+    return paths
+
+
+def buildShardedProjector(x, images, log_dir, metadata_path=None, tensor_name='embedding', max_size=MAX_SPRITE_SIZE,
+                          normalize=True):
+    """
+    Projector of all the points with their thumbnails, split into as many embeddings as needed for each sprite to
+    fit in max_size pixels. Each shard gets its tensor, metadata and sprite files, and the projector config
+    references all of them. Peak memory is one row of thumbnails plus the compressor state.
+
+    :param x: array (n, d), latent codes
+    :param images: uint8 array (n, H, W, 3), or function(start, stop) returning the thumbnails start:stop,
+                   e.g. lambda start, stop: rasterizeLoadProfiles(x_conso[start:stop], x_hat[start:stop])
+    :param metadata_path: metadata tsv file of all the points, written by writeMetaData
+    :return: list of the embeddings of the projector config
+    """
+    n = x.shape[0]
+    first = _thumbnails(images, 0, 1)
+    capacity, n_columns = spriteGrid(n, first.shape[1], first.shape[2], max_size)
+    shards = [(start, min(start + capacity, n)) for start in range(0, n, capacity)]
+    if metadata_path is not None:
+        metadata_paths = _split_metadata(metadata_path, shards, log_dir, tensor_name)
+
+    embeddings = []
+    for i, (start, stop) in enumerate(shards):
+        name = '{}_{}'.format(tensor_name, i)
+        sprite_path = name + '_sprite.png'
+        single_image_dim = writeSprite(os.path.join(log_dir, sprite_path), images, start, stop,
+                                       spriteGrid(stop - start, first.shape[1], first.shape[2], max_size)[1], normalize)
+        embedding = {'tensor_name': name}
+        embedding.update(writeTensor(log_dir, x[start:stop], name + '_tensor.bytes'))
+        if metadata_path is not None:
+            embedding['metadata_path'] = metadata_paths[i]
+        embedding['sprite'] = {'image_path': sprite_path, 'single_image_dim': single_image_dim}
+        embeddings.append(embedding)
+    writeProjectorConfig(log_dir, embeddings)
+    return embeddings
@@ -0,0 +1,175 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+
+from Visualisation.buildProjector import rasterizeLoadProfiles, createLoadProfileImages, THUMBNAIL_SIZE, buildProjector, \
+    writeMetaData, refreshProjector, mergeProjectors
+from Visualisation.projector_reader import loadProjectorEmbeddings, readProjectorConfig, readMetaData
+
+PUBLICATION_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'Projectors_publication')
+
+
+def _profiles(n_days=6, n_steps=48, seed=0):
+    rng = np.random.RandomState(seed)
+    hours = np.arange(n_steps) * 24. / n_steps
+    x = 50 + 10 * np.sin(2 * np.pi * (hours[None, :] - 6 - rng.rand(n_days, 1) * 4) / 24) + rng.randn(n_days, n_steps)
+    return x, x + rng.randn(n_days, n_steps) * 2
+
+
+def test_rasterized_thumbnails_are_close_to_matplotlib():
+    pytest.importorskip('matplotlib')
+    x, x_hat = _profiles()
+    images = rasterizeLoadProfiles(x, x_hat)
+    assert images.shape == (6, THUMBNAIL_SIZE, THUMBNAIL_SIZE, 3) and images.dtype == np.uint8
+    reference = createLoadProfileImages(x, x_hat, 6, method='matplotlib')
+    #les graduations ne sont pas dessinees, l'ecart moyen reste de quelques niveaux de gris
+    assert np.mean(np.abs(images.astype(float) - reference)) < 8
+
+
+def test_rasterized_thumbnails_do_not_depend_on_the_batches():
+    x, x_hat = _profiles(n_days=7)
+    np.testing.assert_array_equal(rasterizeLoadProfiles(x, x_hat, batch_size=3), rasterizeLoadProfiles(x, x_hat))
+    np.testing.assert_array_equal(rasterizeLoadProfiles(x, x_hat, nPoints=4), rasterizeLoadProfiles(x[:4], x_hat[:4]))
+
+
+def test_bytes_projector_matches_the_checkpoint_projector(tmp_path):
+    publication = loadProjectorEmbeddings(os.path.join(PUBLICATION_DIR, 'projector_Conso_CVAE_5couches-Day_WorkingDays_L1'))[0]
+    log_dir = str(tmp_path / 'projector')
+    os.makedirs(log_dir)
+    publication['metadata'].to_csv(os.path.join(log_dir, 'df_labels.tsv'), sep='\t', index=False)
+    x, x_hat = _profiles(n_days=len(publication['tensor']))
+    buildProjector(publication['tensor'], rasterizeLoadProfiles(x, x_hat, height=8, width=8), log_dir, tensor_name='cvae')
+
+    embedding = readProjectorConfig(log_dir)[0]
+    assert not os.path.isabs(embedding['tensor_path']) and not os.path.isabs(embedding['sprite']['image_path'])
+    #le projector reste lisible une fois deplace
+    moved = shutil.move(log_dir, str(tmp_path / 'moved'))
+    loaded = loadProjectorEmbeddings(moved)[0]
+    assert loaded['name'] == 'cvae'
+    np.testing.assert_array_equal(loaded['tensor'], publication['tensor'])
+    assert list(loaded['metadata']['Date']) == list(publication['metadata']['Date'])
+
+
+def _reference_metadata_rows(x_conso, calendar_info, nPoints, has_Odd, has_nonWorkingDays):
+    """
+    Rows of the per-day loop of writeMetaData before it was written from a dataframe.
+    """
+    rows = []
+    for index in range(0, nPoints):
+        label = "Holiday" if calendar_info.loc[index, 'is_holiday_day'] else "Day"
+        temperatureMax = max(x_conso.loc[index * 48:(index + 1) * 48 - 1, 'temperature_France'])
+        temperatureMin = min(x_conso.loc[index * 48:(index + 1) * 48 - 1, 'temperature_France'])
+        odd = [0] * 5
+        isnonWorkingDay = 0
+        if has_Odd:
+            odd = [calendar_info.loc[index, c] for c in ['oddWeekDays', 'oddHolidays', 'oddTemp', 'oddNeighbor', 'HD_predicted']]
+        if has_nonWorkingDays:
+            isnonWorkingDay = calendar_info.loc[index, 'nonWorkingDay']
+        rows.append('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n'.format(
+            calendar_info.loc[index, 'ds'], temperatureMax, temperatureMin, calendar_info.loc[index, 'month'],
+            calendar_info.loc[index, 'weekday'], calendar_info.loc[index, 'is_weekday'], label, index + 1, *odd,
+            isnonWorkingDay, 0))
+    return rows
+
+
+def _calendar(n_days=30, seed=0):
+    rng = np.random.RandomState(seed)
+    ds = pd.date_range('2013-01-01', periods=n_days * 48, freq='30min')
+    x_conso = pd.DataFrame({'ds': ds, 'temperature_France': np.round(rng.randn(len(ds)) * 5 + 10, 2)})
+    days = ds[::48]
+    calendar_info = pd.DataFrame({'ds': days, 'month': days.month, 'weekday': days.weekday,
+                                  'is_weekday': (days.weekday < 5).astype(int),
+                                  'is_holiday_day': rng.rand(n_days) < 0.1, 'nonWorkingDay': rng.randint(2, size=n_days)})
+    for column in ['oddWeekDays', 'oddHolidays', 'oddTemp', 'oddNeighbor', 'HD_predicted']:
+        calendar_info[column] = rng.randint(2, size=n_days)
+    return x_conso, calendar_info
+
+
+@pytest.mark.parametrize('has_Odd,has_nonWorkingDays', [(False, False), (True, True)])
+def test_metadata_rows_match_the_per_day_loop(tmp_path, has_Odd, has_nonWorkingDays):
+    x_conso, calendar_info = _calendar()
+    writeMetaData(str(tmp_path), x_conso, calendar_info, 25, has_Odd=has_Odd, has_nonWorkingDays=has_nonWorkingDays)
+    with open(str(tmp_path / 'df_labels.tsv'), 'r') as metadata_file:
+        header = metadata_file.readline()
+        rows = metadata_file.readlines()
+    assert rows == _reference_metadata_rows(x_conso, calendar_info, 25, has_Odd, has_nonWorkingDays)
+    #l'entete a maintenant des guillemets equilibres
+    assert header.split('\t')[1] == '"MaxTemperature"'
+
+    metadata = readMetaData(str(tmp_path / 'df_labels.tsv'))
+    assert len(metadata) == 25 and metadata.columns[1] == 'MaxTemperature'
+    np.testing.assert_array_equal(metadata['MaxTemperature'].values,
+                                  x_conso['temperature_France'].values[:25 * 48].reshape(25, 48).max(axis=1))
+
+
+def test_refresh_projector_only_rewrites_what_changed(tmp_path):
+    x_conso, calendar_info = _calendar(n_days=12)
+    x, x_hat = _profiles(n_days=12)
+    codes = np.random.RandomState(3).randn(12, 4).astype(np.float32)
+    log_dir = str(tmp_path)
+    arguments = dict(x_conso=x_conso, profiles=(x, x_hat), metadata_kwargs={'has_Odd': True})
+    assert refreshProjector(log_dir, codes, calendar_info, **arguments) == ['tensor', 'metadata', 'sprite']
+    assert refreshProjector(log_dir, codes, calendar_info, **arguments) == []
+    assert refreshProjector(log_dir, codes + 1, calendar_info, **arguments) == ['tensor']
+
+    #memes fichiers qu'une construction complete
+    loaded = loadProjectorEmbeddings(log_dir)[0]
+    np.testing.assert_array_equal(loaded['tensor'], codes + 1)
+    with open(os.path.join(log_dir, 'df_labels.tsv'), 'r') as metadata_file:
+        refreshed = metadata_file.read()
+    os.makedirs(str(tmp_path / 'full'))
+    writeMetaData(str(tmp_path / 'full'), x_conso, calendar_info, 12, has_Odd=True)
+    with open(str(tmp_path / 'full' / 'df_labels.tsv'), 'r') as metadata_file:
+        assert refreshed == metadata_file.read()
+
+    calendar_info.loc[0, 'oddTemp'] = 1 - calendar_info.loc[0, 'oddTemp']
+    assert refreshProjector(log_dir, codes + 1, calendar_info, **arguments) == ['metadata']
+
+
+def test_merged_projector_keeps_each_model(tmp_path):
+    names = ['working_days', 'month_temp_day']
+    projector_dirs = [os.path.join(PUBLICATION_DIR, 'projector_Conso_CVAE_5couches-' + d)
+                      for d in ['Day_WorkingDays_L1', 'Month_Temp_Day-L1']]
+    originals = [loadProjectorEmbeddings(d)[0] for d in projector_dirs]
+    mergeProjectors(projector_dirs, str(tmp_path), names=names)
+
+    merged = loadProjectorEmbeddings(str(tmp_path))
+    assert [e['name'] for e in merged] == names
+    for embedding, original in zip(merged, originals):
+        np.testing.assert_array_equal(embedding['tensor'], original['tensor'])
+    metadata = merged[0]['metadata']
+    for column in originals[0]['metadata'].columns:
+        values = [original['metadata'][column] for original in originals]
+        if values[0].equals(values[1]):
+            #colonne commune ecrite une seule fois
+            assert column in metadata.columns and not any(column + '_' + name in metadata.columns for name in names)
+            np.testing.assert_array_equal(metadata[column].values, values[0].values)
+        else:
+            assert column not in metadata.columns
+            for name, value in zip(names, values):
+                np.testing.assert_array_equal(metadata[column + '_' + name].values, value.values)
+    assert any(column.endswith('_' + names[1]) for column in metadata.columns)
+
+
+def test_build_projector_rewrites_a_stale_sprite(tmp_path, monkeypatch):
+    from Visualisation import sprites
+    written = []
+    write_sprite = sprites.writeSprite
+    monkeypatch.setattr(sprites, 'writeSprite', lambda path, *args: written.append(path) or write_sprite(path, *args))
+    x, x_hat = _profiles(n_days=9)
+    codes = np.random.RandomState(0).randn(9, 3)
+    log_dir = str(tmp_path)
+    sprite_path = os.path.join(log_dir, 'sprite_4_classes.png')
+
+    buildProjector(codes, rasterizeLoadProfiles(x, x_hat, height=8, width=8), log_dir)
+    with open(sprite_path, 'rb') as f:
+        first = f.read()
+    buildProjector(codes + 1, rasterizeLoadProfiles(x, x_hat, height=8, width=8), log_dir)
+    assert len(written) == 1
+    #d'autres vignettes reecrivent le sprite au lieu de garder l'ancien
+    buildProjector(codes, rasterizeLoadProfiles(x, x_hat[::-1], height=8, width=8), log_dir)
+    assert len(written) == 2
+    with open(sprite_path, 'rb') as f:
+        assert f.read() != first
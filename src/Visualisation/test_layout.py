@@ -0,0 +1,57 @@
+import os
+import numpy as np
+import pytest
+
+from Visualisation.buildProjector import buildProjector
+from Visualisation.layout import computeLayout, addLayoutEmbeddings
+from Visualisation.projector_reader import loadProjectorEmbeddings, readProjectorConfig
+
+
+def _codes(n=150, separation=3., seed=0):
+    rng = np.random.RandomState(seed)
+    #trois groupes separes mais dont le graphe des voisins reste connexe
+    return np.concatenate([rng.randn(n // 3, 4) + separation * c for c in range(3)])
+
+
+def test_cached_layout_is_identical(tmp_path):
+    x = _codes()
+    cache_dir = str(tmp_path / 'layouts')
+    layout = computeLayout(x, 'tsne', 2, seed=0, cache_dir=cache_dir)
+    assert layout.shape == (150, 2)
+    assert len(os.listdir(cache_dir)) == 1
+    np.testing.assert_array_equal(computeLayout(x, 'tsne', 2, seed=0, cache_dir=cache_dir), layout)
+    #le t-SNE est graine : le meme calcul sans cache donne la meme projection
+    np.testing.assert_allclose(computeLayout(x, 'tsne', 2, seed=0), layout)
+    computeLayout(x, 'tsne', 2, seed=1, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_spectral_layout_separates_the_groups():
+    layout = computeLayout(_codes(), 'spectral', 3, k=10)
+    assert layout.shape == (150, 3)
+    centers = np.array([layout[50 * c:50 * (c + 1)].mean(axis=0) for c in range(3)])
+    spread = max(layout[50 * c:50 * (c + 1)].std(axis=0).max() for c in range(3))
+    assert min(np.linalg.norm(centers[i] - centers[j]) for i in range(3) for j in range(i)) > spread
+
+
+def test_unknown_layout_method():
+    with pytest.raises(ValueError):
+        computeLayout(_codes(), 'umap')
+
+
+def test_layout_embeddings_share_the_metadata_and_sprite(tmp_path):
+    x = _codes()
+    log_dir = str(tmp_path)
+    buildProjector(x, None, log_dir, tensor_name='cvae')
+    names = addLayoutEmbeddings(log_dir, x, layouts=[('spectral', 2), ('spectral', 3)])
+    assert names == ['cvae_spectral_2d', 'cvae_spectral_3d']
+    #une seconde exportation remplace les projections sans les dupliquer
+    addLayoutEmbeddings(log_dir, x, layouts=[('spectral', 2)])
+    config = readProjectorConfig(log_dir)
+    assert [e['tensor_name'] for e in config] == ['cvae', 'cvae_spectral_3d', 'cvae_spectral_2d']
+    assert all(e['metadata_path'] == 'df_labels.tsv' for e in config)
+    with open(os.path.join(log_dir, 'df_labels.tsv'), 'w') as metadata_file:
+        metadata_file.write('"Index"\n' + ''.join('{}\n'.format(i) for i in range(150)))
+    loaded = {e['name']: e['tensor'] for e in loadProjectorEmbeddings(log_dir)}
+    np.testing.assert_allclose(loaded['cvae_spectral_2d'], computeLayout(x, 'spectral', 2, cache_dir=os.path.join(log_dir, 'layouts')),
+                               rtol=1e-6)
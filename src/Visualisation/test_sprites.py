@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Visualisation.buildProjector import images_to_sprite
+from Visualisation.projector_reader import loadProjectorEmbeddings, readProjectorConfig
+from Visualisation.sprites import PNGWriter, spriteGrid, writeSprite, buildShardedProjector
+
+
+def _reference_images_to_sprite(data):
+    """
+    Implementation of images_to_sprite before the sprites were written thumbnail by thumbnail.
+    """
+    if len(data.shape) == 3:
+        data = np.tile(data[..., np.newaxis], (1, 1, 1, 3))
+    data = data.astype(np.float32)
+    min = np.min(data.reshape((data.shape[0], -1)), axis=1)
+    data = (data.transpose(1, 2, 3, 0) - min).transpose(3, 0, 1, 2)
+    max = np.max(data.reshape((data.shape[0], -1)), axis=1)
+    data = (data.transpose(1, 2, 3, 0) / max).transpose(3, 0, 1, 2)
+    n = int(np.ceil(np.sqrt(data.shape[0])))
+    padding = ((0, n ** 2 - data.shape[0]), (0, 0), (0, 0)) + ((0, 0),) * (data.ndim - 3)
+    data = np.pad(data, padding, mode='constant', constant_values=0)
+    data = data.reshape((n, n) + data.shape[1:]).transpose((0, 2, 1, 3) + tuple(range(4, data.ndim + 1)))
+    data = data.reshape((n * data.shape[1], n * data.shape[3]) + data.shape[4:])
+    return (data * 255).astype(np.uint8)
+
+
+def _images(n, height=6, width=5, seed=0):
+    return np.random.RandomState(seed).randint(20, 230, size=(n, height, width, 3)).astype(np.uint8)
+
+
+def _read_png(path):
+    import matplotlib.image
+
+    return np.round(matplotlib.image.imread(path)[..., :3] * 255).astype(np.uint8)
+
+
+def test_images_to_sprite_is_byte_identical_to_the_reference():
+    for images in [_images(7), _images(9)[..., 0], np.random.RandomState(1).rand(5, 4, 4, 3) * 1000]:
+        sprite = images_to_sprite(images)
+        expected = _reference_images_to_sprite(images)
+        assert sprite.dtype == expected.dtype and sprite.tobytes() == expected.tobytes()
+
+
+def test_streamed_sprite_matches_images_to_sprite(tmp_path):
+    images = _images(11)
+    path = str(tmp_path / 'sprite.png')
+    _, n_columns = spriteGrid(len(images), 6, 5)
+    assert writeSprite(path, images, 0, len(images), n_columns) == [6, 5]
+    np.testing.assert_array_equal(_read_png(path), images_to_sprite(images))
+
+    #les vignettes peuvent aussi etre produites a la demande
+    path = str(tmp_path / 'lazy.png')
+    writeSprite(path, lambda start, stop: images[start:stop], 0, len(images), n_columns)
+    np.testing.assert_array_equal(_read_png(path), images_to_sprite(images))
+
+
+def test_png_writer_checks_the_number_of_rows(tmp_path):
+    writer = PNGWriter(str(tmp_path / 'short.png'), 4, 3)
+    writer.write_rows(np.zeros((3, 3, 3), dtype=np.uint8))
+    with pytest.raises(ValueError):
+        writer.close()
+
+
+def test_sharded_projector_covers_all_points(tmp_path):
+    n = 23
+    x = np.random.RandomState(2).randn(n, 3).astype(np.float32)
+    images = _images(n)
+    metadata_path = str(tmp_path / 'all_labels.tsv')
+    pd.DataFrame({'Index': np.arange(1, n + 1)}).to_csv(metadata_path, sep='\t', index=False)
+
+    #au plus 3x3 vignettes de 6x5 pixels par sprite
+    embeddings = buildShardedProjector(x, images, str(tmp_path), metadata_path=metadata_path, max_size=18)
+    assert len(embeddings) == 3 and len(readProjectorConfig(str(tmp_path))) == 3
+    loaded = loadProjectorEmbeddings(str(tmp_path))
+    np.testing.assert_array_equal(np.concatenate([e['tensor'] for e in loaded]), x)
+    np.testing.assert_array_equal(np.concatenate([e['metadata']['Index'].values for e in loaded]), np.arange(1, n + 1))
+    for i, (start, stop) in enumerate([(0, 9), (9, 18), (18, 23)]):
+        np.testing.assert_array_equal(_read_png(str(tmp_path / 'embedding_{}_sprite.png'.format(i))),
+                                      images_to_sprite(images[start:stop]))
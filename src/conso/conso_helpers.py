@@ -1,11 +1,8 @@
 import os
 import numpy as np
-from matplotlib import pyplot as plt
 import datetime
 
-from plotly.offline import download_plotlyjs, init_notebook_mode, plot, iplot
-from plotly.graph_objs import *
-from plotly import tools
+#matplotlib et plotly ne sont importes que dans les fonctions de visualisation
 
 
 def enumerate_days(ds):
@@ -46,35 +43,110 @@ def conso_ds_to_array(Xinput_ds):
 
     return X, ds
 
-def plot_conso_day(date, X, ds):
+def plot_conso_day(date, X, ds=None):
+    """
+    :param date: day to plot
+    :param X: array (n_days, n_steps) of the daily profiles, or a ProfileStore to look the day up without scanning ds
+    :param ds: dates of the rows of X, unused if X is a ProfileStore
+    """
+    from matplotlib import pyplot as plt
+    from conso.profile_store import ProfileStore
 
-    minute_dict = {1: 60, 2: 30, 4: 15}
-    date_dt = datetime.datetime(date.year, date.month, date.day)
+    store = X if isinstance(X, ProfileStore) else ProfileStore(ds, X)
+    conso_day = store.get(date)['x'][0]
 
-    # Get conso
-    ind = int(np.where(ds == date_dt)[0])
-    conso_day = X[ind, :]
+    plt.plot(store.time_axis(date), conso_day)
+    plt.show()
 
-    # Get timestamp
-    time_step = len(conso_day) / 24
-    time_step = datetime.timedelta(minutes=minute_dict[time_step])
 
-    date_day_ds = [dt for dt in datetime_range(date_dt, date_dt + datetime.timedelta(days=1), time_step)]
+def _latent_categories(calendar_info, n):
+    """
+    :return: list of (label, mask) of the week days, weekend days and holiday days, as in the scatter plots
+    """
+    mask_isweekday = np.zeros(n, dtype=bool)
+    mask_ishd = np.zeros(n, dtype=bool)
+    if 'is_weekday' in calendar_info.columns:
+        mask_isweekday = np.asarray(calendar_info.is_weekday).astype('bool')
+    if 'is_hd' in calendar_info.columns:
+        mask_ishd = np.asarray(calendar_info.is_hd).astype('bool')
+    return [('Week days', mask_isweekday & ~mask_ishd), ('Weekend', ~mask_isweekday & ~mask_ishd), ('Holiday Days', mask_ishd)]
 
-    plt.plot(date_day_ds, conso_day)
-    plt.show()
 
+def pyplot_latent_space_density(x_proj, calendar_info, values, cmap, clim=None, label='', bins=256, size_fig=(17, 15),
+                                path_folder_out=None, name=None):
+    """
+    Density rendering of the latent space for large numbers of points: the points of each category (week days,
+    weekend, holidays) are binned on a bins x bins grid of the first two latent dimensions, each cell is colored by the
+    mean of values and its opacity grows with the log of its number of points. The figure is drawn without pyplot,
+    so that it works headless, and its cost only depends on the grid size once the points are binned.
+
+    :param values: array (n,) of the values averaged in each cell (month, temperature, error)
+    :param cmap: name or matplotlib colormap
+    :param clim: (min, max) of the color scale, the range of values if None
+    :return: matplotlib figure
+    """
+    import matplotlib
+    from matplotlib import cm, colors
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    x_proj = np.asarray(x_proj)
+    values = np.asarray(values, dtype=np.float64)
+    n = x_proj.shape[0]
+    low = x_proj[:, :2].min(axis=0)
+    high = x_proj[:, :2].max(axis=0)
+    span = np.where(high > low, high - low, 1.)
+    cells = np.minimum(((x_proj[:, :2] - low) / span * bins).astype(np.int64), bins - 1)
+    cell = cells[:, 1] * bins + cells[:, 0]
+
+    if clim is None:
+        clim = (np.nanmin(values), np.nanmax(values))
+    norm = colors.Normalize(vmin=clim[0], vmax=clim[1])
+    cmap = matplotlib.colormaps[cmap] if isinstance(cmap, str) else cmap
+
+    categories = _latent_categories(calendar_info, n)
+    fig = Figure(figsize=size_fig)
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(1, len(categories), sharex=True, sharey=True, squeeze=False)[0]
+    counts = [np.bincount(cell[mask], minlength=bins * bins) for _, mask in categories]
+    max_count = max(1, max(c.max() for c in counts))
+    for ax, (category, mask), count in zip(axes, categories, counts):
+        total = np.bincount(cell[mask], weights=values[mask], minlength=bins * bins)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+        rgba = cmap(norm(mean.reshape(bins, bins)))
+        rgba[..., 3] = np.log1p(count.reshape(bins, bins)) / np.log1p(max_count)
+        ax.imshow(rgba, origin='lower', extent=(low[0], low[0] + span[0], low[1], low[1] + span[1]),
+                  aspect='auto', interpolation='nearest')
+        ax.set_title('{} ({} points)'.format(category, int(mask.sum())))
+    fig.colorbar(cm.ScalarMappable(norm=norm, cmap=cmap), ax=list(axes), label=label)
+    fig.suptitle('Projection on the latent space')
+
+    if name is None:
+        name = 'latent_space_proj'
+
+    if path_folder_out is not None:
+        fig.savefig(os.path.join(path_folder_out, name + '.png'))
+    return fig
 
 
-def pyplot_latent_space_projection(x_proj, calendar_info, path_folder_out, name=None, size_fig=(17,15)):
+def pyplot_latent_space_projection(x_proj, calendar_info, path_folder_out, name=None, size_fig=(17,15), mode='scatter',
+                                   bins=256, show=True):
     """
 
     :param x_proj:
     :param calendar_info:
     :param path_folder_out:
     :param name:
+    :param mode: 'scatter' to draw every point, 'density' to draw the mean month per cell with pyplot_latent_space_density
+    :param show: show the scatter figure with plt.show
     :return:
     """
+    if mode == 'density':
+        return pyplot_latent_space_density(x_proj, calendar_info, calendar_info.month, 'nipy_spectral', clim=(0.5, 12.5),
+                                           label='Month', bins=bins, size_fig=size_fig, path_folder_out=path_folder_out, name=name)
+
+    from matplotlib import pyplot as plt
 
     #Different possible colormap: nipy_spectral, plasma, viridis
 
@@ -92,9 +164,9 @@ def pyplot_latent_space_projection(x_proj, calendar_info, path_folder_out, name=
 
     plt.figure(figsize=size_fig)
     plt.scatter(x_proj[mask_isweekday, 0], x_proj[mask_isweekday, 1], marker='.', lw=2,
-                c=month[mask_isweekday], cmap=plt.cm.get_cmap('nipy_spectral', 12), label='Week days')
+                c=month[mask_isweekday], cmap=plt.get_cmap('nipy_spectral', 12), label='Week days')
     plt.scatter(x_proj[np.invert(mask_isweekday), 0], x_proj[np.invert(mask_isweekday), 1], marker='+', lw=2,
-                c=month[np.invert(mask_isweekday)], cmap=plt.cm.get_cmap('nipy_spectral', 12), label='Weekend')
+                c=month[np.invert(mask_isweekday)], cmap=plt.get_cmap('nipy_spectral', 12), label='Weekend')
 
     plt.colorbar(ticks=range(0, 12), label='Month')
     plt.clim(-0.5, 11.5)
@@ -110,18 +182,27 @@ def pyplot_latent_space_projection(x_proj, calendar_info, path_folder_out, name=
     if path_folder_out is not None:
         plt.savefig(os.path.join(path_folder_out, name + '.png'))
 
-    plt.show()
+    if show:
+        plt.show()
 
 
-def pyplot_latent_space_projection_temp(x_proj, calendar_info, temp, path_folder_out=None, name=None):
+def pyplot_latent_space_projection_temp(x_proj, calendar_info, temp, path_folder_out=None, name=None, size_fig=(17, 15),
+                                        mode='scatter', bins=256, show=True):
     """
 
     :param x_proj:
     :param calendar_info:
     :param path_folder_out:
     :param name:
+    :param mode: 'scatter' to draw every point, 'density' to draw the mean temperature per cell with pyplot_latent_space_density
+    :param show: show the scatter figure with plt.show
     :return:
     """
+    if mode == 'density':
+        return pyplot_latent_space_density(x_proj, calendar_info, temp, 'seismic', label='Temp', bins=bins,
+                                           size_fig=size_fig, path_folder_out=path_folder_out, name=name)
+
+    from matplotlib import pyplot as plt
 
     #Different possible colormap: seismic
 
@@ -134,11 +215,11 @@ def pyplot_latent_space_projection_temp(x_proj, calendar_info, temp, path_folder
     if 'is_hd' in calendar_info.columns:
         mask_ishd = calendar_info.is_hd.astype('bool')
 
-    plt.figure(figsize=(17, 15))
+    plt.figure(figsize=size_fig)
     plt.scatter(x_proj[mask_isweekday, 0], x_proj[mask_isweekday, 1], marker='.', lw=2,
-                c=temp[mask_isweekday], cmap=plt.cm.get_cmap('seismic'), label='Week days')
+                c=temp[mask_isweekday], cmap=plt.get_cmap('seismic'), label='Week days')
     plt.scatter(x_proj[np.invert(mask_isweekday), 0], x_proj[np.invert(mask_isweekday), 1], marker='+', lw=2,
-                c=temp[np.invert(mask_isweekday)], cmap=plt.cm.get_cmap('seismic'), label='Weekend')
+                c=temp[np.invert(mask_isweekday)], cmap=plt.get_cmap('seismic'), label='Weekend')
 
     plt.colorbar(label='Temp')
     #plt.clim(-0.5, 11.5)
@@ -154,18 +235,27 @@ def pyplot_latent_space_projection_temp(x_proj, calendar_info, temp, path_folder
     if path_folder_out is not None:
         plt.savefig(os.path.join(path_folder_out, name + '.png'))
 
-    plt.show()
+    if show:
+        plt.show()
 
 
-def pyplot_latent_space_projection_error(x_proj, calendar_info, error, color=None, path_folder_out=None, name=None):
+def pyplot_latent_space_projection_error(x_proj, calendar_info, error, color=None, path_folder_out=None, name=None,
+                                         size_fig=(17, 15), mode='scatter', bins=256, show=True):
     """
 
     :param x_proj:
     :param calendar_info:
     :param path_folder_out:
     :param name:
+    :param mode: 'scatter' to draw every point, 'density' to draw the mean error per cell with pyplot_latent_space_density
+    :param show: show the scatter figure with plt.show
     :return:
     """
+    if mode == 'density':
+        return pyplot_latent_space_density(x_proj, calendar_info, error, color or 'seismic', label='Error', bins=bins,
+                                           size_fig=size_fig, path_folder_out=path_folder_out, name=name)
+
+    from matplotlib import pyplot as plt
 
     #Different possible colormap: seismic
 
@@ -183,16 +273,16 @@ def pyplot_latent_space_projection_error(x_proj, calendar_info, error, color=Non
     if 'is_hd' in calendar_info.columns:
         mask_ishd = calendar_info.is_hd.astype('bool')
 
-    plt.figure(figsize=(17, 15))
+    plt.figure(figsize=size_fig)
     plt.scatter(x_proj[mask_isweekday, 0], x_proj[mask_isweekday, 1], marker='.', lw=2,
-                c=error[mask_isweekday], cmap=plt.cm.get_cmap(cmap_color), label='Week days')
+                c=error[mask_isweekday], cmap=plt.get_cmap(cmap_color), label='Week days')
     plt.scatter(x_proj[np.invert(mask_isweekday), 0], x_proj[np.invert(mask_isweekday), 1], marker='+', lw=2,
-                c=error[np.invert(mask_isweekday)], cmap=plt.cm.get_cmap(cmap_color), label='Weekend')
+                c=error[np.invert(mask_isweekday)], cmap=plt.get_cmap(cmap_color), label='Weekend')
 
     plt.colorbar(label='Error')
     #plt.clim(-0.5, 11.5)
     plt.scatter(x_proj[mask_ishd, 0], x_proj[mask_ishd, 1], marker='x', lw=3,
-                c=error[mask_ishd], cmap=plt.cm.get_cmap(cmap_color), label='Holiday Days')
+                c=error[mask_ishd], cmap=plt.get_cmap(cmap_color), label='Holiday Days')
 
     plt.legend()
     plt.title('Projection on the latent space')
@@ -203,7 +293,8 @@ def pyplot_latent_space_projection_error(x_proj, calendar_info, error, color=Non
     if path_folder_out is not None:
         plt.savefig(os.path.join(path_folder_out, name + '.png'))
 
-    plt.show()
+    if show:
+        plt.show()
 
 
 def plotly_latent_space_projection(x_proj, calendar_info, path_folder_out, name=None):
@@ -215,6 +306,8 @@ def plotly_latent_space_projection(x_proj, calendar_info, path_folder_out, name=
     :param name:
     :return:
     """
+    from plotly.offline import plot
+    from plotly.graph_objs import Scatter, Marker, ColorBar
 
     month = np.array(calendar_info.month)
 
@@ -279,7 +372,130 @@ def plotly_latent_space_projection(x_proj, calendar_info, path_folder_out, name=
     plot(fig, filename=os.path.join(path_folder_out, name + '.html'))
 
 
-def plot_latent_space_projection(x_proj, calendar_info, path_folder_out, name=None, pyplot=True, plotly=False):
+#script de la page html : les points visibles sont recharges depuis les donnees completes a chaque zoom
+LOD_SCRIPT = """
+var gd = document.getElementById('{plot_id}');
+var lod = %s;
+function decode(b64, Type) {
+    var bin = atob(b64), bytes = new Uint8Array(bin.length);
+    for (var i = 0; i < bin.length; i++) { bytes[i] = bin.charCodeAt(i); }
+    return new Type(bytes.buffer);
+}
+var X = decode(lod.x, Float32Array), Y = decode(lod.y, Float32Array), DAY = decode(lod.day, Int32Array);
+var MONTH = decode(lod.month, Int8Array), CATEGORY = decode(lod.category, Int8Array);
+var initial = null;
+function dayString(d) { return new Date(d * 86400000).toISOString().slice(0, 10); }
+gd.on('plotly_relayout', function(event) {
+    var traces = lod.traces;
+    if (initial === null) {
+        initial = {x: [], y: [], color: [], text: []};
+        traces.forEach(function(t) { var d = gd.data[t]; initial.x.push(d.x); initial.y.push(d.y); initial.color.push(d.marker.color); initial.text.push(d.text); });
+    }
+    if (event['xaxis.autorange'] || event['yaxis.autorange']) {
+        Plotly.restyle(gd, {x: initial.x, y: initial.y, 'marker.color': initial.color, text: initial.text}, traces);
+        return;
+    }
+    var xr = gd.layout.xaxis.range, yr = gd.layout.yaxis.range, visible = [];
+    for (var i = 0; i < X.length; i++) {
+        if (X[i] >= xr[0] && X[i] <= xr[1] && Y[i] >= yr[0] && Y[i] <= yr[1]) { visible.push(i); }
+    }
+    var step = Math.max(1, Math.ceil(visible.length / lod.max_points));
+    var update = {x: [], y: [], color: [], text: []};
+    traces.forEach(function() { update.x.push([]); update.y.push([]); update.color.push([]); update.text.push([]); });
+    for (var j = 0; j < visible.length; j += step) {
+        var k = visible[j], c = CATEGORY[k];
+        update.x[c].push(X[k]); update.y[c].push(Y[k]); update.color[c].push(MONTH[k]); update.text[c].push(dayString(DAY[k]));
+    }
+    update.color[lod.holiday] = initial.color[lod.holiday];
+    Plotly.restyle(gd, {x: update.x, y: update.y, 'marker.color': update.color, text: update.text}, traces);
+});
+"""
+
+
+def _stratified_sample(categories, x_proj, max_points, grid=32, seed=0):
+    """
+    Indices of a subsample of about max_points points: the same fraction of each stratum (category and cell of a
+    grid x grid grid of the latent space), with at least one point per stratum so that rare categories and isolated
+    points are kept.
+    """
+    n = x_proj.shape[0]
+    if n <= max_points:
+        return np.arange(n)
+    rng = np.random.RandomState(seed)
+    low = x_proj[:, :2].min(axis=0)
+    span = np.maximum(x_proj[:, :2].max(axis=0) - low, 1e-12)
+    cells = np.minimum(((x_proj[:, :2] - low) / span * grid).astype(np.int64), grid - 1)
+    strata = (categories * grid + cells[:, 0]) * grid + cells[:, 1]
+    order = np.lexsort((rng.rand(n), strata))
+    sorted_strata = strata[order]
+    starts = np.flatnonzero(np.r_[True, sorted_strata[1:] != sorted_strata[:-1]])
+    sizes = np.diff(np.r_[starts, n])
+    keep = np.maximum(np.round(sizes * max_points / float(n)).astype(np.int64), 1)
+    rank = np.arange(n) - np.repeat(starts, sizes)
+    return np.sort(order[rank < np.repeat(keep, sizes)])
+
+
+def plotly_latent_space_projection_webgl(x_proj, calendar_info, path_folder_out, name=None, max_points=20000,
+                                         density_bins=100, include_plotlyjs=True, seed=0):
+    """
+    WebGL (Scattergl) export of the latent space for large numbers of points. At most max_points points are drawn,
+    a stratified subsample of the days over a density heatmap of all of them; the coordinates, dates, months and
+    categories of all the days are embedded as base64 typed arrays and the visible points are reloaded from them
+    when zooming.
+
+    :param include_plotlyjs: True to write a self-contained html file, 'cdn' to load plotly.js from its cdn
+    :return: path of the html file
+    """
+    import json
+    import base64
+    import pandas as pd
+    import plotly.graph_objs as go
+    import plotly.io as pio
+
+    x_proj = np.asarray(x_proj, dtype=np.float32)
+    n = x_proj.shape[0]
+    month = np.asarray(calendar_info.month).astype(np.int8)
+    days = ((pd.to_datetime(calendar_info.ds) - pd.Timestamp('1970-01-01')).dt.days).values.astype(np.int32)
+    labels = ['Week Days', 'Week Ends', 'Holiday Days']
+    categories = np.zeros(n, dtype=np.int8)
+    for i, (_, mask) in enumerate(_latent_categories(calendar_info, n)):
+        categories[mask] = i
+
+    counts, x_edges, y_edges = np.histogram2d(x_proj[:, 0], x_proj[:, 1], bins=density_bins)
+    data = [go.Heatmap(z=np.log1p(counts.T).astype(np.float32), x=(x_edges[:-1] + x_edges[1:]) / 2,
+                       y=(y_edges[:-1] + y_edges[1:]) / 2, colorscale='Greys', opacity=0.4, showscale=False,
+                       hoverinfo='skip', name='Density')]
+    sample = _stratified_sample(categories, x_proj, max_points, seed=seed)
+    symbols = ['circle', 'x', 'cross']
+    for i, label in enumerate(labels):
+        index = sample[categories[sample] == i]
+        marker = dict(size=5 if i < 2 else 7, symbol=symbols[i])
+        if i < 2:
+            marker.update(color=month[index], colorscale='Viridis', cmin=1, cmax=12, colorbar=dict(title='Month'))
+        else:
+            marker.update(color='black')
+        data.append(go.Scattergl(x=x_proj[index, 0], y=x_proj[index, 1], name=label, mode='markers',
+                                 text=pd.to_datetime(days[index], unit='D').strftime('%Y-%m-%d').tolist(),
+                                 hoverinfo='text', marker=marker))
+
+    layout = dict(title='Projection on the latent space ({} of {} days drawn)'.format(len(sample), n),
+                  yaxis=dict(zeroline=False), xaxis=dict(zeroline=False), legend=dict(x=-.1, y=1.2))
+    fig = go.Figure(data=data, layout=layout)
+
+    def b64(array):
+        return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode('ascii')
+
+    lod = {'x': b64(x_proj[:, 0]), 'y': b64(x_proj[:, 1]), 'day': b64(days), 'month': b64(month),
+           'category': b64(categories), 'max_points': max_points, 'traces': [1, 2, 3], 'holiday': 2}
+
+    if name is None:
+        name = 'latent_space_proj'
+    path = os.path.join(path_folder_out, name + '.html')
+    pio.write_html(fig, path, include_plotlyjs=include_plotlyjs, post_script=LOD_SCRIPT % json.dumps(lod), auto_open=False)
+    return path
+
+
+def plot_latent_space_projection(x_proj, calendar_info, path_folder_out, name=None, pyplot=True, plotly=False, webgl=False):
     """
 
     :param x_proj:
@@ -288,12 +504,16 @@ def plot_latent_space_projection(x_proj, calendar_info, path_folder_out, name=No
     :param name:
     :param pyplot:
     :param plotly:
+    :param webgl: use plotly_latent_space_projection_webgl instead of the scatter export, for large numbers of days
     :return:
     """
     if pyplot:
         pyplot_latent_space_projection(x_proj=x_proj, calendar_info=calendar_info,
                                        path_folder_out=path_folder_out, name=name)
 
-    if plotly:
+    if plotly and webgl:
+        plotly_latent_space_projection_webgl(x_proj=x_proj, calendar_info=calendar_info,
+                                             path_folder_out=path_folder_out, name=name)
+    elif plotly:
         plotly_latent_space_projection(x_proj=x_proj, calendar_info=calendar_info,
                                        path_folder_out=path_folder_out, name=name)
\ No newline at end of file
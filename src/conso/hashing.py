@@ -0,0 +1,27 @@
+import hashlib
+import numpy as np
+
+
+def input_hash(*inputs):
+    """
+    Hash of the inputs of a cached computation, e.g. to know if a projector file or a neighbor index is up to date.
+
+    :return: sha1 of arrays, dataframes, dicts and scalars
+    """
+    import pandas as pd
+
+    h = hashlib.sha1()
+    for value in inputs:
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            h.update(repr(list(value.columns) if isinstance(value, pd.DataFrame) else value.name).encode())
+            h.update(pd.util.hash_pandas_object(value, index=False).values.tobytes())
+        elif isinstance(value, np.ndarray):
+            h.update('{}{}'.format(value.shape, value.dtype).encode())
+            h.update(np.ascontiguousarray(value).tobytes())
+        elif isinstance(value, dict):
+            for key in sorted(value):
+                h.update(repr(key).encode())
+                h.update(input_hash(value[key]).encode())
+        else:
+            h.update(repr(value).encode())
+    return h.hexdigest()
@@ -2,8 +2,6 @@ import os
 import datetime
 import pandas as pd
 import numpy as np
-import pickle
-from sklearn.preprocessing import StandardScaler, MinMaxScaler
 
 
 
@@ -152,6 +150,7 @@ def normalize_xconso(dict_xconso, type_scaler = 'standard'):
     cols_to_normalized = mask_conso + mask_meteo
 
     # Fitting scaler on train
+    from sklearn.preprocessing import StandardScaler, MinMaxScaler
     if type_scaler == 'standard':
         scaler = StandardScaler(with_mean=True, with_std=True)
     elif type_scaler == 'minmax':
@@ -253,6 +252,9 @@ def get_x_cond_autoencoder(x_conso, type_x = ['conso'], type_cond = ['month', 'w
     return x_ae, cond, ds
 
 
+#ordre des colonnes de la matrice des conditions de get_cond_autoencoder, quel que soit l'ordre de type_cond
+CONDITION_ORDER = ['month', 'weekday', 'day', 'holidays', 'temp', 'temperature']
+
 def get_cond_autoencoder(x_conso, ds, type_cond=['month', 'weekday'], data_conso_df=None):
 
     # get calendar info
@@ -299,6 +301,7 @@ def get_cond_autoencoder(x_conso, ds, type_cond=['month', 'weekday'], data_conso
 
         mean_meteo_nat_df = pd.DataFrame(meteo_nat_df.groupby(['day']).mean())
 
+        from sklearn.preprocessing import MinMaxScaler
         scaler = MinMaxScaler()
         scalerfit = scaler.fit(np.array(mean_meteo_nat_df['temperature_France']).reshape(-1, 1))
         cond_temp = scalerfit.transform(np.array(mean_meteo_nat_df['temperature_France']).reshape(-1, 1))
@@ -330,6 +333,83 @@ def get_cond_autoencoder(x_conso, ds, type_cond=['month', 'weekday'], data_conso
 
     return cond
 
+def get_condition_encoders(x_conso, ds, type_cond=['month', 'weekday']):
+    """
+    Describe how each condition of get_cond_autoencoder is encoded, to be saved with the model.
+
+    :param x_conso: dataframe used to build the conditions
+    :param ds: dates of the days, as returned by get_x_cond_autoencoder
+    :param type_cond: conditions given to get_cond_autoencoder
+    :return: dict condition -> description of its encoding and number of columns, and 'order', the conditions
+             in the order of the columns of the condition matrix
+    """
+    ds = pd.Series(ds).reset_index(drop=True)
+    steps_per_day = int(round(x_conso.shape[0] / len(ds)))
+
+    encoders = {}
+    order = [condition for condition in CONDITION_ORDER if condition in type_cond]
+    for condition in order:
+        if condition == 'month':
+            categories = sorted(int(m) for m in ds.dt.month.unique())
+            encoders[condition] = {'type': 'one_hot', 'categories': categories, 'n_columns': len(categories)}
+        elif condition == 'weekday':
+            encoders[condition] = {'type': 'binary', 'rule': 'weekday < 5', 'n_columns': 1}
+        elif condition == 'day':
+            categories = sorted(int(d) for d in ds.dt.weekday.unique())
+            encoders[condition] = {'type': 'one_hot', 'categories': categories, 'n_columns': len(categories)}
+        elif condition == 'holidays':
+            encoders[condition] = {'type': 'binary', 'column': 'is_holiday_day', 'n_columns': 1}
+        elif condition == 'temp':
+            day = (x_conso['ds'] - x_conso['ds'][0]).dt.days
+            mean_temperature = x_conso['temperature_France'].groupby(day).mean()
+            encoders[condition] = {'type': 'minmax', 'column': 'temperature_France', 'aggregation': 'daily_mean',
+                                   'data_min': float(mean_temperature.min()), 'data_max': float(mean_temperature.max()),
+                                   'n_columns': 1}
+        elif condition == 'temperature':
+            encoders[condition] = {'type': 'profile', 'column': 'temperature_France', 'steps': steps_per_day,
+                                   'n_columns': steps_per_day}
+    encoders['order'] = order
+
+    return encoders
+
+def get_daily_aggregates(x_conso, columns=['temperature_France', 'consumption_France'], steps_per_day=None):
+    """
+    Min, mean, max and standard deviation of each column for each day, whatever the granularity of x_conso.
+
+    :param x_conso: dataframe sorted by date, with a 'ds' column
+    :param columns: columns to aggregate, the ones missing from x_conso are skipped
+    :param steps_per_day: if given, the days are consecutive blocks of steps_per_day rows instead of being read from 'ds'
+    :return: dataframe with one row per day, a 'ds' column with the first timestamp of the day and
+             the columns <column>_min, <column>_mean, <column>_max and <column>_std
+    """
+    n = x_conso.shape[0]
+    if steps_per_day is not None or 'ds' not in x_conso.columns:
+        if steps_per_day is None:
+            steps_per_day = 48
+        starts = np.arange(0, n, steps_per_day)
+    else:
+        day = np.asarray((x_conso['ds'] - x_conso['ds'].iloc[0]).dt.days)
+        starts = np.concatenate(([0], np.where(np.diff(day) != 0)[0] + 1))
+    day_of_row = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+
+    aggregates = pd.DataFrame(index=np.arange(len(starts)))
+    if 'ds' in x_conso.columns:
+        aggregates['ds'] = x_conso['ds'].values[starts]
+    for column in columns:
+        if column not in x_conso.columns:
+            continue
+        values = np.asarray(x_conso[column], dtype=np.float64)
+        valid = ~np.isnan(values)
+        count = np.add.reduceat(valid, starts)
+        mean = np.add.reduceat(np.where(valid, values, 0), starts) / np.maximum(count, 1)
+        centered = np.where(valid, values - mean[day_of_row], 0)
+        aggregates[column + '_min'] = np.fmin.reduceat(values, starts)
+        aggregates[column + '_mean'] = np.where(count > 0, mean, np.nan)
+        aggregates[column + '_max'] = np.fmax.reduceat(values, starts)
+        aggregates[column + '_std'] = np.where(count > 1, np.sqrt(np.add.reduceat(centered ** 2, starts) / np.maximum(count - 1, 1)), np.nan)
+
+    return aggregates
+
 def get_y_autoencoder(x_conso,slidingWindowSize=0):
 
 
@@ -370,7 +450,11 @@ def get_y_autoencoder(x_conso,slidingWindowSize=0):
     return y_ae
     
 
-def get_dataset_autoencoder(dict_xconso, type_x=['conso'],type_cond=['month', 'weekday'],slidingWindowSize=0, isYNormalized=True,dict_xconso_unormalized=None):
+def get_dataset_autoencoder(dict_xconso, type_x=['conso'],type_cond=['month', 'weekday'],slidingWindowSize=0, isYNormalized=True,dict_xconso_unormalized=None,scaler=None):
+    """
+    :param scaler: scaler returned by normalize_xconso, kept in each split with the condition encoders so that
+                   main_train saves them with the model
+    """
 
     dataset = {}
     
@@ -384,5 +468,7 @@ def get_dataset_autoencoder(dict_xconso, type_x=['conso'],type_cond=['month', 'w
             x_conso_non_normalized=dict_xconso_unormalized[key]
             y =  get_y_autoencoder(x_conso_non_normalized,slidingWindowSize=0)
             dataset[key] = {'x': [x, cond], 'y': y, 'ds': cvae_ds}
+        dataset[key]['condition_encoders'] = get_condition_encoders(x_conso_normalized, cvae_ds, type_cond)
+        dataset[key]['scaler'] = scaler
 
     return dataset
@@ -3,7 +3,6 @@ import datetime
 import pandas as pd
 import numpy as np
 import pickle
-from matplotlib import pyplot as plt
 
 def enumerate_days(ds):
     """
@@ -58,6 +57,7 @@ def plot_conso_day(date, X, ds):
 
     date_day_ds = [dt for dt in datetime_range(date_dt, date_dt + datetime.timedelta(days=1), time_step)]
 
+    from matplotlib import pyplot as plt
     plt.plot(date_day_ds, conso_day)
     plt.show()
 
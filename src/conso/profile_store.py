@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+
+class ProfileStore():
+    """
+    Daily load profiles indexed by date: the original curves, their reconstructions, the conditions and the latent
+    codes of any set of dates are found by one array lookup, without scanning the ds series.
+    """
+    def __init__(self, ds, x, x_hat=None, conditions=None, latent=None):
+        """
+
+        :param ds: dates of the days (one per row of x)
+        :param x: array (n_days, n_steps) of the daily load profiles
+        :param x_hat: array (n_days, n_steps) of the reconstructed profiles
+        :param conditions: array (n_days, d) or list of arrays of the conditions of the days (e.g. the cvae inputs)
+        :param latent: array (n_days, z_dim) of the latent codes
+        """
+        self.ds = pd.DatetimeIndex(pd.to_datetime(np.asarray(ds))).normalize()
+        self.x = np.asarray(x)
+        self.x_hat = None if x_hat is None else np.asarray(x_hat)
+        self.conditions = conditions
+        self.latent = None if latent is None else np.asarray(latent)
+
+        #table des lignes par jour depuis le premier jour, -1 pour les jours absents
+        days = self._days(self.ds)
+        self.first_day = days.min()
+        self.row_of_day = np.full(days.max() - self.first_day + 1, -1, dtype=np.int64)
+        if len(np.unique(days)) != len(days):
+            raise ValueError('The dates of a ProfileStore must be unique')
+        self.row_of_day[days - self.first_day] = np.arange(len(days))
+
+    @classmethod
+    def fromDataset(cls, dataset, x_hat=None, latent=None):
+        """
+        :param dataset: one split of the dataset, e.g. dataset['train'], with the ds of the days and x = [x, conditions...]
+        """
+        inputs = dataset['x']
+        if isinstance(inputs, (list, tuple)):
+            x, conditions = inputs[0], list(inputs[1:])
+        else:
+            x, conditions = inputs, None
+        return cls(dataset['ds'], x, x_hat=x_hat, conditions=conditions, latent=latent)
+
+    @staticmethod
+    def _days(dates):
+        return dates.values.astype('datetime64[D]').astype(np.int64)
+
+    def __len__(self):
+        return len(self.ds)
+
+    def __contains__(self, date):
+        return bool(np.all(self.rows(date, missing=-1) >= 0))
+
+    def rows(self, dates, missing='raise'):
+        """
+        :param dates: date (str, datetime, Timestamp) or list/array/Series of dates
+        :param missing: 'raise' to raise a KeyError for the dates not in the store, or the row returned for them
+        :return: array of the rows of the dates
+        """
+        dates = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(np.asarray(dates, dtype=object)))).normalize()
+        offsets = self._days(dates) - self.first_day
+        inside = (offsets >= 0) & (offsets < len(self.row_of_day))
+        rows = np.full(len(offsets), -1, dtype=np.int64)
+        rows[inside] = self.row_of_day[offsets[inside]]
+        if missing == 'raise':
+            if np.any(rows < 0):
+                raise KeyError('Dates not in the store: {}'.format([str(d.date()) for d in dates[rows < 0]]))
+        else:
+            rows[rows < 0] = missing
+        return rows
+
+    def get(self, dates):
+        """
+        :return: dict with the ds, x and, when available, x_hat, conditions and latent of the dates
+        """
+        rows = self.rows(dates)
+        result = {'ds': self.ds[rows], 'x': self.x[rows]}
+        if self.x_hat is not None:
+            result['x_hat'] = self.x_hat[rows]
+        if self.conditions is not None:
+            if isinstance(self.conditions, list):
+                result['conditions'] = [np.asarray(c)[rows] for c in self.conditions]
+            else:
+                result['conditions'] = np.asarray(self.conditions)[rows]
+        if self.latent is not None:
+            result['latent'] = self.latent[rows]
+        return result
+
+    def time_axis(self, date):
+        """
+        :return: timestamps of the steps of the day
+        """
+        day = pd.Timestamp(date).normalize()
+        return day + pd.to_timedelta(np.arange(self.x.shape[1]) * (24 * 60 // self.x.shape[1]), unit='m')
+
+    def plot_days(self, dates, n_cols=5, size_subplot=(2, 2), path=None, show=True):
+        """
+        Plot the original (and reconstructed) profiles of the dates on one grid of subplots.
+
+        :param path: file where the figure is saved
+        :return: matplotlib figure
+        """
+        from matplotlib import pyplot as plt
+
+        days = self.get(dates)
+        n = len(days['ds'])
+        n_cols = min(n_cols, n)
+        n_rows = int(np.ceil(n / float(n_cols)))
+        fig, axes = plt.subplots(n_rows, n_cols, figsize=(size_subplot[0] * n_cols, size_subplot[1] * n_rows),
+                                 squeeze=False)
+        hours = np.arange(self.x.shape[1]) * 24. / self.x.shape[1]
+        for i, ax in enumerate(axes.ravel()):
+            if i >= n:
+                ax.axis('off')
+                continue
+            ax.plot(hours, days['x'][i])
+            if 'x_hat' in days:
+                ax.plot(hours, days['x_hat'][i])
+            ax.set_title(str(days['ds'][i].date()))
+        fig.subplots_adjust(hspace=.5)
+        if path is not None:
+            fig.savefig(path)
+        if show:
+            plt.show()
+        return fig
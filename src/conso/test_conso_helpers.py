@@ -0,0 +1,72 @@
+import matplotlib
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+from conso.conso_helpers import _stratified_sample, pyplot_latent_space_density, pyplot_latent_space_projection
+
+
+def _calendar(n, rng):
+    return pd.DataFrame({'month': rng.randint(1, 13, size=n),
+                         'is_weekday': (rng.rand(n) < 0.7).astype(int),
+                         'is_hd': (rng.rand(n) < 0.1).astype(int)})
+
+
+def test_stratified_sample_keeps_every_stratum():
+    rng = np.random.RandomState(0)
+    n = 50000
+    x_proj = rng.randn(n, 2)
+    categories = (rng.rand(n) < 0.01).astype(np.int64)
+    #quelques jours isoles loin du nuage, chacun dans sa cellule
+    x_proj[:5] = [[40, 40], [40, -40], [-40, 40], [-40, -40], [40, 0]]
+    sample = _stratified_sample(categories, x_proj, 2000, grid=16)
+    assert np.all(np.diff(sample) > 0)
+    assert abs(len(sample) - 2000) < 300
+    assert np.all(np.isin(np.arange(5), sample))
+    #meme proportion de jours rares que dans l'ensemble
+    assert abs(categories[sample].mean() - categories.mean()) < 0.01
+    np.testing.assert_array_equal(_stratified_sample(categories, x_proj, 2000, grid=16), sample)
+    np.testing.assert_array_equal(_stratified_sample(categories, x_proj, n), np.arange(n))
+
+
+def test_density_cells_match_histogram2d():
+    rng = np.random.RandomState(0)
+    n, bins = 2000, 8
+    x_proj = rng.randn(n, 3)
+    calendar_info = _calendar(n, rng)
+    values = rng.rand(n) * 10
+    fig = pyplot_latent_space_density(x_proj, calendar_info, values, 'viridis', clim=(0, 10), bins=bins, size_fig=(6, 3))
+
+    is_weekday = calendar_info.is_weekday.values.astype(bool)
+    is_hd = calendar_info.is_hd.values.astype(bool)
+    masks = [is_weekday & ~is_hd, ~is_weekday & ~is_hd, is_hd]
+    edges = [np.linspace(x_proj[:, j].min(), x_proj[:, j].max(), bins + 1) for j in range(2)]
+    counts = [np.histogram2d(x_proj[m, 0], x_proj[m, 1], bins=edges)[0].T for m in masks]
+    max_count = max(c.max() for c in counts)
+    cmap = matplotlib.colormaps['viridis']
+    images = [ax.images[0].get_array() for ax in fig.axes if ax.images]
+    assert len(images) == 3
+    for mask, count, rgba in zip(masks, counts, images):
+        total = np.histogram2d(x_proj[mask, 0], x_proj[mask, 1], bins=edges, weights=values[mask])[0].T
+        filled = count > 0
+        #couleur de la moyenne de la cellule, opacite en log du nombre de points
+        np.testing.assert_allclose(rgba[filled][:, :3], cmap(total[filled] / count[filled] / 10.)[:, :3])
+        np.testing.assert_allclose(rgba[..., 3], np.log1p(count) / np.log1p(max_count))
+    assert [ax.get_title() for ax in fig.axes[:3]] == ['Week days ({} points)'.format(masks[0].sum()),
+                                                       'Weekend ({} points)'.format(masks[1].sum()),
+                                                       'Holiday Days ({} points)'.format(masks[2].sum())]
+
+
+def test_density_projection_is_headless(monkeypatch):
+    from matplotlib import pyplot as plt
+
+    def fail():
+        raise AssertionError('plt.show called')
+
+    monkeypatch.setattr(plt, 'show', fail)
+    rng = np.random.RandomState(1)
+    fig = pyplot_latent_space_projection(rng.randn(300, 2), _calendar(300, rng), None, mode='density', bins=16,
+                                         size_fig=(6, 3))
+    assert isinstance(fig, Figure)
+    #les mois 1..12 sont centres sur l'echelle de couleur
+    assert fig.axes[-1].get_ylim() == (0.5, 12.5)
@@ -0,0 +1,17 @@
+import os
+import sys
+import subprocess
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#modules lourds qui ne doivent etre charges que par les fonctions qui les utilisent
+HEAVY_MODULES = ['tensorflow', 'keras', 'plotly', 'matplotlib', 'sklearn']
+
+
+def test_helpers_import_without_heavy_backends():
+    #nouvel interpreteur pour que les modules deja charges par les autres tests ne comptent pas
+    code = ('import sys; sys.path.insert(0, {!r}); '
+            'import conso.load_shape_data, conso.conso_helpers, Visualisation.buildProjector; '
+            'print(sorted(set(m.split(".")[0] for m in sys.modules) & set({!r})))').format(SRC, HEAVY_MODULES)
+    loaded = subprocess.check_output([sys.executable, '-c', code]).decode().strip()
+    assert loaded == '[]'
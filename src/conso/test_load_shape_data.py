@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conso.load_shape_data import get_daily_aggregates
+
+
+def _x_conso(freq, n_days=20, seed=0):
+    rng = np.random.RandomState(seed)
+    ds = pd.date_range('2013-01-01', periods=n_days * pd.Timedelta('1D') // pd.Timedelta(freq), freq=freq)
+    temperature = rng.randn(len(ds)) * 5 + 10
+    temperature[rng.rand(len(ds)) < 0.05] = np.nan
+    return pd.DataFrame({'ds': ds, 'temperature_France': temperature, 'consumption_France': rng.rand(len(ds)) * 1e4})
+
+
+@pytest.mark.parametrize('freq', ['15min', '30min', '1h'])
+def test_daily_aggregates_match_groupby(freq):
+    x_conso = _x_conso(freq)
+    aggregates = get_daily_aggregates(x_conso)
+    for column in ['temperature_France', 'consumption_France']:
+        expected = x_conso.groupby(x_conso['ds'].dt.normalize())[column].agg(['min', 'mean', 'max', 'std'])
+        for statistic in expected.columns:
+            np.testing.assert_allclose(aggregates[column + '_' + statistic].values, expected[statistic].values)
+    np.testing.assert_array_equal(aggregates['ds'].values, x_conso['ds'].values[::len(x_conso) // 20])
+
+
+def test_daily_aggregates_by_fixed_blocks():
+    x_conso = _x_conso('30min').drop(columns=['ds'])
+    aggregates = get_daily_aggregates(x_conso, columns=['temperature_France', 'missing_column'])
+    assert list(aggregates.columns) == ['temperature_France_min', 'temperature_France_mean', 'temperature_France_max',
+                                        'temperature_France_std']
+    blocks = x_conso['temperature_France'].values.reshape(20, 48)
+    np.testing.assert_allclose(aggregates['temperature_France_max'].values, np.nanmax(blocks, axis=1))
+    np.testing.assert_allclose(aggregates['temperature_France_mean'].values, np.nanmean(blocks, axis=1))
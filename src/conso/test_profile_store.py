@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conso.profile_store import ProfileStore
+
+
+def _store(n_days=400, seed=0):
+    rng = np.random.RandomState(seed)
+    ds = pd.date_range('2013-01-01', periods=n_days, freq='D')
+    #quelques jours manquants, dans le desordre
+    keep = np.sort(rng.permutation(n_days)[:n_days - 20])
+    ds = ds[keep][rng.permutation(len(keep))]
+    x = rng.rand(len(ds), 48)
+    return ProfileStore(ds, x, x_hat=x + 1, conditions=[np.arange(len(ds)), -np.arange(len(ds))], latent=x[:, :3]), ds, x
+
+
+def test_lookups_match_pandas():
+    store, ds, x = _store()
+    frame = pd.DataFrame(x, index=ds)
+    dates = ds[np.random.RandomState(1).randint(len(ds), size=200)]
+    np.testing.assert_array_equal(store.rows(dates), pd.Index(ds).get_indexer(dates))
+    result = store.get([str(d.date()) for d in dates])
+    np.testing.assert_array_equal(result['x'], frame.loc[dates].values)
+    np.testing.assert_array_equal(result['x_hat'], frame.loc[dates].values + 1)
+    np.testing.assert_array_equal(result['conditions'][1], -pd.Index(ds).get_indexer(dates))
+    assert list(result['ds']) == list(dates)
+    #les heures d'une date sont ignorees
+    assert store.rows(dates[0] + pd.Timedelta('13h'))[0] == store.rows(dates[0])[0]
+
+
+def test_missing_dates():
+    store, ds, _ = _store()
+    missing = pd.date_range('2013-01-01', periods=400, freq='D').difference(ds)
+    with pytest.raises(KeyError):
+        store.get(missing[:2])
+    with pytest.raises(KeyError):
+        store.rows('2030-01-01')
+    assert missing[0] not in store and ds[0] in store
+    np.testing.assert_array_equal(store.rows(list(missing[:3]) + ['2030-01-01'], missing=-1), -1)
+
+
+def test_duplicate_dates_are_rejected():
+    with pytest.raises(ValueError):
+        ProfileStore(['2013-01-01', '2013-01-01'], np.zeros((2, 48)))
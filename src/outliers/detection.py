@@ -0,0 +1,154 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from outliers.latent_index import loadOrBuildIndex
+
+#niveaux de contamination des notebooks outliers_detection (1% a 10%)
+CONTAMINATIONS = np.arange(1, 11) / 100.
+
+SCORE_COLUMNS = ['knn_distance', 'density_ratio', 'reconstruction_error']
+
+
+def outlierScores(index, n_neighbors=1, x=None, x_hat=None, k=None):
+    """
+    Outlier scores of all the indexed days, computed at once from the stored neighbors. An index saved with more
+    neighbors than requested gives the same scores as an index built with k neighbors.
+
+    knn_distance: distance to the n_neighbors-th nearest other day (n_neighbors=1 is the KNN of the notebooks)
+    density_ratio: mean distance of the day to its k neighbors divided by the one of its neighbors,
+                   above 1 when the day lies in a sparser region than its neighbors (simplified LOF)
+    reconstruction_error: RMSE between x and x_hat, if they are given
+
+    :param index: LatentNeighborIndex
+    :param x: array (n, n_steps) of the daily load profiles
+    :param x_hat: array (n, n_steps) of their reconstructions
+    :param k: number of neighbors of density_ratio, all the neighbors of the index if None
+    :return: dataframe of the scores, one row per day
+    """
+    k = index.k if k is None else k
+    if k > index.k:
+        raise ValueError('k={} but the index only has {} neighbors'.format(k, index.k))
+    if n_neighbors > k:
+        raise ValueError('n_neighbors={} but only {} neighbors are used'.format(n_neighbors, k))
+    #les voisins sont tries par distance : les k premiers sont ceux d'un index construit avec k voisins
+    distances = index.distances[:, :k]
+    neighbors = index.neighbors[:, :k]
+    mean_distance = distances.mean(axis=1)
+    neighbors_distance = mean_distance[neighbors].mean(axis=1)
+    #les jours dont les voisins sont confondus ont un ratio de 1 s'ils le sont aussi, infini sinon
+    with np.errstate(divide='ignore', invalid='ignore'):
+        density_ratio = np.where(mean_distance == neighbors_distance, 1., mean_distance / neighbors_distance)
+    scores = pd.DataFrame({'knn_distance': distances[:, n_neighbors - 1], 'density_ratio': density_ratio})
+    if x is not None and x_hat is not None:
+        scores['reconstruction_error'] = np.sqrt(np.mean((np.asarray(x) - np.asarray(x_hat)) ** 2, axis=1))
+    return scores
+
+
+def quantileThresholds(scores, quantile=0.99):
+    """
+    :param scores: dataframe of the scores, see outlierScores
+    :param quantile: quantile of each score above which a day is an outlier
+    :return: series of the threshold of each score
+    """
+    return pd.Series(np.percentile(scores.values, 100 * quantile, axis=0), index=scores.columns)
+
+
+def contaminationFrequency(score, contaminations=CONTAMINATIONS):
+    """
+    Number of contamination levels at which each day is an outlier, as in the notebooks: for a contamination c,
+    the outliers are the days whose score is above the 1-c quantile of the scores (threshold of pyod).
+
+    :return: array (n,) of int
+    """
+    score = np.asarray(score)
+    thresholds = np.percentile(score, 100 * (1 - np.asarray(contaminations)))
+    return np.sum(score[:, None] > thresholds[None, :], axis=1)
+
+
+def detectOutliers(scores, score='knn_distance', contaminations=CONTAMINATIONS, quantile=None):
+    """
+    :param scores: dataframe of the scores, see outlierScores
+    :param score: score ranked by contaminationFrequency
+    :param quantile: if given, the days above the quantile of any score are also kept
+    :return: dataframe of the scores and frequency of the outliers, indexed by their row
+    """
+    frequency = contaminationFrequency(scores[score].values, contaminations)
+    selected = frequency > 0
+    if quantile is not None:
+        selected |= np.any(scores.values > quantileThresholds(scores, quantile).values, axis=1)
+    outliers = scores[selected].copy()
+    outliers['frequency'] = frequency[selected]
+    return outliers
+
+
+def writeOutliers(path, metadata, outliers):
+    """
+    Write the detected outliers with their metadata, in the format of outliers_detection/results:
+    the rows of the metadata, their frequency and then their scores.
+
+    :param metadata: dataframe of the metadata of all the days, e.g. read with readMetaData
+    :param outliers: dataframe returned by detectOutliers
+    """
+    table = metadata.iloc[outliers.index].copy()
+    table['frequency'] = outliers['frequency'].values
+    for column in SCORE_COLUMNS:
+        if column in outliers:
+            table[column] = outliers[column].values
+    table.to_csv(path)
+    return table
+
+
+def runOutlierDetection(projector_dir, output_path=None, index_dir=None, k=10, n_neighbors=1, tensor_name=None,
+                        contaminations=CONTAMINATIONS, quantile=None, x=None, x_hat=None):
+    """
+    Outlier detection on the latent codes of a projector. The neighbor index is saved in index_dir and reused
+    by the next runs while it has at least k neighbors: the days appended to the latent codes since the last run
+    are added to it, and the scores of all the days are recomputed from the stored neighbors.
+
+    :param projector_dir: folder written by buildProjector
+    :param output_path: csv file of the outliers, projector_dir/detected_outliers.csv if None
+    :param index_dir: folder of the neighbor index, projector_dir/outliers_index if None
+    :param tensor_name: embedding of the projector, the first one if None
+    :return: dataframe of the outliers with their metadata
+    """
+    from Visualisation.projector_reader import loadProjectorEmbeddings
+
+    embeddings = loadProjectorEmbeddings(projector_dir)
+    embedding = embeddings[0]
+    for e in embeddings:
+        if e['name'] == tensor_name:
+            embedding = e
+    index_dir = index_dir or os.path.join(projector_dir, 'outliers_index')
+    output_path = output_path or os.path.join(projector_dir, 'detected_outliers.csv')
+
+    index = loadOrBuildIndex(index_dir, embedding['tensor'], k=k)
+    scores = outlierScores(index, n_neighbors=n_neighbors, x=x, x_hat=x_hat, k=k)
+    outliers = detectOutliers(scores, contaminations=contaminations, quantile=quantile)
+    metadata = embedding['metadata']
+    if metadata is None:
+        metadata = pd.DataFrame(index=np.arange(len(index)))
+    return writeOutliers(output_path, metadata, outliers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detect the outlier days of the latent space of a projector')
+    parser.add_argument('projector_dir')
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--index-dir', default=None)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--n-neighbors', type=int, default=1)
+    parser.add_argument('--tensor-name', default=None)
+    parser.add_argument('--quantile', type=float, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    outliers = runOutlierDetection(args.projector_dir, args.output, args.index_dir, k=args.k,
+                                   n_neighbors=args.n_neighbors, tensor_name=args.tensor_name, quantile=args.quantile)
+    print('{} outliers detected in {:.2f}s'.format(len(outliers), time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
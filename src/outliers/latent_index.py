@@ -0,0 +1,190 @@
+import os
+import json
+import numpy as np
+
+from conso.hashing import input_hash
+from FeaturesScore.neighbors import NeighborGraph, BruteForceIndex, build_index, _sq_distances, BLOCK_ELEMENTS
+
+#version du format de l'index, a incrementer a chaque changement incompatible
+INDEX_VERSION = 1
+
+MANIFEST_NAME = 'index_manifest.json'
+ARRAYS_NAME = 'index_arrays.npz'
+
+
+class LatentNeighborIndex():
+    """
+    k nearest neighbors of every day of a latent space, computed once and saved to a folder, so that the
+    outlier scores of the whole history are recomputed from the stored neighbors instead of a new search.
+    Only the codes and the neighbor lists and distances are saved: the search structure used by query is
+    rebuilt from the codes at the first query after a load.
+    The codes are standardized beforehand (as the pyod standardizer of the notebooks) unless standardize=False.
+    The days appended to the history are added with append, which keeps the statistics of the standardization.
+    """
+    def __init__(self, latent, k=10, backend='auto', standardize=True, **index_kwargs):
+        """
+
+        :param latent: latent codes (n, d)
+        :param k: number of neighbors of each day, other than itself
+        :param backend: neighbor search backend, see build_index
+        """
+        latent = np.asarray(latent, dtype=np.float64)
+        self.k = k
+        self.backend = backend
+        self.standardize = standardize
+        self.latent_hash = input_hash(latent)
+        if standardize:
+            self.mean = latent.mean(axis=0)
+            #les dimensions constantes ne sont pas mises a l'echelle, comme StandardScaler
+            std = latent.std(axis=0)
+            self.scale = np.where(std > 0, std, 1.)
+        else:
+            self.mean = np.zeros(latent.shape[1])
+            self.scale = np.ones(latent.shape[1])
+        self.codes = self.transform(latent)
+
+        graph = NeighborGraph(self.codes, k=k, n_candidates=k + 1, backend=backend, **index_kwargs)
+        self._index = graph.index
+        self.neighbors = graph.loo_neighbors()
+        self.distances = np.sqrt(np.sum((self.codes[self.neighbors] - self.codes[:, None]) ** 2, axis=2))
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def transform(self, latent):
+        """
+        :return: codes standardized with the statistics of the indexed latent space
+        """
+        return (np.asarray(latent, dtype=np.float64) - self.mean) / self.scale
+
+    def matches(self, latent, k=None):
+        """
+        :return: True if the index was built on these latent codes (and with at least k neighbors)
+        """
+        return self.latent_hash == input_hash(np.asarray(latent, dtype=np.float64)) and (k is None or k <= self.k)
+
+    def extends(self, latent):
+        """
+        :return: True if latent are the indexed latent codes followed by new days
+        """
+        latent = np.asarray(latent, dtype=np.float64)
+        return latent.shape[0] > len(self) and self.latent_hash == input_hash(latent[:len(self)])
+
+    def append(self, latent):
+        """
+        Add the days appended to the indexed latent codes. The neighbors of the new days are found with query and
+        among themselves, and only the indexed days that have a new day closer than their k-th neighbor get a new
+        neighbor list: the cost is one pass over the m new days and the n indexed ones, O(m*n*d), instead of a
+        full rebuild. The new days are standardized with the statistics of the indexed ones.
+
+        :param latent: latent codes of all the days, the indexed ones first, see extends
+        :return: rows of the days whose neighbor lists changed, new days included
+        """
+        latent = np.asarray(latent, dtype=np.float64)
+        n, k = len(self), self.k
+        new_codes = self.transform(latent[n:])
+        m = new_codes.shape[0]
+        new_rows = np.arange(n, n + m)
+
+        #voisins des nouveaux jours parmi les jours indexes et parmi les autres nouveaux jours
+        old_distances, old_neighbors = self.query(latent[n:], k)
+        new_distances, new_neighbors = BruteForceIndex(new_codes).query(new_codes, min(m, k + 1))
+        new_distances = np.where(new_neighbors == np.arange(m)[:, None], np.inf, new_distances)
+        distances, neighbors = _k_nearest(np.concatenate((old_distances, new_distances), axis=1),
+                                          np.concatenate((old_neighbors, new_neighbors + n), axis=1), k)
+
+        #jours indexes dont un nouveau jour est plus proche que le k-ieme voisin
+        changed = []
+        block = max(1, BLOCK_ELEMENTS // m)
+        for start in range(0, n, block):
+            d = np.sqrt(_sq_distances(self.codes[start:start + block], new_codes))
+            closer = d < self.distances[start:start + block, k - 1][:, None]
+            rows = np.where(closer.any(axis=1))[0]
+            if len(rows) == 0:
+                continue
+            candidates = np.where(closer[rows], d[rows], np.inf)
+            self.distances[start + rows], self.neighbors[start + rows] = _k_nearest(
+                np.concatenate((self.distances[start + rows], candidates), axis=1),
+                np.concatenate((self.neighbors[start + rows], np.broadcast_to(new_rows, candidates.shape)), axis=1), k)
+            changed.append(start + rows)
+
+        self.codes = np.concatenate((self.codes, new_codes))
+        self.neighbors = np.concatenate((self.neighbors, neighbors))
+        self.distances = np.concatenate((self.distances, distances))
+        self.latent_hash = input_hash(latent)
+        #la structure de recherche ne contient pas les nouveaux jours, elle sera reconstruite a la prochaine requete
+        self._index = None
+        return np.concatenate(changed + [new_rows])
+
+    def query(self, latent, k=None):
+        """
+        Neighbors among the indexed days of new latent codes, e.g. the days added since the index was built.
+
+        :return: distances and indices (n_queries, k) of the k nearest indexed days
+        """
+        if self._index is None:
+            self._index = build_index(self.codes, backend=self.backend)
+        return self._index.query(self.transform(latent), k or self.k)
+
+    def save(self, folder):
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        np.savez(os.path.join(folder, ARRAYS_NAME), codes=self.codes, mean=self.mean, scale=self.scale,
+                 neighbors=self.neighbors, distances=self.distances)
+        manifest = {'format_version': INDEX_VERSION, 'k': self.k, 'backend': self.backend,
+                    'standardize': self.standardize, 'n_days': len(self), 'latent_hash': self.latent_hash}
+        with open(os.path.join(folder, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    @classmethod
+    def load(cls, folder):
+        """
+        :param folder: folder written by save. The search structure is only rebuilt if query is called.
+        """
+        with open(os.path.join(folder, MANIFEST_NAME), 'r') as f:
+            manifest = json.load(f)
+        if manifest['format_version'] > INDEX_VERSION:
+            raise ValueError('Index format {} is more recent than the supported format {}'.format(
+                manifest['format_version'], INDEX_VERSION))
+
+        index = cls.__new__(cls)
+        index.k = manifest['k']
+        index.backend = manifest['backend']
+        index.standardize = manifest['standardize']
+        index.latent_hash = manifest['latent_hash']
+        with np.load(os.path.join(folder, ARRAYS_NAME)) as arrays:
+            for name in ['codes', 'mean', 'scale', 'neighbors', 'distances']:
+                setattr(index, name, arrays[name])
+        index._index = None
+        return index
+
+
+def _k_nearest(distances, neighbors, k):
+    """
+    :return: the k smallest distances of each row and their neighbors, by increasing distance
+    """
+    order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(neighbors, order, axis=1)
+
+
+def loadOrBuildIndex(folder, latent, k=10, backend='auto', standardize=True):
+    """
+    Load the index saved in folder if it was built on the same latent codes with at least k neighbors, otherwise
+    build it and save it. A loaded index may have more than k neighbors: outlierScores only uses the first k.
+    When days were appended to the latent codes since the index was saved, they are added to it with append
+    instead of rebuilding it, so that a daily run over a growing history only searches the new days.
+
+    :return: LatentNeighborIndex
+    """
+    if os.path.isfile(os.path.join(folder, MANIFEST_NAME)):
+        index = LatentNeighborIndex.load(folder)
+        if index.standardize == standardize and k <= index.k:
+            if index.matches(latent):
+                return index
+            if index.extends(latent):
+                index.append(latent)
+                index.save(folder)
+                return index
+    index = LatentNeighborIndex(latent, k=k, backend=backend, standardize=standardize)
+    index.save(folder)
+    return index
@@ -0,0 +1,78 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from outliers.detection import outlierScores, runOutlierDetection
+from outliers.latent_index import LatentNeighborIndex, loadOrBuildIndex
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+
+@pytest.mark.parametrize('model', ['CVAE_5couches-Day_WorkingDays_L1', 'CVAE_5couches-Month_Temp_Day-L1'])
+def test_detected_outliers_match_the_notebook_results(tmp_path, model):
+    outliers = runOutlierDetection(os.path.join(ROOT, 'Projectors_publication', 'projector_Conso_' + model),
+                                   output_path=str(tmp_path / 'outliers.csv'), index_dir=str(tmp_path / 'index'),
+                                   k=10, n_neighbors=1)
+    expected = pd.read_csv(os.path.join(ROOT, 'outliers_detection', 'results', 'detected_outliers_{}.csv'.format(model)),
+                           index_col=0)
+    np.testing.assert_array_equal(outliers.index.values, expected.index.values)
+    np.testing.assert_array_equal(outliers['frequency'].values, expected['frequency'].values)
+    assert list(outliers['Date']) == list(expected['Date'])
+
+
+def test_cached_index_with_more_neighbors_gives_the_same_scores(tmp_path):
+    latent = np.random.RandomState(0).randn(500, 4)
+    loadOrBuildIndex(str(tmp_path), latent, k=10)
+    #l'index a 10 voisins est relu pour une demande a 5 voisins
+    cached = loadOrBuildIndex(str(tmp_path), latent, k=5)
+    assert cached.k == 10
+    expected = outlierScores(LatentNeighborIndex(latent, k=5), n_neighbors=2)
+    pd.testing.assert_frame_equal(outlierScores(cached, n_neighbors=2, k=5), expected)
+    with pytest.raises(ValueError):
+        outlierScores(cached, n_neighbors=6, k=5)
+    with pytest.raises(ValueError):
+        outlierScores(cached, k=11)
+
+
+def test_loaded_index_queries_like_the_built_one(tmp_path):
+    rng = np.random.RandomState(1)
+    latent = rng.randn(300, 3)
+    index = loadOrBuildIndex(str(tmp_path), latent, k=5)
+    loaded = LatentNeighborIndex.load(str(tmp_path))
+    assert loaded._index is None
+    new_days = rng.randn(20, 3)
+    for result, expected in zip(loaded.query(new_days), index.query(new_days)):
+        np.testing.assert_allclose(result, expected)
+    np.testing.assert_array_equal(loaded.neighbors, index.neighbors)
+
+
+@pytest.mark.parametrize('n_new', [1, 7, 60])
+def test_appended_days_match_a_full_build(tmp_path, n_new):
+    rng = np.random.RandomState(3)
+    latent = rng.randn(800, 4)
+    loadOrBuildIndex(str(tmp_path), latent[:800 - n_new], k=6)
+    index = loadOrBuildIndex(str(tmp_path), latent, k=6)
+    assert len(index) == 800 and index.matches(latent)
+
+    #les nouveaux jours gardent la normalisation des jours deja indexes
+    codes = index.transform(latent)
+    expected = LatentNeighborIndex(codes, k=6, standardize=False)
+    np.testing.assert_array_equal(index.neighbors, expected.neighbors)
+    np.testing.assert_allclose(index.distances, expected.distances, rtol=1e-10)
+    #l'index mis a jour est sauvegarde et relu tel quel
+    loaded = LatentNeighborIndex.load(str(tmp_path))
+    assert loaded.matches(latent)
+    np.testing.assert_array_equal(loaded.neighbors, expected.neighbors)
+
+
+def test_append_only_refreshes_the_changed_rows():
+    rng = np.random.RandomState(4)
+    latent = rng.randn(500, 3)
+    index = LatentNeighborIndex(latent[:499], k=5)
+    before = index.neighbors.copy()
+    changed = index.append(latent)
+    assert 499 in changed and len(changed) < 50
+    unchanged = np.setdiff1d(np.arange(499), changed)
+    np.testing.assert_array_equal(index.neighbors[unchanged], before[unchanged])
+    assert np.all(np.any(index.neighbors[changed[changed < 499]] == 499, axis=1))